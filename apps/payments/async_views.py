@@ -0,0 +1,248 @@
+from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.utils.dateparse import parse_datetime
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from .models import Payment, PaymentStatus, TERMINAL_STATUSES
+from .serializers import PaymentSerializer
+from .paystack import AsyncPaystack
+from .cache import payment_cache
+from .partitions import find_archived
+from .refs import new_ref
+from .verification import verifier
+from .conditional import (
+    conditional_response,
+    payment_etag,
+    requested_fields,
+    select_fields,
+)
+from .events import broker
+import asyncio
+import json
+
+
+def json_response(data, status=200):
+    # DRF's encoder renders Decimals, datetimes and lazy strings the same way
+    # the synchronous viewset does.
+    return JsonResponse(data, status=status, encoder=JSONEncoder)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncPaymentListView(View):
+    """
+    Native async counterpart of `PaymentViewset.create` for ASGI workers, so
+    gateway calls wait on the event loop instead of tying up a thread.
+    """
+
+    http_method_names = ["post"]
+
+    async def post(self, request, version, *args, **kwargs):
+        if version != "v1":
+            return json_response({"error": _("Unknown version")})
+
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            return json_response({"error": _("Invalid JSON body")}, status=400)
+
+        serializer = PaymentSerializer(data=payload)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+
+        ref = new_ref()
+        payment_instance = await Payment.objects.acreate(
+            **serializer.validated_data, ref=ref, status=PaymentStatus.RESERVED
+        )
+
+        try:
+            is_initialized, data = await AsyncPaystack.client().initialize_payment(
+                ref,
+                payment_instance.email,
+                payment_instance.amount_minor,
+                currency=payment_instance.currency,
+            )
+        except Exception:
+            await self._mark_init_failed(payment_instance)
+            raise
+
+        if not is_initialized:
+            await self._mark_init_failed(payment_instance)
+            return json_response(
+                {
+                    "error": _(
+                        f"Failed to initialize payment with Paystack, {data}"
+                    ),
+                },
+                status=500,
+            )
+
+        payment_url = data["authorization_url"]
+
+        await Payment.objects.atransition(
+            payment_instance,
+            PaymentStatus.RESERVED,
+            PaymentStatus.PENDING,
+            authorization_url=payment_url,
+            checked_at=timezone.now(),
+        )
+        payment_instance.status = PaymentStatus.PENDING
+        payment_instance.authorization_url = payment_url
+        # The transition bumped updated_at past the inserted value.
+        await payment_instance.arefresh_from_partition(fields=["updated_at"])
+
+        return json_response(
+            {
+                "payment_url": payment_url,
+                "message": "Payment created successfully",
+                "details": PaymentSerializer(payment_instance).data,
+            },
+            status=201,
+        )
+
+    async def _mark_init_failed(self, payment_instance):
+        await Payment.objects.atransition(
+            payment_instance, PaymentStatus.RESERVED, PaymentStatus.INIT_FAILED
+        )
+        payment_instance.status = PaymentStatus.INIT_FAILED
+        await payment_cache.ainvalidate(payment_instance.pk)
+
+
+class AsyncPaymentDetailView(View):
+    """Native async counterpart of `PaymentViewset.retrieve`."""
+
+    http_method_names = ["get"]
+
+    async def get(self, request, version, pk, *args, **kwargs):
+        if version != "v1":
+            return json_response({"error": _("Unknown version")})
+
+        try:
+            names = requested_fields(request.GET)
+        except ValidationError as e:
+            return json_response(e.detail, status=400)
+
+        data = await payment_cache.aget(pk)
+        if data is not None:
+            return self.respond(request, data, names)
+
+        archived = False
+        try:
+            instance = await aget_object_or_404(await Payment.objects.awith_id(pk))
+        except Http404:
+            instance = await sync_to_async(find_archived)(pk)
+            if instance is None:
+                raise
+            archived = True
+
+        if (
+            not archived
+            and instance.status == PaymentStatus.PENDING
+            and instance.is_stale()
+        ):
+            if await verifier.averify(instance.ref):
+                await instance.arefresh_from_partition()
+
+        data = PaymentSerializer(instance).data
+        if instance.status in TERMINAL_STATUSES:
+            await payment_cache.aset(instance.pk, data)
+
+        return self.respond(request, data, names, instance.updated_at)
+
+    def respond(self, request, data, names, updated_at=None):
+        def build():
+            return json_response(
+                {
+                    "details": select_fields(data, names),
+                    "message": "Payment details retrieved successfully",
+                }
+            )
+
+        if updated_at is None and data.get("updated_at"):
+            updated_at = parse_datetime(data["updated_at"])
+        if updated_at is None:
+            return build()
+        return conditional_response(
+            request,
+            payment_etag(data["id"], updated_at, names),
+            build,
+            last_modified=updated_at,
+        )
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+class AsyncPaymentStatusStreamView(View):
+    """
+    Server-sent events stream that pushes one `payment` event, with the same
+    details as retrieve, when the payment's status changes, then closes.
+
+    Pass the last status the client saw as `?status=`; if the payment has
+    moved on already, or has settled and no status was given, the event is
+    sent straight away. Streams with no change close after
+    PAYMENTS_STREAM_TIMEOUT seconds and EventSource clients reconnect.
+    Served on ASGI workers, where a waiting stream costs no thread.
+    """
+
+    http_method_names = ["get"]
+
+    async def get(self, request, version, pk, *args, **kwargs):
+        if version != "v1":
+            return json_response({"error": _("Unknown version")})
+
+        # Subscribe before reading, so a change in between still wakes us.
+        subscription = broker.subscribe(pk)
+        try:
+            instance = await (await Payment.objects.awith_id(pk)).afirst()
+            if instance is None:
+                instance = await sync_to_async(find_archived)(pk)
+                if instance is None:
+                    raise Http404
+        except BaseException:
+            broker.unsubscribe(subscription)
+            raise
+
+        known = request.GET.get("status")
+        if known is None and instance.status not in TERMINAL_STATUSES:
+            known = instance.status
+
+        response = StreamingHttpResponse(
+            self.stream(subscription, instance, known),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the events.
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, subscription, instance, known):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.PAYMENTS_STREAM_TIMEOUT
+        try:
+            while instance.status == known:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                timeout = min(remaining, settings.PAYMENTS_STREAM_HEARTBEAT)
+                if not await subscription.wait(timeout):
+                    yield ": keepalive\n\n"
+                    continue
+
+                instance = await Payment.objects.filter(
+                    pk=instance.pk, created_at=instance.created_at
+                ).afirst()
+                if instance is None:
+                    # Archived while we waited; it had settled long before.
+                    return
+
+            yield sse_event("payment", PaymentSerializer(instance).data)
+        finally:
+            broker.unsubscribe(subscription)
@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from .metrics import CACHE_LOOKUPS
+import threading
+
+# Counter attribute -> `result` label on payments_cache_lookups_total.
+LOOKUP_RESULTS = {"local_hits": "local", "shared_hits": "shared", "misses": "miss"}
+
+
+class LRUCache:
+    """A small thread-safe least-recently-used mapping."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PaymentCache:
+    """
+    Read-through cache for the serialized representation of settled
+    payments, which never change once they reach a terminal status. Lookups
+    try an in-process LRU first, then the shared Django cache backend named
+    by PAYMENTS_CACHE_ALIAS.
+    """
+
+    KEY_PREFIX = "payments:payment:v1:"
+
+    def __init__(self):
+        self.local = LRUCache(settings.PAYMENTS_CACHE_LOCAL_SIZE)
+        self.local_hits = self.shared_hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[settings.PAYMENTS_CACHE_ALIAS]
+
+    def key(self, pk):
+        return f"{self.KEY_PREFIX}{pk}"
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        CACHE_LOOKUPS.inc(result=LOOKUP_RESULTS[counter])
+
+    def get(self, pk):
+        key = self.key(pk)
+        data = self.local.get(key)
+        if data is not None:
+            self._count("local_hits")
+            return data
+
+        data = self.shared.get(key)
+        if data is not None:
+            self._count("shared_hits")
+            self.local.set(key, data)
+            return data
+
+        self._count("misses")
+        return None
+
+    async def aget(self, pk):
+        key = self.key(pk)
+        data = self.local.get(key)
+        if data is not None:
+            self._count("local_hits")
+            return data
+
+        data = await self.shared.aget(key)
+        if data is not None:
+            self._count("shared_hits")
+            self.local.set(key, data)
+            return data
+
+        self._count("misses")
+        return None
+
+    def get_many(self, pks):
+        """`get` for several payments at once: `{pk: data}` of those cached."""
+        found, keys = {}, {}
+        for pk in pks:
+            key = self.key(pk)
+            data = self.local.get(key)
+            if data is not None:
+                self._count("local_hits")
+                found[pk] = data
+            else:
+                keys[key] = pk
+
+        shared = self.shared.get_many(list(keys)) if keys else {}
+        for key, pk in keys.items():
+            data = shared.get(key)
+            if data is not None:
+                self._count("shared_hits")
+                self.local.set(key, data)
+                found[pk] = data
+            else:
+                self._count("misses")
+        return found
+
+    def set_many(self, items):
+        """`set` for several `(pk, data)` pairs at once."""
+        items = {self.key(pk): dict(data) for pk, data in items}
+        for key, data in items.items():
+            self.local.set(key, data)
+        if items:
+            self.shared.set_many(items, settings.PAYMENTS_CACHE_TIMEOUT)
+
+    def set(self, pk, data):
+        key, data = self.key(pk), dict(data)
+        self.local.set(key, data)
+        self.shared.set(key, data, settings.PAYMENTS_CACHE_TIMEOUT)
+
+    async def aset(self, pk, data):
+        key, data = self.key(pk), dict(data)
+        self.local.set(key, data)
+        await self.shared.aset(key, data, settings.PAYMENTS_CACHE_TIMEOUT)
+
+    def invalidate(self, *pks):
+        keys = [self.key(pk) for pk in pks]
+        for key in keys:
+            self.local.delete(key)
+        if keys:
+            self.shared.delete_many(keys)
+
+    async def ainvalidate(self, *pks):
+        keys = [self.key(pk) for pk in pks]
+        for key in keys:
+            self.local.delete(key)
+        if keys:
+            await self.shared.adelete_many(keys)
+
+    def clear(self):
+        self.local.clear()
+        with self._lock:
+            self.local_hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "local_size": len(self.local),
+            }
+
+
+payment_cache = PaymentCache()
@@ -0,0 +1,135 @@
+"""
+In-process fan-out of payment status changes to the ASGI status streams.
+
+A trigger added in migration 0015 sends `NOTIFY payment_status, '<id>'`
+whenever a payment's status changes, at commit. One listener thread per
+process holds a dedicated LISTEN connection to the primary and wakes the
+subscriptions for that payment on their event loops; the stream then
+re-reads the payment, so a notification only ever means "look again".
+"""
+
+from collections import defaultdict
+from django.db import connections
+from core.routers import PRIMARY
+import asyncio
+import logging
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "payment_status"
+
+
+class Subscription:
+    def __init__(self, pk):
+        self.pk = pk
+        self.loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def notify(self):
+        """Wake the subscriber; safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # The subscriber's event loop has already closed.
+            pass
+
+    async def wait(self, timeout):
+        """Whether a notification arrived within `timeout` seconds."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+
+class StatusBroker:
+    # How often the listener checks whether it has been stopped.
+    POLL_INTERVAL = 1
+    RECONNECT_DELAY = 1
+
+    def __init__(self, alias=PRIMARY):
+        self.alias = alias
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = self._stopping = None
+
+    def subscribe(self, pk):
+        """Subscribe the running event loop to status changes of payment `pk`."""
+        subscription = Subscription(pk)
+        with self._lock:
+            self._subscribers[pk].add(subscription)
+            if self._thread is None:
+                self._stopping = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._listen,
+                    args=(self._stopping,),
+                    name="payment-status-listener",
+                    daemon=True,
+                )
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.pk)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.pk]
+
+    def publish(self, pk):
+        with self._lock:
+            subscribers = list(self._subscribers.get(pk, ()))
+        for subscription in subscribers:
+            subscription.notify()
+
+    def _wake_all(self):
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+        for subscription in subscribers:
+            subscription.notify()
+
+    def _connect(self):
+        wrapper = connections[self.alias]
+        connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return connection
+
+    def _listen(self, stopping):
+        while not stopping.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                # Changes committed before LISTEN took effect were never
+                # announced, so every subscriber re-reads once.
+                self._wake_all()
+                while not stopping.is_set():
+                    if not select.select([connection], [], [], self.POLL_INTERVAL)[0]:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        payload = connection.notifies.pop(0).payload
+                        self.publish(int(payload))
+            except Exception:
+                logger.warning("Payment status listener failed", exc_info=True)
+                stopping.wait(self.RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def stop(self):
+        """Stop the listener thread and close its connection."""
+        with self._lock:
+            thread, stopping = self._thread, self._stopping
+            self._thread = self._stopping = None
+        if thread is not None:
+            stopping.set()
+            thread.join()
+
+
+broker = StatusBroker()
@@ -0,0 +1,90 @@
+from datetime import datetime
+from decimal import Decimal
+from .money import format_minor_units
+import csv
+import json
+
+EXPORT_FIELDS = [
+    "id",
+    "name",
+    "email",
+    "amount",
+    "currency",
+    "status",
+    "paid_at",
+    "created_at",
+]
+# Model fields read for export fields of another name.
+SOURCES = {"amount": "amount_minor"}
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+# Rows joined into each chunk handed to the response or file.
+ROWS_PER_CHUNK = 1000
+
+
+class Echo:
+    """File-like object whose `write` hands back the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def format_value(value):
+    # Matches how PaymentSerializer renders amounts and timestamps.
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+    return value
+
+
+def export_rows(queryset, export_format, chunk_size=2000):
+    """
+    Yield `queryset` as CSV or NDJSON text chunks. Rows are read through a
+    server-side cursor, so memory stays flat however many rows are exported.
+    """
+    rows = (
+        queryset.order_by("pk")
+        .values_list(*[SOURCES.get(field, field) for field in EXPORT_FIELDS])
+        .iterator(chunk_size=chunk_size)
+    )
+    converters = [
+        format_minor_units if field == "amount" else format_value
+        for field in EXPORT_FIELDS
+    ]
+
+    if export_format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+
+        def render(row):
+            return writer.writerow(
+                [convert(value) for convert, value in zip(converters, row)]
+            )
+
+    else:
+
+        def render(row):
+            return (
+                json.dumps(
+                    {
+                        field: convert(value)
+                        for field, convert, value in zip(EXPORT_FIELDS, converters, row)
+                    }
+                )
+                + "\n"
+            )
+
+    lines = []
+    for row in rows:
+        lines.append(render(row))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
@@ -0,0 +1,162 @@
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.response import Response
+from .models import IdempotencyKey
+import hashlib
+import json
+import time
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Response headers stored with the response and sent again on replay.
+REPLAYED_HEADERS = ["Location"]
+
+
+def hash_request(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    digest = hashlib.sha256(f"{request.method}:{request.path}:".encode())
+    digest.update(payload.encode())
+    return digest.hexdigest()
+
+
+def client_ip(request):
+    """
+    The caller's address. Behind TRUSTED_PROXIES proxies, that's the entry
+    the outermost one appended to X-Forwarded-For; entries before it come
+    from the client and can't be trusted.
+    """
+    proxies = settings.TRUSTED_PROXIES
+    if proxies:
+        forwarded = [
+            address.strip()
+            for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def key_scope(request):
+    """The caller a key belongs to, so callers can't replay each other's."""
+    if request.user and request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"ip:{client_ip(request)}"
+
+
+def claim_key(scope, key, request_hash):
+    """
+    Insert an in-flight record for `key` in `scope`, or return the existing
+    one once it has completed. Returns `(record, claimed)`; `record` is None if another
+    request still holds the key after IDEMPOTENCY_WAIT seconds.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope,
+                    key=key,
+                    request_hash=request_hash,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return record, True
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if record is None:
+            continue
+
+        lock_expired = (
+            not record.is_completed()
+            and now - record.created_at
+            >= timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        )
+        if record.expires_at <= now or lock_expired:
+            # The key outlived its TTL or its request died mid-flight.
+            IdempotencyKey.objects.filter(
+                pk=record.pk, created_at=record.created_at
+            ).delete()
+            continue
+
+        if record.is_completed() or record.request_hash != request_hash:
+            return record, False
+
+        if time.monotonic() >= deadline:
+            return None, False
+        time.sleep(0.1)
+
+
+def idempotent(view_method):
+    """
+    Make a view method safe to retry with an `Idempotency-Key` header. The
+    first request's response is stored and replayed for later requests from
+    the same caller with the same key and body, without running the view
+    again.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(key) > 255:
+            return Response(
+                {"error": _("Idempotency-Key must be at most 255 characters")},
+                status=400,
+            )
+
+        request_hash = hash_request(request)
+        record, claimed = claim_key(key_scope(request), key, request_hash)
+
+        if record is None:
+            return Response(
+                {"error": _("A request with this Idempotency-Key is in progress")},
+                status=409,
+            )
+
+        if not claimed:
+            if record.request_hash != request_hash:
+                return Response(
+                    {
+                        "error": _(
+                            "Idempotency-Key was already used for a different request"
+                        )
+                    },
+                    status=422,
+                )
+            return Response(
+                record.response_body,
+                status=record.response_status,
+                headers={**record.response_headers, "Idempotent-Replayed": "true"},
+            )
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        # Server errors aren't final; release the key so the client can retry.
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                response_status=response.status_code,
+                response_body=response.data,
+                response_headers={
+                    name: response[name]
+                    for name in REPLAYED_HEADERS
+                    if response.has_header(name)
+                },
+            )
+        return response
+
+    return wrapper
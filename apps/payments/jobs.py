@@ -0,0 +1,87 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import JobStatus, Payment, PaymentJob, PaymentStatus
+from .paystack import Paystack
+from .cache import payment_cache
+import random
+
+
+def enqueue_initialization(payment):
+    """Queue the Paystack initialization of a freshly reserved payment."""
+    return PaymentJob.objects.create(payment=payment)
+
+
+def claim_jobs(limit):
+    """
+    Lease up to `limit` due jobs to the calling worker. Rows locked by other
+    workers are skipped, and claimed jobs are pushed PAYMENTS_JOB_LEASE
+    seconds into the future so they come back if this worker dies.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            PaymentJob.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("payment")
+            .filter(status=JobStatus.QUEUED, run_after__lte=now)
+            .order_by("run_after")[:limit]
+        )
+        if jobs:
+            PaymentJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                attempts=F("attempts") + 1,
+                run_after=now + timedelta(seconds=settings.PAYMENTS_JOB_LEASE),
+            )
+
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def initialize(payment):
+    """Initialize a reserved payment with Paystack. Safe to call from threads."""
+    return Paystack.client().initialize_payment(
+        payment.ref, payment.email, payment.amount_minor, currency=payment.currency
+    )
+
+
+def complete_job(job, result):
+    """
+    Record the outcome of `initialize` for a job: fill in the authorization
+    URL, or schedule a retry with exponential backoff, or dead-letter the job
+    and fail the payment once PAYMENTS_JOB_MAX_ATTEMPTS is reached. Returns
+    "initialized", "retrying" or "dead".
+    """
+    is_initialized, data = result
+    now = timezone.now()
+
+    if is_initialized:
+        with transaction.atomic():
+            Payment.objects.transition(
+                job.payment,
+                PaymentStatus.RESERVED,
+                PaymentStatus.PENDING,
+                authorization_url=data["authorization_url"],
+                checked_at=now,
+            )
+            job.delete()
+        return "initialized"
+
+    if job.attempts >= settings.PAYMENTS_JOB_MAX_ATTEMPTS:
+        with transaction.atomic():
+            PaymentJob.objects.filter(pk=job.pk).update(
+                status=JobStatus.DEAD, last_error=str(data)
+            )
+            Payment.objects.transition(
+                job.payment, PaymentStatus.RESERVED, PaymentStatus.INIT_FAILED
+            )
+        payment_cache.invalidate(job.payment_id)
+        return "dead"
+
+    backoff = settings.PAYMENTS_JOB_BACKOFF * 2 ** (job.attempts - 1)
+    PaymentJob.objects.filter(pk=job.pk).update(
+        run_after=now + timedelta(seconds=backoff + random.uniform(0, backoff)),
+        last_error=str(data),
+    )
+    return "retrying"
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.payments.partitions import (
+    add_months,
+    archive_partition,
+    month_start,
+    partitions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move payments partitions older than the retention period to gzipped "
+        "NDJSON files. Archived payments stay in the rollups, which "
+        "rebuild_payment_rollups leaves alone for the archived days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-months",
+            type=int,
+            default=settings.PAYMENTS_RETENTION_MONTHS,
+            help="Keep partitions ending within this many months of the current one.",
+        )
+        parser.add_argument(
+            "--output-dir",
+            default=settings.PAYMENTS_ARCHIVE_DIR,
+            help="Directory to write the archive files to.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = add_months(month_start(timezone.now()), -options["keep_months"])
+        archived = 0
+        for partition in partitions():
+            if partition.end > cutoff:
+                continue
+            archive = archive_partition(partition, options["output_dir"])
+            archived += 1
+            self.stdout.write(f"Archived {archive.rows} payments to {archive.path}")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} partitions"))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.payments.partitions import create_partitions
+
+
+class Command(BaseCommand):
+    help = "Create the monthly payments partitions for the coming months."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=settings.PAYMENTS_PARTITIONS_AHEAD,
+            help="Months after the current one to have partitions for.",
+        )
+
+    def handle(self, *args, **options):
+        created = create_partitions(options["months"])
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} partitions"))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from apps.payments.exports import EXPORT_FORMATS, export_rows
+from apps.payments.models import Payment, PaymentStatus
+from core.routers import read_database, replica_reads
+import time
+
+
+class Command(BaseCommand):
+    help = "Stream payments to a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+        parser.add_argument(
+            "--output", help="File to write to. Defaults to standard output."
+        )
+        parser.add_argument("--status", choices=PaymentStatus.values)
+        parser.add_argument("--created-after", help="ISO 8601 datetime, inclusive.")
+        parser.add_argument("--created-before", help="ISO 8601 datetime, exclusive.")
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000, help="Rows fetched per round trip."
+        )
+        parser.add_argument(
+            "--database",
+            help="Database alias to read from. Defaults to a healthy read replica.",
+        )
+
+    def handle(self, *args, **options):
+        database = options["database"]
+        if database is None:
+            with replica_reads():
+                database = read_database()
+        queryset = Payment.objects.using(database)
+        if options["status"]:
+            queryset = queryset.filter(status=options["status"])
+        if options["created_after"]:
+            queryset = queryset.filter(
+                created_at__gte=self.parse_datetime(options["created_after"])
+            )
+        if options["created_before"]:
+            queryset = queryset.filter(
+                created_at__lt=self.parse_datetime(options["created_before"])
+            )
+
+        chunks = export_rows(queryset, options["format"], options["chunk_size"])
+        started = time.monotonic()
+
+        if options["output"]:
+            with open(options["output"], "w", newline="") as output:
+                output.writelines(chunks)
+            self.stderr.write(
+                f"Exported to {options['output']} in {time.monotonic() - started:.1f}s"
+            )
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+
+    def parse_datetime(self, value):
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError(f"Expected an ISO 8601 datetime, got {value!r}")
+        return parsed
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from apps.payments.models import PaymentRollup
+import time
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily payment rollups from the payments table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help=(
+                "ISO 8601 date. Only rebuild this day and later; defaults to "
+                "every day that hasn't been archived."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = parse_date(options["since"])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError(
+                    f"Expected an ISO 8601 date, got {options['since']!r}"
+                )
+
+        started = time.monotonic()
+        rows = PaymentRollup.objects.rebuild(since)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {rows} rollup rows in {time.monotonic() - started:.1f}s"
+            )
+        )
@@ -0,0 +1,177 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from apps.payments.models import (
+    GATEWAY_STATUSES,
+    Payment,
+    PaymentRollup,
+    PaymentStatus,
+    ReconciliationRun,
+)
+from apps.payments.paystack import Paystack
+from apps.payments.cache import payment_cache
+import threading
+import time
+
+
+class RateLimiter:
+    """Spaces calls out so no more than `rate` start per second across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Command(BaseCommand):
+    help = "Verify pending payments with Paystack and record their final status."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Concurrent verify calls."
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=20,
+            help="Maximum verify calls per second (0 for no limit).",
+        )
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=settings.PAYSTACK_VERIFY_STALE_AFTER,
+            help="Skip payments checked with Paystack within this many seconds.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last run that didn't finish instead of starting over.",
+        )
+
+    def handle(self, *args, **options):
+        run = None
+        if options["resume"]:
+            run = ReconciliationRun.objects.filter(finished_at__isnull=True).last()
+        if run is None:
+            run = ReconciliationRun.objects.create()
+        else:
+            self.stdout.write(f"Resuming run {run.pk} after payment {run.last_payment_id}")
+
+        # Payments checked after the run started have already been handled,
+        # which keeps a resumed run from verifying them again.
+        cutoff = min(
+            run.started_at, timezone.now() - timedelta(seconds=options["older_than"])
+        )
+        limiter = RateLimiter(options["rate"])
+        paystack = Paystack.client()
+
+        def verify(payment):
+            limiter.wait()
+            return payment, paystack.verify_payment(payment.ref)
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            batch_number = 0
+            while True:
+                batch = list(
+                    Payment.objects.filter(
+                        Q(checked_at__isnull=True) | Q(checked_at__lt=cutoff),
+                        status=PaymentStatus.PENDING,
+                        pk__gt=run.last_payment_id,
+                    )
+                    .only(
+                        "pk",
+                        "ref",
+                        "amount_minor",
+                        "currency",
+                        "status",
+                        "paid_at",
+                        "checked_at",
+                        "created_at",
+                    )
+                    .order_by("pk")[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+
+                batch_number += 1
+                started = time.monotonic()
+                results = list(pool.map(verify, batch))
+                settled, errors = self.apply_results(results)
+                elapsed = time.monotonic() - started
+
+                run.last_payment_id = batch[-1].pk
+                run.verified += len(batch)
+                run.settled += settled
+                run.errors += errors
+                run.save(
+                    update_fields=["last_payment_id", "verified", "settled", "errors"]
+                )
+
+                self.stdout.write(
+                    f"Batch {batch_number}: {len(batch)} verified, {settled} settled, "
+                    f"{errors} errors, {len(batch) / elapsed:.1f} payments/s"
+                )
+
+        run.finished_at = timezone.now()
+        run.save(update_fields=["finished_at"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reconciled {run.verified} payments: {run.settled} settled, "
+                f"{run.errors} errors"
+            )
+        )
+
+    def apply_results(self, results):
+        now = timezone.now()
+        checked, errors = [], 0
+
+        for payment, (is_verified, data) in results:
+            if not is_verified:
+                errors += 1
+                continue
+
+            status = GATEWAY_STATUSES.get(data.get("status"))
+            if status is not None:
+                # Like Payment.objects.record_gateway_status: only successful
+                # payments keep a paid_at.
+                payment.status = status
+                payment.paid_at = (
+                    parse_datetime(data["paid_at"])
+                    if status == PaymentStatus.SUCCESS and data.get("paid_at")
+                    else None
+                )
+            payment.checked_at = now
+            checked.append(payment)
+
+        with transaction.atomic():
+            # Leave alone anything the webhook settled while we were verifying.
+            still_pending = set(
+                Payment.objects.select_for_update()
+                .filter(pk__in=[p.pk for p in checked], status=PaymentStatus.PENDING)
+                .values_list("pk", flat=True)
+            )
+            to_update = [p for p in checked if p.pk in still_pending]
+            Payment.objects.bulk_update(
+                to_update, ["status", "paid_at", "checked_at"], batch_size=500
+            )
+            PaymentRollup.objects.record(
+                [(p, PaymentStatus.PENDING, p.status) for p in to_update]
+            )
+
+        settled = [p.pk for p in to_update if p.status != PaymentStatus.PENDING]
+        payment_cache.invalidate(*settled)
+        return len(settled), errors
@@ -0,0 +1,69 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.payments.jobs import claim_jobs, complete_job, initialize
+import signal
+import threading
+
+
+class Command(BaseCommand):
+    help = "Initialize payments queued by asynchronous creation with Paystack."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Concurrent gateway calls."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=50, help="Jobs claimed at a time."
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when no job is due.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no job is due instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if not options["once"]:
+            for signum in [signal.SIGINT, signal.SIGTERM]:
+                signal.signal(signum, lambda *_args: stop.set())
+
+        totals = Counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            while not stop.is_set():
+                close_old_connections()
+                jobs = claim_jobs(options["batch_size"])
+                if not jobs:
+                    if options["once"]:
+                        break
+                    stop.wait(options["poll_interval"])
+                    continue
+
+                # Gateway calls run in the pool; results are written back
+                # from this thread so workers never hold a DB connection.
+                outcomes = Counter(
+                    complete_job(job, result)
+                    for job, result in zip(
+                        jobs, pool.map(initialize, [job.payment for job in jobs])
+                    )
+                )
+                totals.update(outcomes)
+                self.stdout.write(
+                    f"{len(jobs)} jobs: {outcomes['initialized']} initialized, "
+                    f"{outcomes['retrying']} retrying, {outcomes['dead']} dead"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {sum(totals.values())} jobs: "
+                f"{totals['initialized']} initialized, {totals['retrying']} retrying, "
+                f"{totals['dead']} dead"
+            )
+        )
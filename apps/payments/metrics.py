@@ -0,0 +1,262 @@
+"""
+In-process request and gateway metrics, rendered in the Prometheus text
+exposition format by `metrics_view`. Each worker process keeps its own
+registry, so scrape every worker (or run one per container).
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PHASES = ("db", "gateway", "serialize")
+
+REGISTRY = []
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield from self.samples(key, value)
+
+    def samples(self, key, value):
+        yield f"{self.name}{format_labels(self.labelnames, key)} {format_number(value)}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum and count.
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._values.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self, key, value):
+        counts, total, count = value
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = format_labels(self.labelnames, key, [("le", format_number(bound))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {format_number(total)}"
+        yield f"{self.name}_count{labels} {count}"
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "payments_http_request_duration_seconds",
+    "Time spent handling a request, including middleware.",
+    ["view", "method", "status"],
+)
+PHASE_SECONDS = Histogram(
+    "payments_request_phase_duration_seconds",
+    "Time each request spent per phase; 'other' is everything not measured.",
+    ["view", "phase"],
+)
+REQUEST_QUERIES = Histogram(
+    "payments_http_request_db_queries",
+    "Database queries run per request.",
+    ["view"],
+    buckets=QUERY_BUCKETS,
+)
+GATEWAY_SECONDS = Histogram(
+    "payments_gateway_request_duration_seconds",
+    "Round trip of each Paystack call, including retries.",
+    ["operation"],
+)
+GATEWAY_RESPONSES = Counter(
+    "payments_gateway_responses_total",
+    "Paystack calls by final HTTP status, 'error' or 'circuit_open'.",
+    ["operation", "status"],
+)
+GATEWAY_IN_FLIGHT = Gauge(
+    "payments_gateway_in_flight",
+    "Paystack calls currently waiting on a response.",
+    ["operation"],
+)
+CACHE_LOOKUPS = Counter(
+    "payments_cache_lookups_total",
+    "Payment cache lookups by the tier that answered them.",
+    ["result"],
+)
+CACHE_LOCAL_SIZE = Gauge(
+    "payments_cache_local_entries",
+    "Entries held in this process's payment LRU.",
+)
+
+
+class RequestTimings:
+    __slots__ = ("phases", "queries", "lock")
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        # Pool threads started by `map_in_context` add to the same timings.
+        self.lock = threading.Lock()
+
+
+_current = ContextVar("payments_request_timings", default=None)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def add_phase_time(phase, elapsed):
+    timings = _current.get()
+    if timings is not None:
+        with timings.lock:
+            timings.phases[phase] += elapsed
+
+
+def map_in_context(pool, function, items):
+    """
+    `pool.map(function, items)` with each call run in a copy of the caller's
+    context, so time spent in the pool's threads counts toward the request.
+    """
+    context = copy_context()
+    return pool.map(lambda item: context.copy().run(function, item), items)
+
+
+@contextmanager
+def track_phase(phase):
+    """Add the time spent in the block to the current request's `phase`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(phase, time.perf_counter() - started)
+
+
+def time_queries(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection by PaymentsConfig."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        with timings.lock:
+            timings.phases["db"] += elapsed
+            timings.queries += 1
+
+
+class GatewayCall:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = "error"
+
+
+@contextmanager
+def gateway_call(operation):
+    """
+    Track one Paystack call. Set `status` on the yielded object to the HTTP
+    status code once a response arrives; calls that raise count as 'error'.
+    """
+    call = GatewayCall()
+    GATEWAY_IN_FLIGHT.inc(operation=operation)
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        elapsed = time.perf_counter() - started
+        GATEWAY_IN_FLIGHT.dec(operation=operation)
+        GATEWAY_SECONDS.observe(elapsed, operation=operation)
+        GATEWAY_RESPONSES.inc(operation=operation, status=call.status)
+        add_phase_time("gateway", elapsed)
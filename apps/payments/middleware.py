@@ -0,0 +1,56 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from . import metrics
+import time
+
+
+class MetricsMiddleware:
+    """
+    Record each request's duration, its time per phase (database, Paystack,
+    serialization, everything else) and how many queries it ran. Put it first
+    in MIDDLEWARE so the timings include the rest of the middleware stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self.record(request, response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self.record(request, response, timings, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, timings, elapsed):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+
+        metrics.REQUEST_SECONDS.observe(
+            elapsed, view=view, method=request.method, status=response.status_code
+        )
+        for phase, phase_elapsed in timings.phases.items():
+            metrics.PHASE_SECONDS.observe(phase_elapsed, view=view, phase=phase)
+        metrics.PHASE_SECONDS.observe(
+            max(0.0, elapsed - sum(timings.phases.values())), view=view, phase="other"
+        )
+        metrics.REQUEST_QUERIES.observe(timings.queries, view=view)
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_rename_payment_date_payment_paid_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='authorization_url',
+            field=models.URLField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='ref',
+            field=models.CharField(editable=False, max_length=250, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# created_at of the payments that predate this migration and were never paid.
+LEGACY_CREATED_AT = "1970-01-01T00:00:00+00:00"
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built concurrently so the payments table stays writable.
+    atomic = False
+
+    dependencies = [
+        ('payments', '0006_reconciliationrun'),
+    ]
+
+    operations = [
+        # Existing payments have no record of when they were created. They get
+        # their paid_at, or LEGACY_CREATED_AT when they were never paid, rather
+        # than the time this migration ran, so the rollups, the created_at
+        # indexes and the partitions built on this column keep them apart.
+        migrations.AddField(
+            model_name='payment',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunSQL(
+            sql=[
+                (
+                    "UPDATE payments_payment SET created_at = COALESCE(paid_at, %s)"
+                    " WHERE created_at IS NULL",
+                    [LEGACY_CREATED_AT],
+                ),
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        # Older rows may carry raw Paystack statuses; fold them into the
+        # statuses the check constraint below allows.
+        migrations.RunSQL(
+            sql="""
+                UPDATE payments_payment SET status = 'failed' WHERE status = 'reversed';
+                UPDATE payments_payment SET status = 'pending'
+                WHERE status NOT IN ('reserved', 'pending', 'init_failed', 'success', 'failed');
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('reserved', 'Reserved'), ('pending', 'Pending'), ('init_failed', 'Initialization failed'), ('success', 'Success'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='payment_pending_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['email', 'paid_at'], name='payment_email_paid_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='payment_created_brin'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.CheckConstraint(condition=models.Q(('status__in', ['reserved', 'pending', 'init_failed', 'success', 'failed'])), name='payment_status_valid'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_paymentjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('reserved', 'Reserved'), ('pending', 'Pending'), ('init_failed', 'Initialization failed'), ('success', 'Success'), ('failed', 'Failed')], max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'ordering': ['day', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='paymentrollup_day_status_uniq')],
+            },
+        ),
+        # Backfill from the existing payments; status changes keep the
+        # rollups up to date from here on.
+        migrations.RunSQL(
+            """
+            INSERT INTO payments_paymentrollup (day, status, count, amount)
+            SELECT (created_at AT TIME ZONE 'UTC')::date, status, count(*), sum(amount)
+            FROM payments_payment
+            GROUP BY 1, 2
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Turns payments_payment into a table partitioned by month of created_at.
+# The existing rows are kept in place as payments_payment_legacy, attached as
+# the partition for everything up to the end of the latest month they cover.
+# ATTACH PARTITION adopts matching indexes instead of building new ones, so
+# the unique (id, created_at) and (ref, created_at) indexes the new keys need
+# are built CONCURRENTLY first, while the table stays writable, and the old
+# indexes are renamed. The attach itself then only scans the legacy rows once
+# to check they fit the partition bound. Partitions for the next three months
+# are created up front, later ones by `create_payment_partitions`.
+#
+# `ref` is only unique per created_at from here on; see
+# PaymentQuerySet.check_refs_unused.
+BUILD_KEY_INDEXES = [
+    """
+    CREATE UNIQUE INDEX CONCURRENTLY payments_payment_legacy_pkey
+        ON payments_payment (id, created_at)
+    """,
+    """
+    CREATE UNIQUE INDEX CONCURRENTLY payments_payment_legacy_ref_created_at_key
+        ON payments_payment (ref, created_at)
+    """,
+]
+
+PARTITION_PAYMENTS = """
+DO $$
+DECLARE
+    month_start timestamptz;
+    next_id bigint;
+BEGIN
+    ALTER TABLE payments_payment RENAME TO payments_payment_legacy;
+    -- Replaced by the (id, created_at) and (ref, created_at) keys, on the
+    -- indexes built above, which the parent's keys adopt on attach.
+    ALTER TABLE payments_payment_legacy DROP CONSTRAINT payments_payment_pkey;
+    ALTER TABLE payments_payment_legacy DROP CONSTRAINT payments_payment_ref_key;
+    ALTER TABLE payments_payment_legacy ADD CONSTRAINT payments_payment_legacy_pkey
+        PRIMARY KEY USING INDEX payments_payment_legacy_pkey;
+    ALTER TABLE payments_payment_legacy
+        ADD CONSTRAINT payments_payment_legacy_ref_created_at_key
+        UNIQUE USING INDEX payments_payment_legacy_ref_created_at_key;
+    DROP INDEX payments_payment_ref_dc95e7cc_like;
+    ALTER INDEX payment_created_id_idx RENAME TO payments_payment_legacy_created_id_idx;
+    ALTER INDEX payment_pending_created_idx
+        RENAME TO payments_payment_legacy_pending_created_idx;
+    ALTER INDEX payment_email_paid_at_idx RENAME TO payments_payment_legacy_email_paid_at_idx;
+    ALTER INDEX payment_created_brin RENAME TO payments_payment_legacy_created_brin;
+    ALTER TABLE payments_payment_legacy ALTER COLUMN id DROP IDENTITY;
+
+    CREATE TABLE payments_payment (
+        LIKE payments_payment_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+    ) PARTITION BY RANGE (created_at);
+    CREATE SEQUENCE payments_payment_id_seq OWNED BY payments_payment.id;
+    SELECT COALESCE(max(id), 0) + 1 INTO next_id FROM payments_payment_legacy;
+    PERFORM setval('payments_payment_id_seq', next_id, false);
+    SELECT date_trunc('month', greatest(now(), max(created_at)) AT TIME ZONE 'UTC')
+        AT TIME ZONE 'UTC' + interval '1 month'
+        INTO month_start
+        FROM payments_payment_legacy;
+    ALTER TABLE payments_payment ALTER COLUMN id SET DEFAULT nextval('payments_payment_id_seq');
+
+    ALTER TABLE payments_payment ADD PRIMARY KEY (id, created_at);
+    ALTER TABLE payments_payment
+        ADD CONSTRAINT payment_ref_created_uniq UNIQUE (ref, created_at);
+    CREATE INDEX payment_created_id_idx ON payments_payment (created_at, id);
+    CREATE INDEX payment_pending_created_idx ON payments_payment (created_at)
+        WHERE status = 'pending';
+    CREATE INDEX payment_email_paid_at_idx ON payments_payment (email, paid_at);
+    CREATE INDEX payment_created_brin ON payments_payment USING brin (created_at);
+
+    EXECUTE format(
+        'ALTER TABLE payments_payment ATTACH PARTITION payments_payment_legacy '
+        'FOR VALUES FROM (MINVALUE) TO (%L)',
+        month_start
+    );
+    FOR i IN 0..3 LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF payments_payment FOR VALUES FROM (%L) TO (%L)',
+            'payments_payment_' || to_char(
+                (month_start + i * interval '1 month') AT TIME ZONE 'UTC', 'YYYY_MM'
+            ),
+            month_start + i * interval '1 month',
+            month_start + (i + 1) * interval '1 month'
+        );
+    END LOOP;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    # The key indexes are built concurrently, outside a transaction; the
+    # partitioning itself is one DO block, so it still applies atomically.
+    atomic = False
+
+    dependencies = [
+        ('payments', '0011_paymentrollup'),
+    ]
+
+    operations = [
+        *[migrations.RunSQL(sql, migrations.RunSQL.noop) for sql in BUILD_KEY_INDEXES],
+        migrations.CreateModel(
+            name='PaymentArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=63, unique=True)),
+                ('path', models.CharField(max_length=500)),
+                ('created_before', models.DateTimeField()),
+                ('first_id', models.BigIntegerField(null=True)),
+                ('last_id', models.BigIntegerField(null=True)),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='paymentjob',
+            name='payment',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='job', to='payments.payment'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='payment',
+                    name='ref',
+                    field=models.CharField(editable=False, max_length=250, null=True),
+                ),
+                migrations.AddConstraint(
+                    model_name='payment',
+                    constraint=models.UniqueConstraint(fields=('ref', 'created_at'), name='payment_ref_created_uniq'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(PARTITION_PAYMENTS),
+            ],
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:02
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0012_partition_payments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='amount_minor',
+            field=models.BigIntegerField(null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='currency',
+            field=models.CharField(choices=[('NGN', 'Nigerian naira'), ('GHS', 'Ghanaian cedi'), ('KES', 'Kenyan shilling'), ('ZAR', 'South African rand'), ('USD', 'US dollar')], default='NGN', max_length=3),
+        ),
+        # Existing amounts are naira with two decimal places, so this is exact.
+        migrations.RunSQL(
+            "UPDATE payments_payment SET amount_minor = amount * 100",
+            "UPDATE payments_payment SET amount = amount_minor / 100.0",
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='amount_minor',
+            field=models.BigIntegerField(validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.RemoveField(
+            model_name='payment',
+            name='amount',
+        ),
+        # Rollups are keyed by currency now; rebuilt from the payments below.
+        migrations.RemoveConstraint(
+            model_name='paymentrollup',
+            name='paymentrollup_day_status_uniq',
+        ),
+        migrations.RemoveField(
+            model_name='paymentrollup',
+            name='amount',
+        ),
+        migrations.AddField(
+            model_name='paymentrollup',
+            name='amount_minor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentrollup',
+            name='currency',
+            field=models.CharField(choices=[('NGN', 'Nigerian naira'), ('GHS', 'Ghanaian cedi'), ('KES', 'Kenyan shilling'), ('ZAR', 'South African rand'), ('USD', 'US dollar')], default='NGN', max_length=3),
+            preserve_default=False,
+        ),
+        migrations.AlterModelOptions(
+            name='paymentrollup',
+            options={'ordering': ['day', 'status', 'currency']},
+        ),
+        migrations.AddConstraint(
+            model_name='paymentrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'status', 'currency'), name='paymentrollup_day_status_currency_uniq'),
+        ),
+        migrations.RunSQL(
+            """
+            DELETE FROM payments_paymentrollup;
+            INSERT INTO payments_paymentrollup (day, status, currency, count, amount_minor)
+            SELECT (created_at AT TIME ZONE 'UTC')::date, status, currency, count(*),
+                sum(amount_minor)
+            FROM payments_payment
+            GROUP BY 1, 2, 3
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
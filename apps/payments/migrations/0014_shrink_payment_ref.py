@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_amount_minor_units'),
+    ]
+
+    operations = [
+        # Every ref issued so far is a 67-character token_urlsafe(50) and is
+        # kept as-is, since Paystack knows the payment by it. Fail with a
+        # clear message rather than mid-ALTER if anything longer slipped in.
+        migrations.RunSQL(
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM payments_payment WHERE length(ref) > 67
+                ) THEN
+                    RAISE EXCEPTION 'payments_payment has refs longer than 67 characters';
+                END IF;
+            END
+            $$;
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='ref',
+            field=models.CharField(editable=False, max_length=67, null=True),
+        ),
+    ]
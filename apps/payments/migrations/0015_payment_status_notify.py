@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0014_shrink_payment_ref'),
+    ]
+
+    # Feeds apps.payments.events. A row trigger on the partitioned table is
+    # cloned onto every partition, including ones created later.
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION payments_payment_notify_status() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('payment_status', NEW.id::text);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER payments_payment_status_notify
+                AFTER UPDATE OF status ON payments_payment
+                FOR EACH ROW
+                WHEN (OLD.status IS DISTINCT FROM NEW.status)
+                EXECUTE FUNCTION payments_payment_notify_status();
+            """,
+            """
+            DROP TRIGGER payments_payment_status_notify ON payments_payment;
+            DROP FUNCTION payments_payment_notify_status();
+            """,
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:47
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0015_payment_status_notify'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='updated_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now()),
+        ),
+        # Only columns in the API representation bump updated_at, so the
+        # checked_at writes of routine verification leave ETags alone.
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION payments_payment_touch() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at := statement_timestamp();
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER payments_payment_touch
+                BEFORE UPDATE OF
+                    name, email, amount_minor, currency, status,
+                    authorization_url, paid_at
+                ON payments_payment
+                FOR EACH ROW
+                EXECUTE FUNCTION payments_payment_touch();
+            """,
+            """
+            DROP TRIGGER payments_payment_touch ON payments_payment;
+            DROP FUNCTION payments_payment_touch();
+            """,
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-17 05:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0016_payment_updated_at'),
+    ]
+
+    # UPDATE OF fires whenever a column is in the SET list, and bulk_update
+    # sets every listed column on every row, changed or not; only bump
+    # updated_at when a represented value actually changes.
+    operations = [
+        migrations.RunSQL(
+            """
+            DROP TRIGGER payments_payment_touch ON payments_payment;
+
+            CREATE TRIGGER payments_payment_touch
+                BEFORE UPDATE OF
+                    name, email, amount_minor, currency, status,
+                    authorization_url, paid_at
+                ON payments_payment
+                FOR EACH ROW
+                WHEN (
+                    OLD.name IS DISTINCT FROM NEW.name
+                    OR OLD.email IS DISTINCT FROM NEW.email
+                    OR OLD.amount_minor IS DISTINCT FROM NEW.amount_minor
+                    OR OLD.currency IS DISTINCT FROM NEW.currency
+                    OR OLD.status IS DISTINCT FROM NEW.status
+                    OR OLD.authorization_url IS DISTINCT FROM NEW.authorization_url
+                    OR OLD.paid_at IS DISTINCT FROM NEW.paid_at
+                )
+                EXECUTE FUNCTION payments_payment_touch();
+            """,
+            """
+            DROP TRIGGER payments_payment_touch ON payments_payment;
+
+            CREATE TRIGGER payments_payment_touch
+                BEFORE UPDATE OF
+                    name, email, amount_minor, currency, status,
+                    authorization_url, paid_at
+                ON payments_payment
+                FOR EACH ROW
+                EXECUTE FUNCTION payments_payment_touch();
+            """,
+        ),
+    ]
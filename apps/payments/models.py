@@ -1,22 +1,555 @@
 from django.utils.translation import gettext_lazy as _
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Now
+from django.contrib.postgres.indexes import BrinIndex
 from django.utils import timezone
+from django.conf import settings
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from collections import defaultdict
+from asgiref.sync import sync_to_async
 from .paystack import Paystack
+from .cache import payment_cache
+from .money import Currency, from_minor_units, to_minor_units
+from .refs import LEGACY_REF_LENGTH, ref_time
+import functools
+import operator
 import secrets
 from django.core.validators import MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class PaymentStatus(models.TextChoices):
+    RESERVED = "reserved", _("Reserved")
+    PENDING = "pending", _("Pending")
+    INIT_FAILED = "init_failed", _("Initialization failed")
+    SUCCESS = "success", _("Success")
+    FAILED = "failed", _("Failed")
+
+
+# Paystack transaction statuses that settle a payment. Anything else
+# ("ongoing", "abandoned", ...) leaves it pending.
+GATEWAY_STATUSES = {
+    "success": PaymentStatus.SUCCESS,
+    "failed": PaymentStatus.FAILED,
+    "reversed": PaymentStatus.FAILED,
+}
+
+# Statuses a payment never leaves, so its representation can be cached.
+TERMINAL_STATUSES = [
+    PaymentStatus.INIT_FAILED,
+    PaymentStatus.SUCCESS,
+    PaymentStatus.FAILED,
+]
+
+
+# How far created_at may be from the time embedded in a payment's ref.
+REF_TIME_MARGIN = timedelta(days=1)
+
+
+def due_for_check(checked_at):
+    """Whether a pending payment last checked at `checked_at` is stale."""
+    if checked_at is None:
+        return True
+    max_age = timedelta(seconds=settings.PAYSTACK_VERIFY_STALE_AFTER)
+    return timezone.now() - checked_at >= max_age
+
+
+class PaymentQuerySet(models.QuerySet):
+    """Counts created payments in the rollups along with the INSERT."""
+
+    def with_ref(self, ref):
+        """
+        Filter on `ref`. Refs from apps.payments.refs carry their creation
+        time, which bounds created_at so Postgres only searches the
+        partitions around it; legacy refs search all of them.
+        """
+        issued = ref_time(ref)
+        if issued is None:
+            return self.filter(ref=ref)
+        issued = datetime.fromtimestamp(issued, dt_timezone.utc)
+        return self.filter(
+            ref=ref,
+            created_at__gte=issued - REF_TIME_MARGIN,
+            created_at__lt=issued + REF_TIME_MARGIN,
+        )
+
+    def with_id(self, pk, ranges=None):
+        """
+        Filter on `pk`, with created_at bounded to the partitions whose id
+        ranges could include it (apps.payments.partitions.id_ranges, or
+        `ranges` when given), so Postgres only searches those.
+        """
+        # partitions imports this module.
+        from . import partitions
+
+        if ranges is None:
+            ranges = partitions.id_ranges()
+        created_after, created_before = partitions.id_bounds(pk, ranges)
+        queryset = self.filter(pk=pk)
+        if created_after is not None:
+            queryset = queryset.filter(created_at__gte=created_after)
+        if created_before is not None:
+            queryset = queryset.filter(created_at__lt=created_before)
+        return queryset
+
+    async def awith_id(self, pk):
+        """`with_id` for async code, where loading the id ranges may query."""
+        from . import partitions
+
+        return self.with_id(pk, await partitions.aid_ranges())
+
+    def check_refs_unused(self, refs):
+        """
+        Raise IntegrityError if any of `refs` is repeated or already taken.
+        The partitioned table can only enforce (ref, created_at), so this
+        keeps refs unique; ULID refs only search the partitions around their
+        time.
+        """
+        refs = [ref for ref in refs if ref]
+        if not refs:
+            return
+        taken = functools.reduce(
+            operator.or_, [self.model.objects.with_ref(ref) for ref in refs]
+        )
+        if len(set(refs)) < len(refs) or taken.exists():
+            raise IntegrityError("Payment ref is already in use")
+
+    def create(self, **kwargs):
+        with transaction.atomic():
+            self.check_refs_unused([kwargs.get("ref")])
+            payment = super().create(**kwargs)
+            PaymentRollup.objects.record([(payment, None, payment.status)])
+        return payment
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic():
+            self.check_refs_unused([obj.ref for obj in objs])
+            objs = super().bulk_create(objs, *args, **kwargs)
+            PaymentRollup.objects.record([(obj, None, obj.status) for obj in objs])
+        return objs
+
+
+class PaymentManager(models.Manager.from_queryset(PaymentQuerySet)):
+
+    def transition(self, payment, from_status, to_status, **values):
+        """
+        Move `payment` from `from_status` to `to_status` with a conditional
+        UPDATE, setting `values` too, and adjust the rollups if it moved.
+        Returns whether the payment was still in `from_status`.
+        """
+        with transaction.atomic():
+            updated = self.filter(
+                pk=payment.pk, created_at=payment.created_at, status=from_status
+            ).update(status=to_status, **values)
+            if updated:
+                PaymentRollup.objects.record([(payment, from_status, to_status)])
+        return bool(updated)
+
+    async def atransition(self, payment, from_status, to_status, **values):
+        return await sync_to_async(self.transition)(
+            payment, from_status, to_status, **values
+        )
+
+    def _gateway_status_update(self, ref, gateway_status, paid_at):
+        now = timezone.now()
+        status = GATEWAY_STATUSES.get(gateway_status)
+
+        if status is None:
+            queryset = self.with_ref(ref).filter(status=PaymentStatus.PENDING)
+            return status, queryset, {"checked_at": now}
+
+        queryset = self.with_ref(ref).filter(
+            status__in=[PaymentStatus.RESERVED, PaymentStatus.PENDING]
+        )
+        return status, queryset, {
+            "status": status,
+            "paid_at": paid_at if status == PaymentStatus.SUCCESS else None,
+            "checked_at": now,
+        }
+
+    def record_gateway_status(self, ref, gateway_status, paid_at=None):
+        """
+        Apply a status reported by Paystack to the pending payment with `ref`
+        and to the rollups. Returns the number of payments settled.
+        """
+        status, queryset, values = self._gateway_status_update(
+            ref, gateway_status, paid_at
+        )
+        if status is None:
+            queryset.update(**values)
+            return 0
+
+        with transaction.atomic():
+            payments = list(
+                queryset.select_for_update().only(
+                    "status", "amount_minor", "currency", "created_at"
+                )
+            )
+            if payments:
+                # The rows are locked, so they still match `queryset`, whose
+                # created_at bounds keep the UPDATE to their partitions.
+                queryset.filter(pk__in=[payment.pk for payment in payments]).update(
+                    **values
+                )
+                PaymentRollup.objects.record(
+                    [(payment, payment.status, status) for payment in payments]
+                )
+        payment_cache.invalidate(*[payment.pk for payment in payments])
+        return len(payments)
+
+    async def arecord_gateway_status(self, ref, gateway_status, paid_at=None):
+        # The async ORM has no transactions, so this runs in a thread.
+        return await sync_to_async(self.record_gateway_status)(
+            ref, gateway_status, paid_at
+        )
 
 
 class Payment(models.Model):
+    """
+    Stored in monthly range partitions on created_at (see migration 0012 and
+    apps.payments.partitions), so the primary key in the database is
+    (id, created_at) and the database only keeps refs unique per creation
+    time; `Payment.objects.create` and `bulk_create` check refs are unused.
+    `id` still comes from a single sequence and identifies a payment on its
+    own.
+    """
 
     name = models.CharField(max_length=100, blank=False)
     email = models.EmailField(blank=False)
-    amount = models.DecimalField(decimal_places=2, max_digits=10, validators=[MinValueValidator(0.0)])
-    ref = models.CharField(max_length=250, null=True, unique=True, editable=False)
+    # In the currency's minor unit, e.g. kobo; see apps.payments.money.
+    amount_minor = models.BigIntegerField(validators=[MinValueValidator(0)])
+    currency = models.CharField(
+        max_length=3, choices=Currency.choices, default=Currency.NGN
+    )
+    # New refs are 26-character ULIDs (apps.payments.refs); the column stays
+    # wide enough for the random tokens issued before them.
+    ref = models.CharField(max_length=LEGACY_REF_LENGTH, null=True, editable=False)
     status = models.CharField(
-        max_length=10, default="pending"
+        max_length=20, choices=PaymentStatus.choices, default=PaymentStatus.PENDING
     )
+    authorization_url = models.URLField(max_length=500, null=True, blank=True)
     paid_at = models.DateTimeField(null=True, blank=True)
+    checked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by a trigger (migration 0016) whenever a field in the API
+    # representation is updated, including through QuerySet.update().
+    updated_at = models.DateTimeField(db_default=Now())
+
+    objects = PaymentManager()
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            # Keyset pagination of the list endpoint walks this index.
+            models.Index(fields=["created_at", "id"], name="payment_created_id_idx"),
+            # Reconciliation and "oldest pending" queries only ever look at
+            # pending rows, which are a small slice of the table.
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status=PaymentStatus.PENDING),
+                name="payment_pending_created_idx",
+            ),
+            models.Index(fields=["email", "paid_at"], name="payment_email_paid_at_idx"),
+            # Rows are inserted in created_at order, so a BRIN index serves
+            # date-range scans at a fraction of a B-tree's size.
+            BrinIndex(fields=["created_at"], name="payment_created_brin"),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(status__in=PaymentStatus.values),
+                name="payment_status_valid",
+            ),
+            # Unique constraints on a partitioned table must include the
+            # partition key.
+            models.UniqueConstraint(
+                fields=["ref", "created_at"], name="payment_ref_created_uniq"
+            ),
+        ]
+
+    def refresh_from_partition(self, fields=None):
+        """`refresh_from_db`, reading only the partition of this payment."""
+        self.refresh_from_db(
+            fields=fields,
+            from_queryset=Payment.objects.filter(created_at=self.created_at),
+        )
+
+    async def arefresh_from_partition(self, fields=None):
+        await self.arefresh_from_db(
+            fields=fields,
+            from_queryset=Payment.objects.filter(created_at=self.created_at),
+        )
+
+    def is_stale(self):
+        """Whether a pending payment is due for a fallback check with Paystack."""
+        return due_for_check(self.checked_at)
+
+    @property
+    def amount(self):
+        """The amount in major units, e.g. naira, as a Decimal."""
+        if self.amount_minor is None:
+            return None
+        return from_minor_units(self.amount_minor)
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_minor = to_minor_units(value)
+
+    def amount_value(self):
+        """The amount in minor units, as Paystack expects it."""
+        return self.amount_minor
 
     def __str__(self):
         return f"{self.name} - {self.amount_value()}"
 
+
+class WebhookEvent(models.Model):
+
+    event_id = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.event_id
+
+
+class ReconciliationRun(models.Model):
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_payment_id = models.BigIntegerField(default=0)
+    verified = models.PositiveIntegerField(default=0)
+    settled = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Reconciliation {self.pk} - {self.started_at}"
+
+
+class IdempotencyKey(models.Model):
+
+    # Keys are only unique per caller: "user:<pk>", or "ip:<address>" for
+    # anonymous requests.
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    response_headers = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "key"], name="idempotencykey_scope_key_uniq"
+            ),
+        ]
+
+    def is_completed(self):
+        return self.response_status is not None
+
+    def __str__(self):
+        return self.key
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = "queued", _("Queued")
+    DEAD = "dead", _("Dead")
+
+
+class PaymentJob(models.Model):
+    """
+    Queued Paystack initialization for a payment created in asynchronous
+    mode, claimed by `run_payment_workers`. Jobs are deleted once the payment
+    is initialized; jobs that run out of attempts stay behind as dead letters.
+    """
+
+    # The partitioned payments table has no unique index on id alone for a
+    # foreign key constraint to reference.
+    payment = models.OneToOneField(
+        Payment, on_delete=models.CASCADE, related_name="job", db_constraint=False
+    )
+    status = models.CharField(
+        max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers only ever scan due, queued jobs.
+            models.Index(
+                fields=["run_after"],
+                condition=models.Q(status=JobStatus.QUEUED),
+                name="paymentjob_queued_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} - payment {self.payment_id}"
+
+
+class PaymentRollupManager(models.Manager):
+
+    def record(self, changes):
+        """
+        Apply payment status changes to the rollups. `changes` holds
+        `(payment, from_status, to_status)` tuples, with `from_status` None
+        for new payments; call it in the transaction making the changes.
+        """
+        deltas = defaultdict(lambda: [0, 0])
+        for payment, from_status, to_status in changes:
+            if from_status == to_status:
+                continue
+            day = rollup_day(payment.created_at)
+            if from_status is not None:
+                deltas[day, from_status, payment.currency][0] -= 1
+                deltas[day, from_status, payment.currency][1] -= payment.amount_minor
+            if to_status is not None:
+                deltas[day, to_status, payment.currency][0] += 1
+                deltas[day, to_status, payment.currency][1] += payment.amount_minor
+        if not deltas:
+            return
+
+        # Upserted in key order so concurrent transactions lock rows in the
+        # same order and can't deadlock.
+        table = self.model._meta.db_table
+        rows = sorted(deltas.items())
+        params = [value for key, delta in rows for value in (*key, *delta)]
+        with connections[router.db_for_write(self.model)].cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (day, status, currency, count, amount_minor) "
+                "VALUES "
+                + ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+                + " ON CONFLICT (day, status, currency) DO UPDATE SET"
+                f" count = {table}.count + EXCLUDED.count,"
+                f" amount_minor = {table}.amount_minor + EXCLUDED.amount_minor",
+                params,
+            )
+
+    def rebuild(self, since=None):
+        """
+        Recompute the rollups from the payments table, for days from `since`
+        on or for every day. Days whose payments have been archived are left
+        alone, since they can't be recounted. Returns the number of rollup
+        rows written.
+        """
+        archived_before = PaymentArchive.objects.aggregate(
+            models.Max("created_before")
+        )["created_before__max"]
+        if archived_before is not None:
+            # Partitions end at midnight UTC, so this is a whole day.
+            floor = rollup_day(archived_before)
+            since = floor if since is None else max(since, floor)
+
+        payments = Payment.objects.all()
+        rollups = self.all()
+        if since is not None:
+            start = datetime.combine(since, time.min, tzinfo=dt_timezone.utc)
+            payments = payments.filter(created_at__gte=start)
+            rollups = rollups.filter(day__gte=since)
+
+        created = payments.aggregate(models.Min("created_at"), models.Max("created_at"))
+        days = [
+            day
+            for day in rollups.aggregate(models.Min("day"), models.Max("day")).values()
+            if day is not None
+        ] + [rollup_day(value) for value in created.values() if value is not None]
+        if not days:
+            return 0
+
+        # A day at a time, so incremental updates only ever wait for one.
+        day, last = min(days), max(days)
+        written = 0
+        while day <= last:
+            written += self.rebuild_day(day)
+            day += timedelta(days=1)
+        return written
+
+    def rebuild_day(self, day):
+        """Recompute the rollups of one day; returns the rows written."""
+        start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+        payments = Payment.objects.filter(
+            created_at__gte=start, created_at__lt=start + timedelta(days=1)
+        )
+
+        with transaction.atomic():
+            # Holds off incremental updates until the new totals are in; they
+            # then apply on top, so no change is lost or counted twice.
+            with connections[router.db_for_write(self.model)].cursor() as cursor:
+                cursor.execute(
+                    f"LOCK TABLE {self.model._meta.db_table} IN EXCLUSIVE MODE"
+                )
+            self.filter(day=day).delete()
+            totals = (
+                payments.values("status", "currency")
+                .annotate(payments=Count("pk"), total=Sum("amount_minor"))
+                .order_by()
+            )
+            created = self.bulk_create(
+                [
+                    self.model(
+                        day=day,
+                        status=row["status"],
+                        currency=row["currency"],
+                        count=row["payments"],
+                        amount_minor=row["total"],
+                    )
+                    for row in totals
+                ]
+            )
+        return len(created)
+
+
+def rollup_day(created_at):
+    """The day a payment is counted under: its UTC creation date."""
+    return created_at.astimezone(dt_timezone.utc).date()
+
+
+class PaymentRollup(models.Model):
+    """
+    Number and total amount of the payments in a currency created on a (UTC)
+    day that are in a given status, kept in step with every status change so reports
+    never scan the payments table. `rebuild_payment_rollups` recomputes them.
+    """
+
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=PaymentStatus.choices)
+    currency = models.CharField(max_length=3, choices=Currency.choices)
+    count = models.BigIntegerField(default=0)
+    amount_minor = models.BigIntegerField(default=0)
+
+    objects = PaymentRollupManager()
+
+    class Meta:
+        ordering = ["day", "status", "currency"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "status", "currency"],
+                name="paymentrollup_day_status_currency_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status} - {self.count}"
+
+
+class PaymentArchive(models.Model):
+    """
+    A payments partition detached by `archive_payment_partitions` and written
+    to a gzipped NDJSON file, one payment per line in id order.
+    """
+
+    table = models.CharField(max_length=63, unique=True)
+    path = models.CharField(max_length=500)
+    created_before = models.DateTimeField()
+    first_id = models.BigIntegerField(null=True)
+    last_id = models.BigIntegerField(null=True)
+    rows = models.PositiveBigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.table
@@ -0,0 +1,39 @@
+"""
+Amounts are stored and sent to Paystack as integers in the currency's minor
+unit (kobo, pesewas, cents...), and only converted to and from major-unit
+decimals at the API's edges.
+"""
+
+from decimal import Decimal
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class Currency(models.TextChoices):
+    NGN = "NGN", _("Nigerian naira")
+    GHS = "GHS", _("Ghanaian cedi")
+    KES = "KES", _("Kenyan shilling")
+    ZAR = "ZAR", _("South African rand")
+    USD = "USD", _("US dollar")
+
+
+# Every currency above has 100 minor units to the major one.
+MINOR_UNIT_DIGITS = 2
+
+
+def to_minor_units(amount):
+    """Convert a major-unit amount (Decimal, str or int) to minor units exactly."""
+    minor = Decimal(str(amount)).scaleb(MINOR_UNIT_DIGITS)
+    if minor != minor.to_integral_value():
+        raise ValueError(f"{amount} is more precise than the currency's minor unit")
+    return int(minor)
+
+
+def from_minor_units(minor):
+    """The major-unit Decimal for `minor`, e.g. 1050 -> Decimal("10.50")."""
+    return Decimal(minor).scaleb(-MINOR_UNIT_DIGITS)
+
+
+def format_minor_units(minor):
+    """`minor` as a major-unit string, e.g. 1050 -> "10.50"."""
+    return format(from_minor_units(minor), "f")
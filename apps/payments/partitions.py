@@ -0,0 +1,382 @@
+"""
+Monthly range partitions of the payments table on created_at (set up by
+migration 0012), and archival of old partitions to gzipped NDJSON files
+that `find_archived` can still look payments up in.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import NamedTuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import REF_TIME_MARGIN, Payment, PaymentArchive
+from .refs import LEGACY_REF_LENGTH, ref_time
+import bisect
+import functools
+import gzip
+import io
+import json
+import os
+import re
+import time
+
+PARENT = Payment._meta.db_table
+FIELDS = Payment._meta.concrete_fields
+# Archives are written as one gzip member per this many rows, with an index
+# of where each member starts, so a lookup only decompresses one of them.
+ARCHIVE_CHUNK_ROWS = 10000
+# `<archive>.refs` holds one "<ref padded to LEGACY_REF_LENGTH><id:20>\n"
+# record per payment, sorted by ref, so refs can be binary searched.
+REF_RECORD_SIZE = LEGACY_REF_LENGTH + 21
+
+PARTITIONS_SQL = """
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass
+"""
+BOUNDS_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+# How far a payment's created_at may be from the partition its id points to:
+# created_at is taken before the INSERT draws the id, so payments created
+# just before midnight can get ids after the first ones of the next month.
+ID_TIME_MARGIN = timedelta(days=1)
+
+
+class Partition(NamedTuple):
+    name: str
+    start: datetime | None  # None for MINVALUE
+    end: datetime
+
+
+class IdRange(NamedTuple):
+    partition: Partition
+    first_id: int
+    last_id: int
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def parse_bound(bound):
+    if bound == "MINVALUE":
+        return None
+    return parse_datetime(bound.strip("'"))
+
+
+def partitions():
+    """The payments table's partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITIONS_SQL, [PARENT])
+        rows = cursor.fetchall()
+
+    found = []
+    for name, bounds in rows:
+        start, end = BOUNDS_RE.search(bounds).groups()
+        found.append(Partition(name, parse_bound(start), parse_bound(end)))
+    return sorted(found, key=lambda partition: partition.end)
+
+
+# (monotonic expiry, ranges) of the last `id_ranges()` lookup.
+_id_ranges = (0, [])
+
+
+def id_ranges():
+    """
+    The lowest and highest id in each non-empty partition, oldest first.
+    Cached for PAYMENTS_ID_RANGES_TTL seconds; each lookup is an index probe
+    per partition.
+    """
+    global _id_ranges
+    expires, ranges = _id_ranges
+    if time.monotonic() < expires:
+        return ranges
+
+    ranges = []
+    with connection.cursor() as cursor:
+        for partition in partitions():
+            cursor.execute(
+                "SELECT min(id), max(id) FROM "
+                + connection.ops.quote_name(partition.name)
+            )
+            first_id, last_id = cursor.fetchone()
+            if first_id is not None:
+                ranges.append(IdRange(partition, first_id, last_id))
+    _id_ranges = (time.monotonic() + settings.PAYMENTS_ID_RANGES_TTL, ranges)
+    return ranges
+
+
+async def aid_ranges():
+    expires, ranges = _id_ranges
+    if time.monotonic() < expires:
+        return ranges
+    return await sync_to_async(id_ranges)()
+
+
+def clear_id_ranges():
+    global _id_ranges
+    _id_ranges = (0, [])
+
+
+def id_bounds(pk, ranges):
+    """
+    `(created_after, created_before)` bounds on the created_at of payment
+    `pk`, from the partitions in `ranges` whose ids could include it; either
+    is None when unbounded. The newest partition's range is open-ended, since
+    its ids keep growing.
+    """
+    candidates = [
+        id_range
+        for id_range in ranges
+        if id_range.first_id <= pk
+        and (pk <= id_range.last_id or id_range is ranges[-1])
+    ]
+    if not candidates:
+        return None, None
+
+    start = candidates[0].partition.start
+    end = None if candidates[-1] is ranges[-1] else candidates[-1].partition.end
+    return (
+        None if start is None else start - ID_TIME_MARGIN,
+        None if end is None else end + ID_TIME_MARGIN,
+    )
+
+
+def create_partitions(months_ahead):
+    """
+    Create the monthly partitions missing between the newest one and
+    `months_ahead` months after the current one. Returns their names.
+    """
+    current = month_start(timezone.now())
+    existing = partitions()
+    month = max(existing[-1].end, current) if existing else current
+
+    created = []
+    with connection.cursor() as cursor:
+        while month <= add_months(current, months_ahead):
+            name = f"{PARENT}_{month:%Y_%m}"
+            cursor.execute(
+                f"CREATE TABLE {connection.ops.quote_name(name)} "
+                f"PARTITION OF {connection.ops.quote_name(PARENT)} "
+                "FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+            created.append(name)
+            month = add_months(month, 1)
+    clear_id_ranges()
+    return created
+
+
+def archive_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Can't archive {value!r}")
+
+
+def archive_partition(partition, directory):
+    """
+    Write `partition` to `<directory>/<name>.ndjson.gz`, one payment per line
+    in id order, then detach and drop it. Writes to the partition wait while
+    it is copied; the payments table itself is only locked to detach it.
+
+    The file is a series of gzip members of ARCHIVE_CHUNK_ROWS lines, which
+    any gzip reader handles as one stream; `<name>.ndjson.gz.idx` lists the
+    first id and byte offset of each member for `find_archived`, and
+    `<name>.ndjson.gz.refs` the ids by ref for `find_archived_many`.
+    """
+    table = connection.ops.quote_name(partition.name)
+    path = os.path.abspath(os.path.join(directory, f"{partition.name}.ndjson.gz"))
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in FIELDS)
+    first_id = last_id = None
+    rows = 0
+    chunk, index = [], []
+
+    os.makedirs(directory, exist_ok=True)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table} IN SHARE MODE")
+
+        with connection.chunked_cursor() as cursor, open(
+            f"{path}.tmp", "wb"
+        ) as archive:
+
+            def flush():
+                index.append([chunk_first_id, archive.tell()])
+                archive.write(gzip.compress("".join(chunk).encode()))
+                chunk.clear()
+
+            cursor.execute(f"SELECT {columns} FROM {table} ORDER BY 1")
+            for row in cursor:
+                record = dict(zip((field.attname for field in FIELDS), row))
+                if not chunk:
+                    chunk_first_id = record["id"]
+                chunk.append(json.dumps(record, default=archive_value) + "\n")
+                if len(chunk) == ARCHIVE_CHUNK_ROWS:
+                    flush()
+                first_id = record["id"] if first_id is None else first_id
+                last_id = record["id"]
+                rows += 1
+            if chunk:
+                flush()
+
+        with connection.chunked_cursor() as cursor, open(
+            f"{path}.refs.tmp", "wb"
+        ) as refs_file:
+            # Byte order, which is what comparing the padded records uses.
+            cursor.execute(
+                f"SELECT ref, id FROM {table} WHERE ref IS NOT NULL "
+                'ORDER BY ref COLLATE "C"'
+            )
+            for ref, pk in cursor:
+                refs_file.write(
+                    ref.encode().ljust(LEGACY_REF_LENGTH) + b"%020d\n" % pk
+                )
+
+        with open(f"{path}.idx.tmp", "w") as index_file:
+            json.dump(index, index_file)
+        os.replace(f"{path}.idx.tmp", f"{path}.idx")
+        os.replace(f"{path}.refs.tmp", f"{path}.refs")
+        os.replace(f"{path}.tmp", path)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {connection.ops.quote_name(PARENT)} "
+                f"DETACH PARTITION {table}"
+            )
+            cursor.execute(f"DROP TABLE {table}")
+        clear_id_ranges()
+        return PaymentArchive.objects.create(
+            table=partition.name,
+            path=path,
+            created_before=partition.end,
+            first_id=first_id,
+            last_id=last_id,
+            rows=rows,
+        )
+
+
+@functools.lru_cache(maxsize=64)
+def archive_index(path):
+    """`([first id, ...], [offset, ...])` of the gzip members in `path`."""
+    try:
+        with open(f"{path}.idx") as index_file:
+            index = json.load(index_file)
+    except FileNotFoundError:
+        # Archived before archives had an index: one member from the start.
+        index = [[0, 0]]
+    return [first_id for first_id, _ in index], [offset for _, offset in index]
+
+
+def archive_offset(path, pk):
+    """Where the gzip member that would hold payment `pk` starts."""
+    first_ids, offsets = archive_index(path)
+    return offsets[max(bisect.bisect_right(first_ids, pk) - 1, 0)]
+
+
+def read_archived(path, pk):
+    """Read payment `pk` back from the archive file at `path`, or None."""
+    with open(path, "rb") as raw:
+        raw.seek(archive_offset(path, pk))
+        lines = io.TextIOWrapper(gzip.GzipFile(fileobj=raw), encoding="utf-8")
+        for line in lines:
+            # Lines start with '{"id": <id>,'; skip others without parsing.
+            line_id = int(line[7 : line.index(",")])
+            if line_id < pk:
+                continue
+            if line_id > pk:
+                break
+            record = json.loads(line)
+            # Archives written before a field was added don't have it.
+            return Payment(
+                **{
+                    field.attname: field.to_python(record.get(field.attname))
+                    for field in FIELDS
+                }
+            )
+    return None
+
+
+def archived_ref_id(path, ref):
+    """The id of the payment with `ref` in the archive at `path`, or None."""
+    key = ref.encode().ljust(LEGACY_REF_LENGTH)
+    try:
+        refs_file = open(f"{path}.refs", "rb")
+    except FileNotFoundError:
+        # Archived before archives had a ref index.
+        return None
+    with refs_file:
+        low, high = 0, os.fstat(refs_file.fileno()).st_size // REF_RECORD_SIZE
+        while low < high:
+            middle = (low + high) // 2
+            refs_file.seek(middle * REF_RECORD_SIZE)
+            record = refs_file.read(REF_RECORD_SIZE)
+            if record[:LEGACY_REF_LENGTH] < key:
+                low = middle + 1
+            elif record[:LEGACY_REF_LENGTH] > key:
+                high = middle
+            else:
+                return int(record[LEGACY_REF_LENGTH:])
+    return None
+
+
+def find_archived(pk):
+    """Read payment `pk` back from the archive files, or return None."""
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+
+    for archive in PaymentArchive.objects.filter(first_id__lte=pk, last_id__gte=pk):
+        payment = read_archived(archive.path, pk)
+        if payment is not None:
+            return payment
+    return None
+
+
+def find_archived_many(pks=(), refs=()):
+    """
+    Read the payments with ids in `pks` or refs in `refs` back from the
+    archive files, reading the list of archives once. Returns the payments
+    found; those not found aren't archived.
+    """
+    if not pks and not refs:
+        return []
+    archives = list(PaymentArchive.objects.order_by("created_before"))
+    found = {}
+
+    for pk in pks:
+        for archive in archives:
+            if archive.first_id is None or not (
+                archive.first_id <= pk <= archive.last_id
+            ):
+                continue
+            payment = read_archived(archive.path, pk)
+            if payment is not None:
+                found[payment.pk] = payment
+                break
+
+    for ref in refs:
+        # Refs from apps.payments.refs can only be in archives of partitions
+        # that end after they were issued.
+        issued = ref_time(ref)
+        if issued is not None:
+            issued = datetime.fromtimestamp(issued, dt_timezone.utc) - REF_TIME_MARGIN
+        for archive in archives:
+            if issued is not None and archive.created_before <= issued:
+                continue
+            pk = archived_ref_id(archive.path, ref)
+            payment = read_archived(archive.path, pk) if pk is not None else None
+            if payment is not None:
+                found[payment.pk] = payment
+                break
+    return list(found.values())
@@ -1,52 +1,312 @@
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import metrics
+import asyncio
+import httpx
 import requests
+import hashlib
+import hmac
+import random
+import threading
+import time
+import weakref
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calling Paystack for `reset_timeout` seconds after `threshold`
+    consecutive failures, then lets a single trial call through.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this call through and re-open on failure.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
 
 
 class Paystack:
+    """
+    Paystack API client. Use `Paystack.client()` to get the instance shared by
+    the process so calls reuse pooled keep-alive connections.
+    """
+
     PAYSTACK_SK = settings.PAYSTACK_SECRET_KEY
     base_url = "https://api.paystack.co/"
 
+    _client = None
+    _client_lock = threading.Lock()
+
+    def __init__(
+        self,
+        secret_key=None,
+        base_url=None,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=10,
+        max_retries=2,
+        backoff_factor=0.3,
+        breaker_threshold=5,
+        breaker_reset=30,
+    ):
+        self.secret_key = secret_key or Paystack.PAYSTACK_SK
+        self.base_url = base_url or Paystack.base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.initialize_url = self.base_url + "transaction/initialize"
+        self.verify_url = self.base_url + "transaction/verify/"
+
+        # Only GETs (verify) are retried once a request has been sent;
+        # initialize is retried only when the connection couldn't be made.
+        retry = Retry(
+            total=max_retries,
+            allowed_methods=frozenset(["GET"]),
+            status_forcelist=[429, 500, 502, 503, 504],
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {self.secret_key}",
+                "Content-Type": "application/json",
+            }
+        )
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+
     @classmethod
-    def initialize_payment(cls, ref, email, amount, *args, **kwargs):
-        path = f"transaction/initialize"
-        headers = {
-            "Authorization": f"Bearer {Paystack.PAYSTACK_SK}",
-            "Content-Type": "application/json",
-        }
+    def client(cls):
+        if cls._client is None:
+            with cls._client_lock:
+                if cls._client is None:
+                    cls._client = cls(
+                        base_url=settings.PAYSTACK_BASE_URL,
+                        pool_size=settings.PAYSTACK_POOL_SIZE,
+                        connect_timeout=settings.PAYSTACK_CONNECT_TIMEOUT,
+                        read_timeout=settings.PAYSTACK_READ_TIMEOUT,
+                        max_retries=settings.PAYSTACK_MAX_RETRIES,
+                        backoff_factor=settings.PAYSTACK_BACKOFF_FACTOR,
+                        breaker_threshold=settings.PAYSTACK_BREAKER_THRESHOLD,
+                        breaker_reset=settings.PAYSTACK_BREAKER_RESET,
+                    )
+        return cls._client
+
+    def _request(self, operation, method, url, **kwargs):
+        if not self.breaker.allow():
+            metrics.GATEWAY_RESPONSES.inc(operation=operation, status="circuit_open")
+            raise CircuitOpenError("Paystack is unavailable, try again later")
+
+        try:
+            with metrics.gateway_call(operation) as call:
+                response = self.session.request(
+                    method, url, timeout=self.timeout, **kwargs
+                )
+                call.status = response.status_code
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        response.raise_for_status()
+        return response.json()
+
+    def initialize_payment(self, ref, email, amount, *args, currency=None, **kwargs):
+        """
+        Start a transaction for `amount` in minor units (kobo for NGN).
+        Returns `(True, data)` with the authorization URL, or `(False, message)`.
+        """
         data = {"reference": ref, "email": email, "amount": amount}
-        url = Paystack.base_url + path
+        if currency:
+            data["currency"] = currency
 
         try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
+            response_data = self._request(
+                "initialize", "POST", self.initialize_url, json=data
+            )
+        except Exception as e:
+            return False, str(e)
 
-            response_data = response.json()
-            return response_data
+        if not response_data.get("status"):
+            return False, response_data.get("message")
+        return True, response_data.get("data")
 
-        except requests.exceptions.RequestException as e:
+    def verify_payment(self, ref, *args, **kwargs):
+        """Returns `(True, data)` with the transaction details, or `(False, message)`."""
+        try:
+            response_data = self._request("verify", "GET", self.verify_url + ref)
+        except Exception as e:
             return False, str(e)
 
+        if not response_data.get("status"):
+            return False, response_data.get("message")
+        return True, response_data.get("data")
+
+    def verify_signature(self, body, signature):
+        """Check the `x-paystack-signature` header sent with a webhook."""
+        if not signature:
+            return False
+
+        expected = hmac.new(
+            self.secret_key.encode(), body, hashlib.sha512
+        ).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+
+class AsyncPaystack:
+    """
+    Non-blocking Paystack client for the ASGI views. Use
+    `AsyncPaystack.client()` to get the instance shared by the running event
+    loop, so every in-flight call draws from the same connection pool.
+    """
+
+    RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+    _clients = weakref.WeakKeyDictionary()
+
+    def __init__(
+        self,
+        secret_key=None,
+        base_url=None,
+        pool_size=100,
+        connect_timeout=3.05,
+        read_timeout=10,
+        max_retries=2,
+        backoff_factor=0.3,
+        breaker_threshold=5,
+        breaker_reset=30,
+    ):
+        self.secret_key = secret_key or Paystack.PAYSTACK_SK
+        self.base_url = base_url or Paystack.base_url
+        self.initialize_url = self.base_url + "transaction/initialize"
+        self.verify_url = self.base_url + "transaction/verify/"
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        self.http = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {self.secret_key}",
+                "Content-Type": "application/json",
+            },
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+
     @classmethod
-    def verify_payment(cls, ref, *args, **kwargs):
-        path = f"transaction/verify/{ref}"
-        headers = {
-            "Authorization": f"Bearer {Paystack.PAYSTACK_SK}",
-            "Content-Type": "application/json",
-        }
-        url = Paystack.base_url + path
+    def client(cls):
+        loop = asyncio.get_running_loop()
+        client = cls._clients.get(loop)
+        if client is None:
+            client = cls(
+                base_url=settings.PAYSTACK_BASE_URL,
+                pool_size=settings.PAYSTACK_ASYNC_POOL_SIZE,
+                connect_timeout=settings.PAYSTACK_CONNECT_TIMEOUT,
+                read_timeout=settings.PAYSTACK_READ_TIMEOUT,
+                max_retries=settings.PAYSTACK_MAX_RETRIES,
+                backoff_factor=settings.PAYSTACK_BACKOFF_FACTOR,
+                breaker_threshold=settings.PAYSTACK_BREAKER_THRESHOLD,
+                breaker_reset=settings.PAYSTACK_BREAKER_RESET,
+            )
+            cls._clients[loop] = client
+        return client
 
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
+    async def _request(self, operation, method, url, retries=0, **kwargs):
+        if not self.breaker.allow():
+            metrics.GATEWAY_RESPONSES.inc(operation=operation, status="circuit_open")
+            raise CircuitOpenError("Paystack is unavailable, try again later")
+
+        for attempt in range(retries + 1):
+            try:
+                with metrics.gateway_call(operation) as call:
+                    response = await self.http.request(method, url, **kwargs)
+                    call.status = response.status_code
+            except httpx.TransportError:
+                self.breaker.record_failure()
+                if attempt == retries:
+                    raise
+            else:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+
+                if response.status_code not in self.RETRY_STATUSES or attempt == retries:
+                    response.raise_for_status()
+                    return response.json()
+
+            backoff = self.backoff_factor * 2**attempt
+            await asyncio.sleep(backoff + random.uniform(0, self.backoff_factor))
+
+    async def initialize_payment(
+        self, ref, email, amount, *args, currency=None, **kwargs
+    ):
+        """
+        Start a transaction for `amount` in minor units (kobo for NGN).
+        Returns `(True, data)` with the authorization URL, or `(False, message)`.
+        """
+        data = {"reference": ref, "email": email, "amount": amount}
+        if currency:
+            data["currency"] = currency
 
-            response_data = response.json()
-            verification_status = response_data.get("status")
-            message = response_data.get("message")
-            data = response_data.get("data")
-            payment_status = data.get("status")
-            paid_at = data.get("paid_at")
+        try:
+            response_data = await self._request(
+                "initialize", "POST", self.initialize_url, json=data
+            )
+        except Exception as e:
+            return False, str(e)
 
-            return verification_status, message, payment_status, paid_at
+        if not response_data.get("status"):
+            return False, response_data.get("message")
+        return True, response_data.get("data")
 
-        except requests.exceptions.RequestException as e:
+    async def verify_payment(self, ref, *args, **kwargs):
+        """Returns `(True, data)` with the transaction details, or `(False, message)`."""
+        try:
+            response_data = await self._request(
+                "verify", "GET", self.verify_url + ref, retries=self.max_retries
+            )
+        except Exception as e:
             return False, str(e)
+
+        if not response_data.get("status"):
+            return False, response_data.get("message")
+        return True, response_data.get("data")
@@ -0,0 +1,47 @@
+"""
+Payment references: 128-bit ULIDs in Crockford base32.
+
+The first 48 bits are the creation time in milliseconds and the other 80
+come from `secrets`, so refs are unguessable but sort by creation time, and
+new rows land at the right-hand edge of the ref index instead of anywhere
+in it.
+"""
+
+import secrets
+import time
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+REF_LENGTH = 26
+# Refs issued before ULIDs were `secrets.token_urlsafe(50)`.
+LEGACY_REF_LENGTH = 67
+
+_TIMESTAMP_BITS = 48
+_RANDOM_BITS = 80
+
+
+def encode(value):
+    chars = []
+    for _ in range(REF_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def new_ref(now=None):
+    """A new ref for a payment created at `now` (a Unix time in seconds)."""
+    millis = int((time.time() if now is None else now) * 1000)
+    value = (millis % (1 << _TIMESTAMP_BITS)) << _RANDOM_BITS
+    return encode(value | secrets.randbits(_RANDOM_BITS))
+
+
+def ref_time(ref):
+    """The Unix time `ref` was issued at, or None for a legacy ref."""
+    if len(ref) != REF_LENGTH:
+        return None
+    value = 0
+    for char in ref:
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            return None
+        value = value * 32 + digit
+    return (value >> _RANDOM_BITS) / 1000
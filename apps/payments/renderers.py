@@ -0,0 +1,35 @@
+from rest_framework.renderers import JSONRenderer
+import orjson
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson. With DRF's default compact,
+    strict, unicode settings it gives the same bytes as JSONRenderer for
+    strings, integers, booleans and everything the DRF encoder converts
+    (Decimals, datetimes, lazy strings...); floats may be spelled
+    differently (1e16 rather than 1e+16). Indented output, other settings
+    and anything orjson can't encode fall back to the stock renderer.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not (self.compact and self.strict):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped like JSONRenderer does, keeping the output a JavaScript subset.
+        return ret.replace("\u2028".encode(), b"\\u2028").replace(
+            "\u2029".encode(), b"\\u2029"
+        )
@@ -1,9 +1,49 @@
+from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
 from .models import Payment
+from .metrics import track_phase
+from .money import (
+    MINOR_UNIT_DIGITS,
+    format_minor_units,
+    from_minor_units,
+    to_minor_units,
+)
+from .refs import LEGACY_REF_LENGTH
+import decimal
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with track_phase("serialize"):
+            return super().data
+
+
+class MinorUnitsField(serializers.DecimalField):
+    """
+    A major-unit decimal amount in the API ("10.50") for an integer amount
+    in minor units (1050) on the model.
+    """
+
+    def __init__(self, **kwargs):
+        # The same range as the decimal amount column it replaced.
+        kwargs.setdefault("max_digits", 10)
+        kwargs.setdefault("min_value", decimal.Decimal(0))
+        super().__init__(decimal_places=MINOR_UNIT_DIGITS, **kwargs)
+
+    def to_internal_value(self, data):
+        return to_minor_units(super().to_internal_value(data))
+
+    def to_representation(self, value):
+        return super().to_representation(from_minor_units(value))
 
 
 class PaymentSerializer(serializers.ModelSerializer):
+    amount = MinorUnitsField(source="amount_minor")
+
     class Meta:
         model = Payment
         fields = [
@@ -11,7 +51,166 @@ class PaymentSerializer(serializers.ModelSerializer):
             "name",
             "email",
             "amount",
+            # Writable on create, limited to Currency; defaults to NGN.
+            "currency",
             "status",
-            "paid_at"
+            "authorization_url",
+            "paid_at",
+            "updated_at",
         ]
-        read_only_fields = ["status", "id", "paid_at"]
+        read_only_fields = [
+            "status",
+            "id",
+            "authorization_url",
+            "paid_at",
+            "updated_at",
+        ]
+        list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        # Counted towards the request's "serialize" phase in the metrics.
+        with track_phase("serialize"):
+            return super().data
+
+
+class PaymentLookupSerializer(serializers.Serializer):
+    """The payments to look up in one `lookup` request, by id and/or ref."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, default=list
+    )
+    refs = serializers.ListField(
+        child=serializers.CharField(max_length=LEGACY_REF_LENGTH),
+        required=False,
+        default=list,
+    )
+
+    def validate(self, attrs):
+        count = len(attrs["ids"]) + len(attrs["refs"])
+        if not count:
+            raise serializers.ValidationError(_("Expected payment ids or refs"))
+        if count > settings.PAYMENTS_LOOKUP_MAX_ITEMS:
+            raise serializers.ValidationError(
+                _("At most %(count)d payments per request")
+                % {"count": settings.PAYMENTS_LOOKUP_MAX_ITEMS}
+            )
+        return attrs
+
+
+def compile_converter(field, tz):
+    """
+    Return a function giving the same output as `field.to_representation`
+    for non-null values while `tz` is the current timezone, specialized for
+    the field types payments use.
+    """
+    if isinstance(field, MinorUnitsField) and (
+        getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+        and not (field.localize or field.normalize_output)
+    ):
+        return format_minor_units
+
+    if isinstance(field, serializers.DecimalField) and (
+        getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+        and field.decimal_places is not None
+        and not (field.localize or field.normalize_output)
+    ):
+        quantum = decimal.Decimal(".1") ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        rounding = field.rounding
+
+        def convert_decimal(value):
+            if not isinstance(value, decimal.Decimal):
+                return field.to_representation(value)
+            quantized = value.quantize(quantum, rounding=rounding, context=context)
+            return format(quantized, "f")
+
+        return convert_decimal
+
+    if isinstance(field, serializers.DateTimeField) and (
+        getattr(field, "format", api_settings.DATETIME_FORMAT) == ISO_8601
+        and not hasattr(field, "timezone")
+        and settings.USE_TZ
+    ):
+
+        def convert_datetime(value):
+            if value.utcoffset() is None:
+                return field.to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            if value.endswith("+00:00"):
+                value = value[:-6] + "Z"
+            return value
+
+        return convert_datetime
+
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: choices.get(str(value), value)
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, serializers.IntegerField):
+        return int
+    return field.to_representation
+
+
+class PaymentRowSerializer:
+    """
+    Read-only fast path rendering payments exactly like PaymentSerializer,
+    from `.values()` rows instead of model instances. Per-field converters
+    are compiled from PaymentSerializer's own fields once per timezone, so
+    rows go through no field lookup or dispatch.
+    """
+
+    def __init__(self, serializer_class=PaymentSerializer):
+        self.serializer_fields = [
+            (name, field)
+            for name, field in serializer_class().fields.items()
+            if not field.write_only
+        ]
+        self.names = [name for name, _field in self.serializer_fields]
+        self.fields = [field.source for _name, field in self.serializer_fields]
+        self._mappings = {}
+
+    def sources(self, names=None):
+        """The model fields behind the representation fields `names`."""
+        if names is None:
+            return self.fields
+        return [
+            field.source for name, field in self.serializer_fields if name in names
+        ]
+
+    def mapping(self, names=None):
+        tz = timezone.get_current_timezone()
+        mapping = self._mappings.get(tz)
+        if mapping is None:
+            mapping = self._mappings[tz] = [
+                (name, field.source, compile_converter(field, tz))
+                for name, field in self.serializer_fields
+            ]
+        if names is not None:
+            return [entry for entry in mapping if entry[0] in names]
+        return mapping
+
+    def to_representation(self, row, mapping):
+        representation = {}
+        for name, source, convert in mapping:
+            value = row[source]
+            representation[name] = None if value is None else convert(value)
+        return representation
+
+    def rows(self, rows, names=None):
+        """Render `rows`, keeping only the fields in `names` if given."""
+        with track_phase("serialize"):
+            mapping = self.mapping(names)
+            return [self.to_representation(row, mapping) for row in rows]
+
+    def instance(self, instance, names=None):
+        with track_phase("serialize"):
+            mapping = self.mapping(names)
+            row = {source: getattr(instance, source) for _name, source, _ in mapping}
+            return self.to_representation(row, mapping)
+
+
+payment_rows = PaymentRowSerializer()
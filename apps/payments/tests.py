@@ -1,19 +1,61 @@
+import asyncio
+import csv
+import threading
+import time
 import unittest
+import requests
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
 from django.test import TestCase, RequestFactory
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.http import http_date
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from rest_framework import serializers
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
+from . import metrics
+from .cache import payment_cache
+from .jobs import claim_jobs
 from .paystack import Paystack
-from .views import PaymentViewset
-from .models import Payment, PaymentStatus
-from .serializers import PaymentSerializer
+from .views import PaymentViewset, sync_bulk_limit
+from .models import (
+    IdempotencyKey,
+    JobStatus,
+    Payment,
+    PaymentArchive,
+    PaymentJob,
+    PaymentRollup,
+    PaymentStatus,
+    ReconciliationRun,
+    WebhookEvent,
+)
+from .refs import LEGACY_REF_LENGTH, REF_LENGTH, new_ref, ref_time
+from .renderers import FastJSONRenderer
+from .verification import verifier
+from .events import broker
+from .serializers import PaymentSerializer, payment_rows
+from . import partitions
+from core import routers
+from core.middleware import PRIMARY_COOKIE, ReplicaRoutingMiddleware
 
 
 class PaystackAPITest(TestCase):
-    @patch("requests.post")
+    @patch("requests.Session.request")
     def test_initialize_payment_success(self, mock_post):
         """Test successful payment initialization."""
         # Mock the Paystack API response
@@ -25,27 +67,27 @@ class PaystackAPITest(TestCase):
         mock_post.return_value.json.return_value = mock_response
 
         # Call the method
-        status, data = Paystack.initialize_payment("ref123", "john@example.com", 5000)
+        status, data = Paystack().initialize_payment("ref123", "john@example.com", 5000)
 
         # Assertions
         self.assertTrue(status)
         self.assertEqual(data["authorization_url"], "https://paystack.com/authorize")
         mock_post.assert_called_once()
 
-    @patch("requests.post")
+    @patch("requests.Session.request")
     def test_initialize_payment_failure(self, mock_post):
         """Test failed payment initialization."""
         # Mock the Paystack API response
         mock_post.side_effect = Exception("API request failed")
 
         # Call the method
-        status, data = Paystack.initialize_payment("ref123", "john@example.com", 5000)
+        status, data = Paystack().initialize_payment("ref123", "john@example.com", 5000)
 
         # Assertions
         self.assertFalse(status)
         self.assertEqual(data, "API request failed")
 
-    @patch("requests.get")
+    @patch("requests.Session.request")
     def test_verify_payment_success(self, mock_get):
         """Test successful payment verification."""
         # Mock the Paystack API response
@@ -57,7 +99,7 @@ class PaystackAPITest(TestCase):
         mock_get.return_value.json.return_value = mock_response
 
         # Call the method
-        status, data = Paystack.verify_payment("ref123")
+        status, data = Paystack().verify_payment("ref123")
 
         # Assertions
         self.assertTrue(status)
@@ -65,19 +107,47 @@ class PaystackAPITest(TestCase):
         self.assertEqual(data["amount"], 500000)
         mock_get.assert_called_once()
 
-    @patch("requests.get")
+    @patch("requests.Session.request")
     def test_verify_payment_failure(self, mock_get):
         """Test failed payment verification."""
         # Mock the Paystack API response
         mock_get.side_effect = Exception("API request failed")
 
         # Call the method
-        status, data = Paystack.verify_payment("ref123")
+        status, data = Paystack().verify_payment("ref123")
 
         # Assertions
         self.assertFalse(status)
         self.assertEqual(data, "API request failed")
 
+    @patch("requests.Session.request")
+    def test_requests_use_timeouts(self, mock_request):
+        """Test that every gateway call is bounded by the connect/read timeouts."""
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.json.return_value = {"status": True, "data": {}}
+
+        Paystack(connect_timeout=1, read_timeout=2).verify_payment("ref123")
+
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], (1, 2))
+
+    @patch("requests.Session.request")
+    def test_circuit_opens_after_repeated_failures(self, mock_request):
+        """Test that the client stops calling Paystack once the breaker trips."""
+        mock_request.side_effect = requests.exceptions.ConnectionError("down")
+        paystack = Paystack(breaker_threshold=2, breaker_reset=60)
+
+        paystack.verify_payment("ref123")
+        paystack.verify_payment("ref123")
+        status, message = paystack.verify_payment("ref123")
+
+        self.assertFalse(status)
+        self.assertIn("unavailable", message)
+        self.assertEqual(mock_request.call_count, 2)
+
+    def test_client_is_shared(self):
+        """Test that the process reuses a single client and connection pool."""
+        self.assertIs(Paystack.client(), Paystack.client())
+
 
 class PaymentModelTest(TestCase):
     def setUp(self):
@@ -305,7 +375,9 @@ class PaymentSerializerTest(TestCase):
                 return True, {"authorization_url": "https://paystack.com/authorize"}
 
         # Replace the Paystack class with the mock
-        Paystack.initialize_payment = MockPaystack().initialize_payment
+        self.enterContext(
+            patch.object(Paystack, "initialize_payment", MockPaystack().initialize_payment)
+        )
 
         serializer = PaymentSerializer(self.payment)
         payment_url = serializer.get_payment_url(self.payment)
@@ -324,7 +396,9 @@ class PaymentSerializerTest(TestCase):
                 return False, "Payment initialization failed"
 
         # Replace the Paystack class with the mock
-        Paystack.initialize_payment = MockPaystack().initialize_payment
+        self.enterContext(
+            patch.object(Paystack, "initialize_payment", MockPaystack().initialize_payment)
+        )
 
         serializer = PaymentSerializer(self.payment)
         with self.assertRaises(serializers.ValidationError) as context:
@@ -335,3 +409,2085 @@ class PaymentSerializerTest(TestCase):
             str(context.exception.detail["payment_url"]),
             "Payment initialization failed",
         )
+
+
+class PaymentCreateViewTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/"
+        self.payload = {"name": "John Doe", "email": "john@example.com", "amount": "50.00"}
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_create_calls_gateway_outside_transaction(self, mock_initialize):
+        """Test that the gateway is called after the row is reserved and outside any transaction."""
+
+        def initialize(ref, email, amount, currency):
+            self.assertFalse(connection.in_atomic_block)
+            payment = Payment.objects.get(ref=ref)
+            self.assertEqual(payment.status, PaymentStatus.RESERVED)
+            self.assertEqual(amount, 5000)
+            self.assertEqual(currency, "NGN")
+            return True, {"authorization_url": "https://paystack.com/authorize"}
+
+        mock_initialize.side_effect = initialize
+
+        response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["payment_url"], "https://paystack.com/authorize")
+        self.assertEqual(response.data["details"]["status"], PaymentStatus.PENDING)
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, PaymentStatus.PENDING)
+        self.assertEqual(payment.authorization_url, "https://paystack.com/authorize")
+        self.assertEqual(
+            response.data["details"]["updated_at"],
+            PaymentSerializer(payment).data["updated_at"],
+        )
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_create_marks_failed_initialization(self, mock_initialize):
+        """Test that a gateway failure is recorded on the reserved row."""
+        mock_initialize.return_value = (False, "API request failed")
+
+        response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, PaymentStatus.INIT_FAILED)
+        self.assertIsNone(payment.authorization_url)
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_create_marks_failed_initialization_on_exception(self, mock_initialize):
+        """Test that an unexpected gateway error does not leave a reserved row behind."""
+        mock_initialize.side_effect = RuntimeError("boom")
+        self.client.raise_request_exception = False
+
+        response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(Payment.objects.get().status, PaymentStatus.INIT_FAILED)
+
+
+class PaystackWebhookViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/webhook/"
+        self.payment = Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=5000,
+            ref="ref123",
+        )
+
+    def post_event(self, payload, signature=None):
+        body = json.dumps(payload).encode()
+        if signature is None:
+            signature = hmac.new(
+                Paystack.PAYSTACK_SK.encode(), body, hashlib.sha512
+            ).hexdigest()
+        return self.client.generic(
+            "POST",
+            self.url,
+            body,
+            content_type="application/json",
+            HTTP_X_PAYSTACK_SIGNATURE=signature,
+        )
+
+    def test_charge_success_settles_payment(self):
+        """Test that a signed charge.success event marks the payment as paid."""
+        response = self.post_event(
+            {
+                "event": "charge.success",
+                "data": {
+                    "id": 1,
+                    "reference": "ref123",
+                    "status": "success",
+                    "paid_at": "2025-03-20T18:00:00Z",
+                },
+            }
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, PaymentStatus.SUCCESS)
+        self.assertIsNotNone(self.payment.paid_at)
+
+    def test_charge_failed_marks_payment_failed(self):
+        """Test that a charge.failed event marks the payment as failed."""
+        self.post_event(
+            {
+                "event": "charge.failed",
+                "data": {"id": 2, "reference": "ref123", "status": "failed"},
+            }
+        )
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, PaymentStatus.FAILED)
+        self.assertIsNone(self.payment.paid_at)
+
+    def test_invalid_signature_is_rejected(self):
+        """Test that events with a bad signature don't touch the payment."""
+        response = self.post_event(
+            {
+                "event": "charge.success",
+                "data": {"id": 1, "reference": "ref123", "status": "success"},
+            },
+            signature="not-a-signature",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, PaymentStatus.PENDING)
+
+    def test_duplicate_events_are_ignored(self):
+        """Test that a redelivered event is only applied once."""
+        payload = {
+            "event": "charge.success",
+            "data": {"id": 1, "reference": "ref123", "status": "success"},
+        }
+        self.post_event(payload)
+        Payment.objects.filter(pk=self.payment.pk).update(status=PaymentStatus.PENDING)
+
+        response = self.post_event(payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, PaymentStatus.PENDING)
+
+
+class PaymentRetrieveViewTest(TestCase):
+    def setUp(self):
+        verifier.clear()
+        self.client = APIClient()
+        self.payment = Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=5000,
+            ref="ref123",
+        )
+        self.url = f"/api/v1/payments/{self.payment.id}/"
+
+    @patch("apps.payments.views.Paystack.verify_payment")
+    def test_recently_checked_payment_is_served_from_database(self, mock_verify):
+        """Test that retrieve doesn't call Paystack for a freshly checked payment."""
+        Payment.objects.filter(pk=self.payment.pk).update(checked_at=timezone.now())
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["details"]["status"], PaymentStatus.PENDING)
+        mock_verify.assert_not_called()
+
+    @patch("apps.payments.views.Paystack.verify_payment")
+    def test_stale_payment_falls_back_to_verification(self, mock_verify):
+        """Test that retrieve verifies a pending payment that hasn't been checked recently."""
+        Payment.objects.filter(pk=self.payment.pk).update(
+            checked_at=timezone.now() - timedelta(hours=1)
+        )
+        mock_verify.return_value = (
+            True,
+            {"status": "success", "paid_at": "2025-03-20T18:00:00Z"},
+        )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["details"]["status"], PaymentStatus.SUCCESS)
+        mock_verify.assert_called_once_with("ref123")
+
+    @patch("apps.payments.views.Paystack.verify_payment")
+    def test_failed_verification_serves_stored_status(self, mock_verify):
+        """Test that a gateway error doesn't fail the request."""
+        mock_verify.return_value = (False, "API request failed")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["details"]["status"], PaymentStatus.PENDING)
+
+
+class StubPaystackHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Paystack API that answers after a short delay."""
+
+    latency = 0.2
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency)
+        payload = json.dumps(
+            {
+                "status": True,
+                "message": "Authorization URL created",
+                "data": {
+                    "authorization_url": f"https://checkout.paystack.com/{body['reference'][:8]}"
+                },
+            }
+        ).encode()
+
+        with server.lock:
+            server.in_flight -= 1
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubPaystackServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class AsyncPaymentViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gateway = StubPaystackServer(("127.0.0.1", 0), StubPaystackHandler)
+        cls.gateway.lock = threading.Lock()
+        cls.gateway.in_flight = cls.gateway.peak_in_flight = 0
+        threading.Thread(target=cls.gateway.serve_forever, daemon=True).start()
+        cls.gateway_url = f"http://127.0.0.1:{cls.gateway.server_address[1]}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.shutdown()
+        cls.gateway.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        verifier.clear()
+
+    async def test_concurrent_creates_share_the_event_loop(self):
+        """Test that many concurrent creates wait on the gateway at the same time."""
+        payload = {"name": "John Doe", "email": "john@example.com", "amount": "50.00"}
+
+        with self.settings(PAYSTACK_BASE_URL=self.gateway_url):
+            responses = await asyncio.gather(
+                *[
+                    self.async_client.post(
+                        "/api/v1/async/payments/", payload, content_type="application/json"
+                    )
+                    for _ in range(50)
+                ]
+            )
+
+        self.assertTrue(all(r.status_code == status.HTTP_201_CREATED for r in responses))
+        self.assertEqual(
+            await Payment.objects.filter(status=PaymentStatus.PENDING).acount(), 50
+        )
+        self.assertGreater(self.gateway.peak_in_flight, 1)
+
+    @patch("apps.payments.async_views.AsyncPaystack.verify_payment")
+    async def test_retrieve_verifies_stale_payment(self, mock_verify):
+        """Test that the async retrieve settles a stale pending payment."""
+        payment = await Payment.objects.acreate(
+            name="John Doe", email="john@example.com", amount=5000, ref="ref123"
+        )
+        mock_verify.return_value = (True, {"status": "success", "paid_at": None})
+
+        response = await self.async_client.get(f"/api/v1/async/payments/{payment.id}/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["details"]["status"], PaymentStatus.SUCCESS)
+
+
+class ReconcilePaymentsCommandTest(TestCase):
+    def setUp(self):
+        self.payments = [
+            Payment.objects.create(
+                name="John Doe", email="john@example.com", amount=5000, ref=f"ref{i}"
+            )
+            for i in range(5)
+        ]
+
+    def verify(self, ref):
+        if ref == "ref0":
+            return True, {"status": "success", "paid_at": "2025-03-20T18:00:00Z"}
+        if ref == "ref1":
+            return True, {"status": "failed"}
+        if ref == "ref2":
+            return False, "API request failed"
+        return True, {"status": "abandoned"}
+
+    @patch("apps.payments.management.commands.reconcile_payments.Paystack.verify_payment")
+    def test_reconcile_settles_pending_payments(self, mock_verify):
+        """Test that pending payments are verified in batches and updated in bulk."""
+        mock_verify.side_effect = self.verify
+        out = StringIO()
+
+        call_command("reconcile_payments", "--batch-size=2", "--rate=0", stdout=out)
+
+        statuses = dict(Payment.objects.values_list("ref", "status"))
+        self.assertEqual(statuses["ref0"], PaymentStatus.SUCCESS)
+        self.assertEqual(statuses["ref1"], PaymentStatus.FAILED)
+        self.assertEqual(statuses["ref2"], PaymentStatus.PENDING)
+        self.assertEqual(statuses["ref3"], PaymentStatus.PENDING)
+        self.assertIsNotNone(Payment.objects.get(ref="ref3").checked_at)
+        self.assertIsNone(Payment.objects.get(ref="ref2").checked_at)
+        self.assertIn("Batch 3: 1 verified", out.getvalue())
+
+        run = ReconciliationRun.objects.get()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((run.verified, run.settled, run.errors), (5, 2, 1))
+
+    @patch("apps.payments.management.commands.reconcile_payments.Paystack.verify_payment")
+    def test_reconcile_clears_paid_at_of_failed_payments(self, mock_verify):
+        """Test that a success reversed to failed doesn't keep its paid_at."""
+        mock_verify.side_effect = self.verify
+        Payment.objects.filter(ref="ref1").update(
+            paid_at=timezone.now() - timedelta(days=1)
+        )
+
+        call_command("reconcile_payments", "--rate=0", stdout=StringIO())
+
+        paid_at = dict(Payment.objects.values_list("ref", "paid_at"))
+        self.assertIsNone(paid_at["ref1"])
+        self.assertIsNotNone(paid_at["ref0"])
+
+    @patch("apps.payments.management.commands.reconcile_payments.Paystack.verify_payment")
+    def test_reconcile_resumes_unfinished_run(self, mock_verify):
+        """Test that --resume continues after the last checkpointed payment."""
+        mock_verify.side_effect = self.verify
+        ReconciliationRun.objects.create(last_payment_id=self.payments[2].pk)
+
+        call_command("reconcile_payments", "--resume", "--rate=0", stdout=StringIO())
+
+        verified_refs = {c.args[0] for c in mock_verify.call_args_list}
+        self.assertEqual(verified_refs, {"ref3", "ref4"})
+
+
+class PaymentListViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/"
+        Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=5000,
+            ref="ref1",
+            status=PaymentStatus.SUCCESS,
+            paid_at=timezone.now() - timedelta(days=2),
+        )
+        Payment.objects.create(
+            name="Jane Doe", email="jane@example.com", amount=3000, ref="ref2"
+        )
+
+    def test_filter_by_status_and_email(self):
+        """Test that the list endpoint filters on status and email."""
+        response = self.client.get(self.url, {"status": "pending"})
+        self.assertEqual([p["email"] for p in response.data["results"]], ["jane@example.com"])
+
+        response = self.client.get(self.url, {"email": "john@example.com"})
+        self.assertEqual([p["email"] for p in response.data["results"]], ["john@example.com"])
+
+    def test_filter_by_paid_at_range(self):
+        """Test that the list endpoint filters on a paid_at range."""
+        response = self.client.get(
+            self.url, {"paid_after": (timezone.now() - timedelta(days=3)).isoformat()}
+        )
+        self.assertEqual(len(response.data["results"]), 1)
+
+        response = self.client.get(self.url, {"paid_after": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_status_is_constrained(self):
+        """Test that the database rejects statuses outside PaymentStatus."""
+        with self.assertRaises(IntegrityError):
+            Payment.objects.filter(ref="ref2").update(status="abandoned")
+
+
+class PaymentCursorPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/"
+        created_at = timezone.now()
+        self.payments = [
+            Payment.objects.create(
+                name=f"Customer {i}", email="john@example.com", amount=5000, ref=f"ref{i}"
+            )
+            for i in range(5)
+        ]
+        # Two payments share a timestamp so ties are broken by id.
+        Payment.objects.filter(ref__in=["ref1", "ref2"]).update(created_at=created_at)
+
+    def test_pages_walk_newest_first_without_gaps(self):
+        """Test that following next links returns every payment exactly once."""
+        seen, url = [], f"{self.url}?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen += [p["id"] for p in response.data["results"]]
+            url = response.data["next"]
+
+        expected = list(
+            Payment.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_returns_to_earlier_page(self):
+        """Test that the previous link returns the page the client came from."""
+        first = self.client.get(self.url, {"page_size": 2})
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+
+        self.assertEqual(
+            [p["id"] for p in back.data["results"]],
+            [p["id"] for p in first.data["results"]],
+        )
+        self.assertIsNone(back.data["previous"])
+
+    def test_page_size_is_capped(self):
+        """Test that page_size can't exceed PAYMENTS_MAX_PAGE_SIZE."""
+        with self.settings(PAYMENTS_MAX_PAGE_SIZE=3):
+            response = self.client.get(self.url, {"page_size": 1000})
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected."""
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode(self):
+        """Test that ?pagination=page keeps the page-number format for the admin UI."""
+        response = self.client.get(self.url, {"pagination": "page", "page": 1})
+        self.assertEqual(response.data["count"], 5)
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/"
+        self.payload = {"name": "John Doe", "email": "john@example.com", "amount": "50.00"}
+
+    def post(self, payload=None, key="key-1"):
+        return self.client.post(
+            self.url, payload or self.payload, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_replay_returns_stored_response(self, mock_initialize):
+        """Test that a retried request is answered from the stored response."""
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+
+        first = self.post()
+        with patch("apps.payments.views.PaymentViewset.get_serializer") as mock_serializer:
+            second = self.post()
+            mock_serializer.assert_not_called()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Payment.objects.count(), 1)
+        mock_initialize.assert_called_once()
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_key_reused_with_different_body(self, mock_initialize):
+        """Test that a key can't be reused for a different request body."""
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+        self.post()
+
+        response = self.post({**self.payload, "amount": "60.00"})
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_replay_returns_stored_location(self):
+        """Test that a replayed 202 still says where to poll for the payment."""
+        first = self.client.post(
+            self.url,
+            self.payload,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+            HTTP_PREFER="respond-async",
+        )
+        second = self.client.post(
+            self.url,
+            self.payload,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+            HTTP_PREFER="respond-async",
+        )
+
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(second["Location"], first["Location"])
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_keys_are_scoped_per_caller(self, mock_initialize):
+        """Test that another caller's key doesn't replay someone's response."""
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+        self.post()
+
+        response = self.client.post(
+            self.url,
+            self.payload,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="key-1",
+            REMOTE_ADDR="10.0.0.2",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertEqual(
+            set(IdempotencyKey.objects.values_list("scope", flat=True)),
+            {"ip:127.0.0.1", "ip:10.0.0.2"},
+        )
+
+    @override_settings(TRUSTED_PROXIES=1)
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_keys_are_scoped_per_client_behind_proxies(self, mock_initialize):
+        """Test that clients behind the same proxy get their own scopes."""
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+        for forwarded_for in ["203.0.113.7", "10.9.9.9, 198.51.100.2"]:
+            self.client.post(
+                self.url,
+                self.payload,
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="key-1",
+                HTTP_X_FORWARDED_FOR=forwarded_for,
+            )
+
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertEqual(
+            set(IdempotencyKey.objects.values_list("scope", flat=True)),
+            {"ip:203.0.113.7", "ip:198.51.100.2"},
+        )
+
+    @patch("apps.payments.idempotency.hash_request", return_value="request-hash")
+    def test_in_flight_duplicate_is_rejected(self, mock_hash):
+        """Test that a duplicate of a request still in progress gets a 409."""
+        IdempotencyKey.objects.create(
+            scope="ip:127.0.0.1",
+            key="key-1",
+            request_hash="request-hash",
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+        with self.settings(IDEMPOTENCY_WAIT=0):
+            response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Payment.objects.exists())
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_gateway_failure_releases_key(self, mock_initialize):
+        """Test that a failed initialization can be retried with the same key."""
+        mock_initialize.return_value = (False, "API request failed")
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_sweep_deletes_expired_keys(self):
+        """Test that the TTL sweep only removes expired keys."""
+        now = timezone.now()
+        IdempotencyKey.objects.create(
+            key="old", request_hash="x", expires_at=now - timedelta(seconds=1)
+        )
+        IdempotencyKey.objects.create(
+            key="new", request_hash="x", expires_at=now + timedelta(days=1)
+        )
+
+        call_command("sweep_idempotency_keys", stdout=StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"])
+
+
+class PaymentExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/export/"
+        Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=5000,
+            ref="ref1",
+            status=PaymentStatus.SUCCESS,
+        )
+        Payment.objects.create(
+            name="Jane Doe", email="jane@example.com", amount=3000, ref="ref2"
+        )
+
+    def test_export_csv(self):
+        """Test that the export endpoint streams every payment as CSV."""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(
+            rows[0],
+            ["id", "name", "email", "amount", "currency", "status", "paid_at", "created_at"],
+        )
+        self.assertEqual([row[2] for row in rows[1:]], ["john@example.com", "jane@example.com"])
+        self.assertEqual(rows[1][3], "5000.00")
+
+    def test_export_ndjson_with_status_filter(self):
+        """Test that the export endpoint applies filters and streams NDJSON."""
+        response = self.client.get(self.url, {"output": "ndjson", "status": "pending"})
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["email"], "jane@example.com")
+
+    def test_export_command(self):
+        """Test that export_payments writes the same rows as the endpoint."""
+        out = StringIO()
+
+        call_command("export_payments", "--format=ndjson", "--status=success", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([json.loads(line)["email"] for line in lines], ["john@example.com"])
+
+
+class PaymentCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        payment_cache.clear()
+        cache.clear()
+        self.payment = Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=5000,
+            ref="ref123",
+            status=PaymentStatus.SUCCESS,
+        )
+        self.url = f"/api/v1/payments/{self.payment.id}/"
+
+    def test_settled_payment_is_served_from_cache(self):
+        """Test that repeat retrieves of a settled payment skip the database."""
+        first = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(payment_cache.stats()["misses"], 1)
+        self.assertEqual(payment_cache.stats()["local_hits"], 1)
+
+    def test_shared_backend_fills_local_cache(self):
+        """Test that a local miss falls through to the shared cache."""
+        self.client.get(self.url)
+        payment_cache.local.clear()
+
+        self.client.get(self.url)
+
+        self.assertEqual(payment_cache.stats()["shared_hits"], 1)
+
+    def test_pending_payment_is_not_cached(self):
+        """Test that only terminal statuses are cached."""
+        Payment.objects.filter(pk=self.payment.pk).update(
+            status=PaymentStatus.PENDING, checked_at=timezone.now()
+        )
+
+        self.client.get(self.url)
+
+        self.assertIsNone(payment_cache.get(self.payment.pk))
+
+    def test_status_change_invalidates_cache(self):
+        """Test that settling a payment drops any cached representation."""
+        payment_cache.set(self.payment.pk, {"status": "stale"})
+        Payment.objects.filter(pk=self.payment.pk).update(status=PaymentStatus.PENDING)
+
+        Payment.objects.record_gateway_status("ref123", "failed")
+
+        self.assertIsNone(payment_cache.local.get(payment_cache.key(self.payment.pk)))
+        self.assertEqual(self.client.get(self.url).data["details"]["status"], "failed")
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.payment = Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=5000,
+            ref="ref123",
+            checked_at=timezone.now(),
+        )
+
+    def test_request_records_duration_phases_and_queries(self):
+        """Test that the middleware observes each request once per histogram."""
+        before = metrics.REQUEST_QUERIES.count(view="payment-detail")
+
+        self.client.get(f"/api/v1/payments/{self.payment.id}/")
+
+        self.assertEqual(
+            metrics.REQUEST_QUERIES.count(view="payment-detail"), before + 1
+        )
+        for phase in ["db", "gateway", "serialize", "other"]:
+            self.assertGreater(
+                metrics.PHASE_SECONDS.count(view="payment-detail", phase=phase), 0
+            )
+
+    @patch("requests.Session.request")
+    def test_gateway_calls_record_status_codes(self, mock_request):
+        """Test that Paystack calls are counted by status and leave nothing in flight."""
+        mock_request.return_value.status_code = 502
+        mock_request.return_value.raise_for_status.side_effect = (
+            requests.exceptions.HTTPError("502")
+        )
+        before = metrics.GATEWAY_RESPONSES.value(operation="verify", status=502)
+
+        Paystack().verify_payment("ref123")
+
+        self.assertEqual(
+            metrics.GATEWAY_RESPONSES.value(operation="verify", status=502),
+            before + 1,
+        )
+        self.assertEqual(metrics.GATEWAY_IN_FLIGHT.value(operation="verify"), 0)
+
+    @patch("requests.Session.request")
+    def test_gateway_errors_are_counted(self, mock_request):
+        """Test that calls that never get a response count as errors."""
+        mock_request.side_effect = requests.exceptions.ConnectionError("down")
+        before = metrics.GATEWAY_RESPONSES.value(operation="initialize", status="error")
+
+        Paystack().initialize_payment("ref123", "john@example.com", 500000)
+
+        self.assertEqual(
+            metrics.GATEWAY_RESPONSES.value(operation="initialize", status="error"),
+            before + 1,
+        )
+
+    def test_histogram_renders_cumulative_buckets(self):
+        """Test the Prometheus text rendering of a histogram."""
+        histogram = metrics.Histogram("test_seconds", "Test.", ["view"], buckets=[1, 2])
+        self.addCleanup(metrics.REGISTRY.remove, histogram)
+
+        histogram.observe(0.5, view="a")
+        histogram.observe(1.5, view="a")
+        histogram.observe(3, view="a")
+
+        self.assertEqual(
+            list(histogram.render()),
+            [
+                "# HELP test_seconds Test.",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{view="a",le="1"} 1',
+                'test_seconds_bucket{view="a",le="2"} 2',
+                'test_seconds_bucket{view="a",le="+Inf"} 3',
+                'test_seconds_sum{view="a"} 5',
+                'test_seconds_count{view="a"} 3',
+            ],
+        )
+
+    @override_settings(METRICS_TOKEN="scrape-token")
+    def test_scrape_endpoint(self):
+        """Test that /metrics/ serves the registry in Prometheus text format."""
+        self.client.get(f"/api/v1/payments/{self.payment.id}/")
+
+        response = self.client.get(
+            "/metrics/", HTTP_AUTHORIZATION="Bearer scrape-token"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(
+            'payments_http_request_duration_seconds_count{view="payment-detail",'
+            'method="GET",status="200"}',
+            response.content.decode(),
+        )
+
+    @override_settings(METRICS_TOKEN="scrape-token")
+    def test_scrape_endpoint_requires_token_when_configured(self):
+        """Test that a configured METRICS_TOKEN must be sent as a bearer token."""
+        self.assertEqual(self.client.get("/metrics/").status_code, 401)
+
+        response = self.client.get(
+            "/metrics/", HTTP_AUTHORIZATION="Bearer scrape-token"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_scrape_endpoint_is_closed_without_token(self):
+        """Test that /metrics/ isn't served until METRICS_TOKEN is set."""
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer ")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_pool_threads_count_toward_the_request(self):
+        """Test that time spent in map_in_context's threads is attributed."""
+        timings, token = metrics.start_request()
+        self.addCleanup(metrics.finish_request, token)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(
+                metrics.map_in_context(
+                    pool, lambda _: metrics.add_phase_time("gateway", 1.0), range(4)
+                )
+            )
+
+        self.assertEqual(timings.phases["gateway"], 4.0)
+
+
+class PaymentJobQueueTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/"
+        self.payload = {"name": "John Doe", "email": "john@example.com", "amount": "50.00"}
+
+    def create_async(self):
+        with patch("apps.payments.views.Paystack.initialize_payment") as mock_initialize:
+            response = self.client.post(
+                self.url, self.payload, format="json", HTTP_PREFER="respond-async"
+            )
+        mock_initialize.assert_not_called()
+        return response
+
+    def run_workers(self):
+        call_command("run_payment_workers", "--once", stdout=StringIO())
+
+    def test_async_create_returns_before_gateway(self):
+        """Test that asynchronous creation queues a job and answers 202."""
+        response = self.create_async()
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        payment = Payment.objects.get()
+        self.assertEqual(response.data["details"]["id"], payment.pk)
+        self.assertEqual(payment.status, PaymentStatus.RESERVED)
+        self.assertTrue(response["Location"].endswith(f"/api/v1/payments/{payment.pk}/"))
+        self.assertTrue(PaymentJob.objects.filter(payment=payment).exists())
+
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_worker_fills_in_authorization_url(self, mock_initialize):
+        """Test that a worker initializes the payment and retrieve exposes the URL."""
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+        payment_id = self.create_async().data["details"]["id"]
+
+        self.run_workers()
+
+        payment = Payment.objects.get(pk=payment_id)
+        mock_initialize.assert_called_once_with(
+            payment.ref, "john@example.com", 5000, currency="NGN"
+        )
+        self.assertEqual(payment.status, PaymentStatus.PENDING)
+        self.assertFalse(PaymentJob.objects.exists())
+        details = self.client.get(f"{self.url}{payment_id}/").data["details"]
+        self.assertEqual(details["authorization_url"], "https://paystack.com/authorize")
+
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_failed_job_is_retried_with_backoff(self, mock_initialize):
+        """Test that a gateway failure schedules the job for a later attempt."""
+        mock_initialize.return_value = (False, "Gateway error")
+        self.create_async()
+
+        self.run_workers()
+
+        job = PaymentJob.objects.get()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.last_error, "Gateway error")
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(job.payment.status, PaymentStatus.RESERVED)
+
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_job_is_dead_lettered_after_max_attempts(self, mock_initialize):
+        """Test that a job that keeps failing is kept as a dead letter."""
+        mock_initialize.return_value = (False, "Gateway error")
+        self.create_async()
+
+        with self.settings(PAYMENTS_JOB_MAX_ATTEMPTS=2):
+            self.run_workers()
+            PaymentJob.objects.update(run_after=timezone.now())
+            self.run_workers()
+
+        job = PaymentJob.objects.get()
+        self.assertEqual(job.status, JobStatus.DEAD)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.payment.status, PaymentStatus.INIT_FAILED)
+
+    def test_claimed_jobs_are_skipped_by_other_workers(self):
+        """Test that a job locked by one worker is not claimed by another."""
+        self.create_async()
+        claimed = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with transaction.atomic():
+                list(PaymentJob.objects.select_for_update())
+                claimed.set()
+                release.wait(5)
+            connection.close()
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        claimed.wait(5)
+        try:
+            self.assertEqual(claim_jobs(10), [])
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual(len(claim_jobs(10)), 1)
+
+
+class PaymentBulkCreateTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = "/api/v1/payments/bulk/"
+        self.payload = [
+            {"name": f"Employee {i}", "email": f"employee{i}@example.com", "amount": "50.00"}
+            for i in range(3)
+        ]
+
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_bulk_create_initializes_every_payment(self, mock_initialize):
+        """Test that a batch is inserted and each payment initialized."""
+        mock_initialize.side_effect = lambda ref, email, amount, currency: (
+            True,
+            {"authorization_url": f"https://paystack.com/{email}"},
+        )
+
+        # One INSERT, after checking its refs are unused, then locking the
+        # rows still reserved and one UPDATE for the whole batch, each in a
+        # savepoint with its rollup upsert, and one SELECT of the new values.
+        with self.assertNumQueries(11):
+            response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(mock_initialize.call_count, 3)
+        for i, result in enumerate(response.data["results"]):
+            self.assertEqual(result["status"], "created")
+            self.assertEqual(result["details"]["email"], f"employee{i}@example.com")
+            self.assertEqual(
+                result["payment_url"], f"https://paystack.com/employee{i}@example.com"
+            )
+        self.assertEqual(
+            Payment.objects.filter(status=PaymentStatus.PENDING).count(), 3
+        )
+        self.assertEqual(
+            [result["details"]["updated_at"] for result in response.data["results"]],
+            [
+                data["updated_at"]
+                for data in PaymentSerializer(
+                    Payment.objects.order_by("pk"), many=True
+                ).data
+            ],
+        )
+
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_partial_failure_keeps_successful_items(self, mock_initialize):
+        """Test that one gateway failure doesn't undo the rest of the batch."""
+        mock_initialize.side_effect = lambda ref, email, amount, currency: (
+            (False, "Declined")
+            if email == "employee1@example.com"
+            else (True, {"authorization_url": "https://paystack.com/authorize"})
+        )
+
+        response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["created", "failed", "created"],
+        )
+        self.assertEqual(
+            Payment.objects.get(email="employee1@example.com").status,
+            PaymentStatus.INIT_FAILED,
+        )
+        self.assertEqual(
+            Payment.objects.filter(status=PaymentStatus.PENDING).count(), 2
+        )
+
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_payments_settled_meanwhile_are_left_alone(self, mock_initialize):
+        """Test that a webhook settling a payment mid-batch isn't overwritten."""
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+        map_in_context = metrics.map_in_context
+
+        def settle_first(pool, function, payments):
+            outcomes = list(map_in_context(pool, function, payments))
+            Payment.objects.filter(pk=payments[0].pk).update(
+                status=PaymentStatus.SUCCESS
+            )
+            return outcomes
+
+        with patch("apps.payments.views.metrics.map_in_context", settle_first):
+            response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(
+            [result["details"]["status"] for result in response.data["results"]],
+            [PaymentStatus.SUCCESS, PaymentStatus.PENDING, PaymentStatus.PENDING],
+        )
+        self.assertEqual(
+            Payment.objects.get(email="employee0@example.com").status,
+            PaymentStatus.SUCCESS,
+        )
+        # The settled payment's move out of RESERVED isn't counted twice.
+        self.assertEqual(
+            PaymentRollup.objects.get(status=PaymentStatus.PENDING).count, 2
+        )
+
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_invalid_item_rejects_the_batch(self, mock_initialize):
+        """Test that validation errors are reported per item and nothing is saved."""
+        self.payload[1]["email"] = "not-an-email"
+
+        response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("email", response.data[1])
+        self.assertFalse(Payment.objects.exists())
+        mock_initialize.assert_not_called()
+
+    def test_batch_size_is_capped(self):
+        """Test that oversized batches are refused."""
+        with self.settings(PAYMENTS_BULK_MAX_ITEMS=2):
+            response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_async_bulk_create_queues_jobs(self):
+        """Test that asynchronous mode queues one job per payment."""
+        response = self.client.post(
+            self.url, self.payload, format="json", HTTP_PREFER="respond-async"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(PaymentJob.objects.count(), 3)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]], ["queued"] * 3
+        )
+
+    @override_settings(PAYMENTS_BULK_CONCURRENCY=1)
+    @patch("apps.payments.jobs.Paystack.initialize_payment")
+    def test_batch_too_slow_for_idempotency_lock_is_queued(self, mock_initialize):
+        """Test that a batch that could outlive its Idempotency-Key is queued."""
+        # Two worst-case gateway rounds fit in the default lock timeout.
+        self.assertEqual(sync_bulk_limit(), 2)
+
+        response = self.client.post(self.url, self.payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(PaymentJob.objects.count(), 3)
+        mock_initialize.assert_not_called()
+
+    def test_async_bulk_create_keeps_no_payments_without_jobs(self):
+        """Test that a failed job insert rolls back the batch's payments."""
+        self.client.raise_request_exception = False
+
+        with patch.object(
+            PaymentJob.objects, "bulk_create", side_effect=IntegrityError
+        ):
+            response = self.client.post(
+                self.url, self.payload, format="json", HTTP_PREFER="respond-async"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(Payment.objects.exists())
+
+
+class PaymentFastPathTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Payment.objects.create(
+            name="Jos\u00e9 \u2028 \U0001f600 \"Quoted\"",
+            email="jose@example.com",
+            amount="0.10",
+            ref="ref1",
+        )
+        Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount="12345678.90",
+            ref="ref2",
+            status=PaymentStatus.SUCCESS,
+            authorization_url="https://paystack.com/authorize",
+            paid_at=timezone.now().replace(microsecond=123456),
+        )
+
+    def render_both_ways(self):
+        fast = FastJSONRenderer().render(
+            payment_rows.rows(Payment.objects.values(*payment_rows.fields))
+        )
+        slow = JSONRenderer().render(
+            PaymentSerializer(Payment.objects.all(), many=True).data
+        )
+        return fast, slow
+
+    def test_fast_path_matches_model_serializer(self):
+        """Test that rows and orjson render byte for byte like the DRF path."""
+        fast, slow = self.render_both_ways()
+
+        self.assertEqual(fast, slow)
+
+    def test_fast_path_follows_active_timezone(self):
+        """Test that datetimes are converted like DateTimeField does."""
+        with timezone.override("Africa/Lagos"):
+            fast, slow = self.render_both_ways()
+
+        self.assertIn(b"+01:00", fast)
+        self.assertEqual(fast, slow)
+
+    def test_list_response_matches_model_serializer(self):
+        """Test that the list endpoint's bytes are unchanged by the fast path."""
+        response = self.client.get("/api/v1/payments/")
+
+        expected = JSONRenderer().render(
+            {
+                "next": None,
+                "previous": None,
+                "results": PaymentSerializer(Payment.objects.all(), many=True).data,
+            }
+        )
+        self.assertEqual(response.content, expected)
+
+    def test_retrieve_response_matches_model_serializer(self):
+        """Test that retrieve renders the same details as PaymentSerializer."""
+        payment = Payment.objects.get(ref="ref2")
+
+        response = self.client.get(f"/api/v1/payments/{payment.pk}/")
+
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render(
+                {
+                    "details": PaymentSerializer(payment).data,
+                    "message": "Payment details retrieved successfully",
+                }
+            ),
+        )
+
+    def test_indented_output_uses_stock_renderer(self):
+        """Test that requests for indented JSON are still honoured."""
+        response = self.client.get(
+            "/api/v1/payments/", HTTP_ACCEPT="application/json; indent=4"
+        )
+
+        self.assertIn(b'\n    "results"', response.content)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], REPLICA_MAX_LAG=5)
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        routers.monitor.status.clear()
+        self.addCleanup(routers.monitor.status.clear)
+
+    def read_alias(self, lag=0):
+        with patch.object(routers.monitor, "measure_lag", return_value=lag):
+            return self.router.db_for_read(Payment)
+
+    def test_reads_use_primary_outside_replica_reads(self):
+        """Test that only reads that opt in go to a replica."""
+        self.assertEqual(self.read_alias(), "default")
+
+    def test_replica_reads_use_healthy_replica(self):
+        """Test that reads in replica_reads() go to an up-to-date replica."""
+        with routers.replica_reads():
+            self.assertEqual(self.read_alias(lag=1.5), "replica")
+
+    def test_lagging_or_failed_replica_falls_back_to_primary(self):
+        """Test that replicas lagging too far or down are skipped."""
+        with routers.replica_reads():
+            self.assertEqual(self.read_alias(lag=30), "default")
+            routers.monitor.status.clear()
+            self.assertEqual(self.read_alias(lag=None), "default")
+
+    def test_lag_is_cached_between_checks(self):
+        """Test that replica lag isn't measured on every read."""
+        with routers.replica_reads(), patch.object(
+            routers.monitor, "measure_lag", return_value=0
+        ) as measure_lag:
+            for _ in range(3):
+                self.router.db_for_read(Payment)
+
+        self.assertEqual(measure_lag.call_count, 1)
+
+    def test_reads_after_write_use_primary(self):
+        """Test that a request reads its own writes."""
+        with routers.replica_reads():
+            self.router.db_for_write(Payment)
+            self.assertEqual(self.read_alias(), "default")
+
+    def test_migrations_skip_replicas(self):
+        self.assertTrue(self.router.allow_migrate("default", "payments"))
+        self.assertFalse(self.router.allow_migrate("replica", "payments"))
+
+    def test_middleware_pins_client_to_primary_after_write(self):
+        """Test that a write sets the cookie keeping the next reads on the primary."""
+
+        def write(request):
+            Payment.objects.create(
+                name="John Doe", email="john@example.com", amount="10.00", ref="ref1"
+            )
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(write)
+        response = middleware(RequestFactory().post("/api/v1/payments/"))
+
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]["max-age"], 10)
+        self.assertTrue(response.cookies[PRIMARY_COOKIE]["httponly"])
+
+        def read(request):
+            with routers.replica_reads():
+                return HttpResponse(self.read_alias())
+
+        request = RequestFactory().get("/api/v1/payments/")
+        request.COOKIES[PRIMARY_COOKIE] = "1"
+        response = ReplicaRoutingMiddleware(read)(request)
+
+        self.assertEqual(response.content, b"default")
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_export_reads_from_replica(self):
+        """Test that the streamed export is bound to the replica it picked."""
+        with patch(
+            "apps.payments.views.read_database", return_value="replica"
+        ), patch("apps.payments.views.export_rows", return_value=iter([])) as rows:
+            self.client.get("/api/v1/payments/export/")
+
+        self.assertEqual(rows.call_args.args[0].db, "replica")
+
+
+class PaymentRollupTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.today = timezone.now().date()
+        self.payment = Payment.objects.create(
+            name="John Doe", email="john@example.com", amount="10.00", ref="ref1"
+        )
+        Payment.objects.create(
+            name="Jane Doe",
+            email="jane@example.com",
+            amount="2.50",
+            ref="ref2",
+            status=PaymentStatus.SUCCESS,
+        )
+
+    def rollups(self):
+        return {
+            (rollup.day, rollup.status, rollup.currency): (
+                rollup.count,
+                rollup.amount_minor,
+            )
+            for rollup in PaymentRollup.objects.exclude(count=0)
+        }
+
+    def test_creation_is_counted(self):
+        """Test that new payments are added to their day's rollups."""
+        self.assertEqual(
+            self.rollups(),
+            {
+                (self.today, PaymentStatus.PENDING, "NGN"): (1, 1000),
+                (self.today, PaymentStatus.SUCCESS, "NGN"): (1, 250),
+            },
+        )
+
+    def test_status_changes_move_payment_between_rollups(self):
+        """Test that settling a payment moves it out of the pending rollup."""
+        Payment.objects.record_gateway_status("ref1", "success")
+
+        self.assertEqual(
+            self.rollups(),
+            {(self.today, PaymentStatus.SUCCESS, "NGN"): (2, 1250)},
+        )
+
+    def test_currencies_are_counted_separately(self):
+        Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount="4.00",
+            currency="USD",
+            ref="ref3",
+        )
+
+        self.assertEqual(
+            self.rollups()[self.today, PaymentStatus.PENDING, "USD"], (1, 400)
+        )
+
+    def test_transition_only_counts_payments_that_moved(self):
+        """Test that a transition from a status the payment left is a no-op."""
+        moved = Payment.objects.transition(
+            self.payment, PaymentStatus.RESERVED, PaymentStatus.INIT_FAILED
+        )
+
+        self.assertFalse(moved)
+        self.assertNotIn(
+            (self.today, PaymentStatus.INIT_FAILED, "NGN"), self.rollups()
+        )
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """Test that rebuilding from the payments gives the same rollups."""
+        Payment.objects.record_gateway_status("ref1", "failed")
+        expected = self.rollups()
+        PaymentRollup.objects.update(count=0, amount_minor=0)
+
+        call_command("rebuild_payment_rollups", stdout=StringIO())
+
+        self.assertEqual(self.rollups(), expected)
+
+    def test_rebuild_recomputes_each_day(self):
+        """Test that a rebuild spanning several days recounts every one."""
+        Payment.objects.filter(ref="ref2").update(
+            created_at=timezone.now() - timedelta(days=3)
+        )
+        PaymentRollup.objects.all().delete()
+
+        written = PaymentRollup.objects.rebuild()
+
+        self.assertEqual(written, 2)
+        self.assertEqual(
+            self.rollups(),
+            {
+                (self.today, PaymentStatus.PENDING, "NGN"): (1, 1000),
+                (
+                    self.today - timedelta(days=3),
+                    PaymentStatus.SUCCESS,
+                    "NGN",
+                ): (1, 250),
+            },
+        )
+
+    def test_summary_reads_only_rollups(self):
+        """Test that the report is one query on the rollups."""
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/v1/payments/summary/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["totals"],
+            {
+                PaymentStatus.PENDING: {"count": 1, "amount": "10.00"},
+                PaymentStatus.SUCCESS: {"count": 1, "amount": "2.50"},
+            },
+        )
+        self.assertEqual(response.data["days"][0]["day"], self.today)
+
+    def test_summary_is_per_currency(self):
+        response = self.client.get("/api/v1/payments/summary/?currency=USD")
+
+        self.assertEqual(response.data["currency"], "USD")
+        self.assertEqual(response.data["totals"], {})
+
+    def test_summary_filters_by_day(self):
+        tomorrow = self.today + timedelta(days=1)
+
+        response = self.client.get(f"/api/v1/payments/summary/?since={tomorrow}")
+
+        self.assertEqual(response.data, {"currency": "NGN", "totals": {}, "days": []})
+
+    def test_summary_rejects_invalid_dates(self):
+        response = self.client.get("/api/v1/payments/summary/?until=yesterday")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PaymentPartitionTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        self.old = Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount="10.00",
+            ref="ref1",
+            status=PaymentStatus.SUCCESS,
+        )
+        Payment.objects.filter(pk=self.old.pk).update(
+            created_at=timezone.now() - timedelta(days=730)
+        )
+        self.old.refresh_from_db()
+
+    def archive(self, keep_months=12):
+        # Pretend a year has gone by since the oldest partition ended.
+        oldest = partitions.partitions()[0]
+        now = partitions.add_months(oldest.end, keep_months)
+        with patch(
+            "apps.payments.management.commands.archive_payment_partitions.timezone.now",
+            return_value=now,
+        ):
+            call_command(
+                "archive_payment_partitions",
+                keep_months=keep_months,
+                output_dir=self.archive_dir.name,
+                stdout=StringIO(),
+            )
+        return oldest
+
+    def test_payments_are_stored_in_partitions(self):
+        """Test that the payments table is partitioned up to months ahead."""
+        ahead = partitions.add_months(partitions.month_start(timezone.now()), 3)
+
+        self.assertGreaterEqual(partitions.partitions()[-1].end, ahead)
+
+    def test_create_partitions_fills_months_ahead(self):
+        """Test that partitions are added up to --months ahead, once."""
+        call_command("create_payment_partitions", months=6, stdout=StringIO())
+        newest = partitions.partitions()[-1]
+        call_command("create_payment_partitions", months=6, stdout=StringIO())
+
+        current = partitions.month_start(timezone.now())
+        self.assertEqual(newest.end, partitions.add_months(current, 7))
+        self.assertEqual(partitions.partitions()[-1], newest)
+
+    def test_refs_stay_unique_across_creation_times(self):
+        """Test that a ref already used at another created_at is refused."""
+        with self.assertRaises(IntegrityError):
+            Payment.objects.create(
+                name="Jane Doe", email="jane@example.com", amount="20.00", ref="ref1"
+            )
+        with self.assertRaises(IntegrityError):
+            Payment.objects.bulk_create(
+                [
+                    Payment(name="A", email="a@example.com", amount=1, ref=ref)
+                    for ref in ["ref2", "ref2"]
+                ]
+            )
+
+    def test_lookups_by_id_only_search_partitions_that_can_hold_it(self):
+        """Test that with_id lets Postgres skip the other partitions."""
+        newest = partitions.partitions()[-1]
+        payment = Payment.objects.create(
+            name="Jane Doe", email="jane@example.com", amount="20.00", ref="ref2"
+        )
+        Payment.objects.filter(pk=payment.pk).update(created_at=newest.start)
+        partitions.clear_id_ranges()
+
+        new_plan = Payment.objects.with_id(payment.pk).explain()
+        old_plan = Payment.objects.with_id(self.old.pk).explain()
+
+        self.assertEqual(Payment.objects.with_id(payment.pk).get().ref, "ref2")
+        self.assertEqual(Payment.objects.with_id(self.old.pk).get().ref, "ref1")
+        self.assertNotIn("payments_payment_legacy", new_plan)
+        self.assertNotIn(newest.name, old_plan)
+
+    def test_archive_detaches_old_partitions(self):
+        """Test that partitions past retention are moved to archive files."""
+        oldest = self.archive()
+
+        archive = PaymentArchive.objects.get()
+        self.assertEqual(archive.table, oldest.name)
+        self.assertTrue(os.path.exists(archive.path))
+        self.assertNotIn(oldest, partitions.partitions())
+        self.assertFalse(Payment.objects.filter(pk=self.old.pk).exists())
+
+    def test_retrieve_reads_archived_payments(self):
+        """Test that retrieve by id still finds archived payments."""
+        expected = PaymentSerializer(self.old).data
+        self.archive()
+
+        response = self.client.get(f"/api/v1/payments/{self.old.pk}/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["details"], expected)
+
+    def test_lookup_reads_archived_payments(self):
+        """Test that lookup by id or ref still finds archived payments."""
+        expected = PaymentSerializer(self.old).data
+        self.archive()
+
+        response = self.client.post(
+            "/api/v1/payments/lookup/",
+            {"ids": [self.old.pk], "refs": ["ref1", "missing"]},
+            format="json",
+        )
+
+        self.assertEqual(response.data["results"], [expected])
+        self.assertEqual(response.data["missing"], {"ids": [], "refs": ["missing"]})
+
+    def test_retrieve_unknown_payment_after_archive(self):
+        self.archive()
+
+        response = self.client.get(f"/api/v1/payments/{self.old.pk + 1000}/")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild_keeps_rollups_of_archived_days(self):
+        """Test that rebuilding the rollups doesn't drop archived payments."""
+        day = self.old.created_at.date()
+        # setUp backdated the payment behind the rollups' back.
+        PaymentRollup.objects.rebuild()
+        self.archive()
+
+        call_command("rebuild_payment_rollups", stdout=StringIO())
+        call_command("rebuild_payment_rollups", since="2000-01-01", stdout=StringIO())
+
+        rollup = PaymentRollup.objects.get(day=day, status=PaymentStatus.SUCCESS)
+        self.assertEqual((rollup.count, rollup.amount_minor), (1, 1000))
+
+    @patch("apps.payments.partitions.ARCHIVE_CHUNK_ROWS", 2)
+    def test_archive_lookup_seeks_to_its_chunk(self):
+        """Test that archived payments are found through the archive index."""
+        others = [
+            Payment.objects.create(
+                name="Jane Doe",
+                email="jane@example.com",
+                amount="20.00",
+                ref=f"ref{i}",
+                status=PaymentStatus.SUCCESS,
+            )
+            for i in range(2, 6)
+        ]
+        Payment.objects.filter(pk__in=[p.pk for p in others]).update(
+            created_at=self.old.created_at
+        )
+        last = others[-1]
+        self.archive()
+
+        archive = PaymentArchive.objects.get()
+        with open(f"{archive.path}.idx") as index_file:
+            self.assertEqual(len(json.load(index_file)), 3)
+        self.assertGreater(partitions.archive_offset(archive.path, last.pk), 0)
+        self.assertEqual(partitions.find_archived(last.pk).ref, "ref5")
+        self.assertEqual(partitions.find_archived(self.old.pk).ref, "ref1")
+        self.assertEqual(
+            [p.pk for p in partitions.find_archived_many(refs=["ref5", "ref3"])],
+            [last.pk, others[1].pk],
+        )
+
+
+class MinorUnitAmountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_gateway_receives_exact_minor_units(self, mock_initialize):
+        """Test that amounts float rounding used to truncate reach Paystack exactly."""
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+
+        response = self.client.post(
+            "/api/v1/payments/",
+            {"name": "John Doe", "email": "john@example.com", "amount": "0.29"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(mock_initialize.call_args.args[2], 29)
+        self.assertEqual(response.data["details"]["amount"], "0.29")
+        self.assertEqual(Payment.objects.get().amount_minor, 29)
+
+    def test_amounts_finer_than_minor_unit_are_rejected(self):
+        serializer = PaymentSerializer(
+            data={"name": "John Doe", "email": "john@example.com", "amount": "1.005"}
+        )
+
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("amount", serializer.errors)
+
+    def test_amounts_beyond_ten_digits_are_rejected(self):
+        data = {"name": "John Doe", "email": "john@example.com"}
+
+        self.assertTrue(
+            PaymentSerializer(data={**data, "amount": "99999999.99"}).is_valid()
+        )
+        serializer = PaymentSerializer(data={**data, "amount": "100000000.00"})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("amount", serializer.errors)
+
+    def test_unknown_currencies_are_rejected(self):
+        serializer = PaymentSerializer(
+            data={
+                "name": "John Doe",
+                "email": "john@example.com",
+                "amount": "10.00",
+                "currency": "XYZ",
+            }
+        )
+
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("currency", serializer.errors)
+
+    def test_amount_property_converts_major_units(self):
+        payment = Payment(name="John Doe", email="john@example.com", amount="12.34")
+
+        self.assertEqual(payment.amount_minor, 1234)
+        self.assertEqual(payment.amount, Decimal("12.34"))
+
+
+class PaymentRefTest(TestCase):
+    def test_refs_are_short_and_sort_by_creation_time(self):
+        refs = [new_ref(now=1_700_000_000 + i) for i in range(3)]
+
+        self.assertTrue(all(len(ref) == REF_LENGTH for ref in refs))
+        self.assertEqual(refs, sorted(refs))
+        self.assertEqual(ref_time(refs[1]), 1_700_000_001)
+        self.assertNotEqual(new_ref(now=1_700_000_000), refs[0])
+
+    @patch("apps.payments.views.Paystack.initialize_payment")
+    def test_create_issues_ulid_refs(self, mock_initialize):
+        mock_initialize.return_value = (
+            True,
+            {"authorization_url": "https://paystack.com/authorize"},
+        )
+
+        APIClient().post(
+            "/api/v1/payments/",
+            {"name": "John Doe", "email": "john@example.com", "amount": "50.00"},
+            format="json",
+        )
+
+        payment = Payment.objects.get()
+        self.assertEqual(len(payment.ref), REF_LENGTH)
+        self.assertAlmostEqual(
+            ref_time(payment.ref), payment.created_at.timestamp(), delta=5
+        )
+
+    def test_gateway_status_resolves_new_and_legacy_refs(self):
+        """Test that ULID refs are looked up by time and legacy refs still resolve."""
+        legacy_ref = "x" * LEGACY_REF_LENGTH
+        for ref in [new_ref(), legacy_ref]:
+            Payment.objects.create(
+                name="John Doe",
+                email="john@example.com",
+                amount=Decimal("10.00"),
+                ref=ref,
+                status=PaymentStatus.PENDING,
+            )
+
+            self.assertEqual(Payment.objects.record_gateway_status(ref, "success"), 1)
+            self.assertEqual(Payment.objects.get(ref=ref).status, PaymentStatus.SUCCESS)
+
+    def test_with_ref_bounds_created_at(self):
+        ref = new_ref(now=(timezone.now() - timedelta(days=30)).timestamp())
+        Payment.objects.create(
+            name="John Doe", email="john@example.com", amount=Decimal("10.00"), ref=ref
+        )
+
+        # created_at is now, nowhere near the time in the ref.
+        self.assertFalse(Payment.objects.with_ref(ref).exists())
+
+
+class VerifyCoalescingTest(TestCase):
+    def setUp(self):
+        verifier.clear()
+
+    @patch("apps.payments.verification.Paystack.verify_payment")
+    def test_concurrent_threads_share_one_verification(self, mock_verify):
+        def verify_payment(ref):
+            time.sleep(0.2)
+            return True, {"status": "success", "paid_at": None}
+
+        mock_verify.side_effect = verify_payment
+        results = []
+
+        with patch.object(Payment.objects, "record_gateway_status") as mock_record:
+            threads = [
+                threading.Thread(target=lambda: results.append(verifier.verify("ref1")))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [True] * 8)
+        mock_verify.assert_called_once_with("ref1")
+        mock_record.assert_called_once_with("ref1", "success", None)
+
+    @patch("apps.payments.verification.AsyncPaystack.verify_payment")
+    async def test_concurrent_coroutines_share_one_verification(self, mock_verify):
+        async def verify_payment(ref):
+            await asyncio.sleep(0.1)
+            return True, {"status": "ongoing"}
+
+        mock_verify.side_effect = verify_payment
+
+        results = await asyncio.gather(*[verifier.averify("ref1") for _ in range(10)])
+
+        self.assertEqual(results, [True] * 10)
+        mock_verify.assert_called_once_with("ref1")
+
+    @patch("apps.payments.verification.Paystack.verify_payment")
+    def test_unsettled_ref_is_not_verified_again_within_ttl(self, mock_verify):
+        mock_verify.return_value = (False, "API request failed")
+
+        self.assertFalse(verifier.verify("ref1"))
+        self.assertFalse(verifier.verify("ref1"))
+        self.assertFalse(verifier.verify("ref2"))
+
+        self.assertEqual(
+            [call.args for call in mock_verify.call_args_list], [("ref1",), ("ref2",)]
+        )
+
+        with self.settings(PAYSTACK_VERIFY_NEGATIVE_TTL=0):
+            verifier.verify("ref3")
+            verifier.verify("ref3")
+        self.assertEqual(mock_verify.call_count, 4)
+
+    @patch("apps.payments.verification.Paystack.verify_payment")
+    def test_settled_ref_is_not_remembered(self, mock_verify):
+        mock_verify.return_value = (True, {"status": "failed", "paid_at": None})
+
+        verifier.verify("ref1")
+        verifier.verify("ref1")
+
+        self.assertEqual(mock_verify.call_count, 2)
+
+
+class PaymentStatusStreamTest(TransactionTestCase):
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=Decimal("50.00"),
+            ref="ref1",
+            status=PaymentStatus.PENDING,
+        )
+        self.url = f"/api/v1/async/payments/{self.payment.id}/events/"
+
+    def tearDown(self):
+        # Its LISTEN connection would keep the test database from being dropped.
+        broker.stop()
+
+    async def next_event(self, response):
+        chunk = await asyncio.wait_for(anext(aiter(response.streaming_content)), 5)
+        event, data = chunk.decode().split("\n")[:2]
+        self.assertEqual(event, "event: payment")
+        return json.loads(data.removeprefix("data: "))
+
+    async def test_status_change_is_pushed(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        async def settle():
+            await asyncio.sleep(0.2)
+            await Payment.objects.filter(pk=self.payment.pk).aupdate(
+                status=PaymentStatus.SUCCESS
+            )
+
+        data, _ = await asyncio.gather(self.next_event(response), settle())
+
+        self.assertEqual(data["id"], self.payment.id)
+        self.assertEqual(data["status"], PaymentStatus.SUCCESS)
+
+    async def test_settled_payment_is_sent_immediately(self):
+        await Payment.objects.filter(pk=self.payment.pk).aupdate(
+            status=PaymentStatus.FAILED
+        )
+
+        response = await self.async_client.get(self.url)
+
+        data = await self.next_event(response)
+        self.assertEqual(data["status"], PaymentStatus.FAILED)
+
+    async def test_change_since_known_status_is_sent_immediately(self):
+        response = await self.async_client.get(self.url + "?status=reserved")
+
+        data = await self.next_event(response)
+        self.assertEqual(data["status"], PaymentStatus.PENDING)
+
+    async def test_quiet_stream_sends_heartbeats_and_times_out(self):
+        with self.settings(PAYMENTS_STREAM_HEARTBEAT=0.1, PAYMENTS_STREAM_TIMEOUT=0.35):
+            response = await self.async_client.get(self.url)
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertGreaterEqual(len(chunks), 2)
+        self.assertTrue(all(chunk == b": keepalive\n\n" for chunk in chunks))
+
+    async def test_unknown_payment_is_not_found(self):
+        response = await self.async_client.get("/api/v1/async/payments/999999/events/")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PaymentLookupTest(TestCase):
+    def setUp(self):
+        verifier.clear()
+        payment_cache.clear()
+        cache.clear()
+        self.client = APIClient()
+        self.url = "/api/v1/payments/lookup/"
+        self.payments = [
+            Payment.objects.create(
+                name="John Doe",
+                email="john@example.com",
+                amount=Decimal("50.00"),
+                ref=f"ref{i}",
+                status=PaymentStatus.PENDING,
+                checked_at=timezone.now(),
+            )
+            for i in range(4)
+        ]
+        # Keep the per-partition id ranges from being read mid-test.
+        partitions.clear_id_ranges()
+        partitions.id_ranges()
+
+    @patch("apps.payments.views.Paystack.verify_payment")
+    def test_lookup_by_ids_and_refs_in_one_query(self, mock_verify):
+        # One for the payments, one for the archives the missing ones may be in.
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                self.url,
+                {
+                    "ids": [self.payments[0].id, self.payments[1].id, 999999],
+                    "refs": ["ref1", "ref2", "missing"],
+                },
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(data["id"] for data in response.data["results"]),
+            [payment.id for payment in self.payments[:3]],
+        )
+        self.assertEqual(
+            response.data["missing"], {"ids": [999999], "refs": ["missing"]}
+        )
+        mock_verify.assert_not_called()
+
+    @override_settings(PAYMENTS_LOOKUP_CONCURRENCY=2)
+    @patch("apps.payments.views.Paystack.verify_payment")
+    def test_stale_pending_payments_are_verified_concurrently(self, mock_verify):
+        Payment.objects.update(checked_at=None)
+        lock = threading.Lock()
+        calls = {"in_flight": 0, "peak": 0}
+
+        def verify_payment(ref):
+            with lock:
+                calls["in_flight"] += 1
+                calls["peak"] = max(calls["peak"], calls["in_flight"])
+            time.sleep(0.1)
+            with lock:
+                calls["in_flight"] -= 1
+            if ref == "ref3":
+                return False, "API request failed"
+            return True, {"status": "success", "paid_at": "2025-03-20T18:00:00Z"}
+
+        mock_verify.side_effect = verify_payment
+
+        response = self.client.post(
+            self.url,
+            {"ids": [payment.id for payment in self.payments]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = {data["id"]: data["status"] for data in response.data["results"]}
+        self.assertEqual(
+            statuses,
+            {
+                self.payments[0].id: PaymentStatus.SUCCESS,
+                self.payments[1].id: PaymentStatus.SUCCESS,
+                self.payments[2].id: PaymentStatus.SUCCESS,
+                self.payments[3].id: PaymentStatus.PENDING,
+            },
+        )
+        self.assertEqual(mock_verify.call_count, 4)
+        self.assertEqual(calls["peak"], 2)
+
+    def test_settled_payments_are_served_from_cache(self):
+        """Test that a repeated lookup of settled payments reads no rows."""
+        Payment.objects.filter(pk=self.payments[0].pk).update(
+            status=PaymentStatus.SUCCESS
+        )
+        body = {"ids": [self.payments[0].id, self.payments[1].id]}
+        first = self.client.post(self.url, body, format="json")
+
+        with self.assertNumQueries(0):
+            cached = self.client.post(
+                self.url, {"ids": [self.payments[0].id]}, format="json"
+            )
+
+        self.assertIn(cached.data["results"][0], first.data["results"])
+        self.assertEqual(cached.data["results"][0]["status"], PaymentStatus.SUCCESS)
+
+    def test_fields_limits_the_results(self):
+        response = self.client.post(
+            f"{self.url}?fields=id,status",
+            {"refs": ["ref0"]},
+            format="json",
+        )
+
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.payments[0].id, "status": PaymentStatus.PENDING}],
+        )
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.post(
+            f"{self.url}?fields=ref", {"refs": ["ref0"]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PAYMENTS_LOOKUP_MAX_ITEMS=3)
+    def test_batch_size_is_limited(self):
+        response = self.client.post(
+            self.url, {"ids": [1, 2], "refs": ["a", "b"]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_empty_lookup_is_rejected(self):
+        response = self.client.post(self.url, {}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        payment_cache.clear()
+        cache.clear()
+        self.client = APIClient()
+        self.payment = Payment.objects.create(
+            name="John Doe",
+            email="john@example.com",
+            amount=Decimal("50.00"),
+            ref="ref1",
+            status=PaymentStatus.PENDING,
+            checked_at=timezone.now(),
+        )
+        self.url = f"/api/v1/payments/{self.payment.id}/"
+
+    def test_unchanged_payment_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn("Last-Modified", first)
+
+        with patch.object(payment_rows, "instance") as mock_instance:
+            second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second["ETag"], first["ETag"])
+        mock_instance.assert_not_called()
+
+    def test_if_modified_since_sees_changes_within_the_second(self):
+        """Test that a change after the date, in the same second, isn't a 304."""
+        second = timezone.now().replace(microsecond=0) - timedelta(seconds=10)
+        Payment.objects.filter(pk=self.payment.pk).update(
+            updated_at=second + timedelta(milliseconds=200)
+        )
+
+        stale = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=http_date(second.timestamp())
+        )
+        first = self.client.get(self.url)
+        current = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]
+        )
+
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+        self.assertEqual(first["Last-Modified"], http_date(second.timestamp() + 1))
+        self.assertEqual(current.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_last_modified_within_its_second_never_matches(self):
+        """Test that a date that can't rule out later changes gets no 304."""
+        second = timezone.now().replace(microsecond=0) - timedelta(seconds=10)
+        Payment.objects.filter(pk=self.payment.pk).update(
+            updated_at=second + timedelta(milliseconds=200)
+        )
+
+        with patch(
+            "apps.payments.conditional.timezone.now",
+            return_value=second + timedelta(milliseconds=500),
+        ):
+            first = self.client.get(self.url)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]
+        )
+
+        self.assertEqual(first["Last-Modified"], http_date(second.timestamp()))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_status_change_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        Payment.objects.filter(pk=self.payment.pk).update(checked_at=timezone.now())
+        self.assertEqual(self.client.get(self.url)["ETag"], etag)
+
+        Payment.objects.record_gateway_status("ref1", "success")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["details"]["status"], PaymentStatus.SUCCESS)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_rewriting_unchanged_values_keeps_etag(self):
+        """Test that a bulk update that only moves checked_at isn't a change."""
+        etag = self.client.get(self.url)["ETag"]
+
+        self.payment.checked_at = timezone.now()
+        Payment.objects.bulk_update(
+            [self.payment], ["status", "paid_at", "checked_at"]
+        )
+
+        self.assertEqual(self.client.get(self.url)["ETag"], etag)
+
+    def test_cached_payment_is_not_modified_without_queries(self):
+        Payment.objects.filter(pk=self.payment.pk).update(status=PaymentStatus.FAILED)
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_fields_trim_the_representation(self):
+        full = self.client.get(self.url)
+        response = self.client.get(self.url, {"fields": "status"})
+
+        self.assertEqual(response.data["details"], {"status": PaymentStatus.PENDING})
+        self.assertNotEqual(response["ETag"], full["ETag"])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(self.url, {"fields": "status,secret"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_is_not_modified_until_a_payment_changes(self):
+        url = "/api/v1/payments/?fields=id,status"
+        first = self.client.get(url)
+        self.assertEqual(
+            first.json()["results"], [{"id": self.payment.id, "status": "pending"}]
+        )
+
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+
+        Payment.objects.filter(pk=self.payment.pk).update(status=PaymentStatus.FAILED)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code,
+            status.HTTP_200_OK,
+        )
+
+    async def test_async_retrieve_is_not_modified(self):
+        url = f"/api/v1/async/payments/{self.payment.id}/"
+        first = await self.async_client.get(url, {"fields": "status"})
+        self.assertEqual(first.json()["details"], {"status": "pending"})
+
+        second = await self.async_client.get(
+            url, {"fields": "status"}, headers={"If-None-Match": first["ETag"]}
+        )
+
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
@@ -1,11 +1,28 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PaymentViewset
+from .views import PaymentViewset, PaystackWebhookView
+from .async_views import (
+    AsyncPaymentListView,
+    AsyncPaymentDetailView,
+    AsyncPaymentStatusStreamView,
+)
 
 router = DefaultRouter()
 router.register(r"payments", PaymentViewset)
 
 
 urlpatterns=[
+    path("payments/webhook/", PaystackWebhookView.as_view(), name="paystack-webhook"),
+    path("async/payments/", AsyncPaymentListView.as_view(), name="payment-async-list"),
+    path(
+        "async/payments/<int:pk>/",
+        AsyncPaymentDetailView.as_view(),
+        name="payment-async-detail",
+    ),
+    path(
+        "async/payments/<int:pk>/events/",
+        AsyncPaymentStatusStreamView.as_view(),
+        name="payment-async-events",
+    ),
     path("", include(router.urls))
 ]
\ No newline at end of file
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from .metrics import map_in_context
+from .models import GATEWAY_STATUSES, Payment
+from .paystack import AsyncPaystack, Paystack
+import asyncio
+import threading
+import time
+
+
+class VerifyCoalescer:
+    """
+    Verifies pending payments with Paystack on behalf of the retrieve views.
+
+    Concurrent callers for the same ref share one verify call per process,
+    whether they come from threads or from event loops, and a ref Paystack
+    hasn't settled isn't verified again for PAYSTACK_VERIFY_NEGATIVE_TTL
+    seconds. `verify` and `averify` return whether Paystack answered and its
+    status was recorded, i.e. whether the caller should re-read the payment.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        # ref -> monotonic time it may be verified again, oldest first.
+        self._unsettled = OrderedDict()
+
+    def _join(self, ref):
+        """
+        Returns `(future, True)` when the caller should verify `ref` and
+        resolve the future, `(future, False)` when it should wait on another
+        caller's, or `(None, False)` when `ref` was verified too recently.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._unsettled and next(iter(self._unsettled.values())) <= now:
+                self._unsettled.popitem(last=False)
+            if self._unsettled.get(ref, now) > now:
+                return None, False
+
+            future = self._flights.get(ref)
+            if future is not None:
+                return future, False
+
+            future = self._flights[ref] = Future()
+            # A running future can't be cancelled by a waiter giving up.
+            future.set_running_or_notify_cancel()
+            return future, True
+
+    def _land(self, ref, future, verified, settled):
+        with self._lock:
+            del self._flights[ref]
+            if not settled:
+                self._unsettled.pop(ref, None)
+                self._unsettled[ref] = (
+                    time.monotonic() + settings.PAYSTACK_VERIFY_NEGATIVE_TTL
+                )
+        future.set_result(verified)
+
+    def _record(self, ref, ok, data):
+        """Record a verify result; returns `(verified, settled)`."""
+        if not ok:
+            return False, False
+        Payment.objects.record_gateway_status(
+            ref, data.get("status"), data.get("paid_at")
+        )
+        return True, data.get("status") in GATEWAY_STATUSES
+
+    def verify(self, ref):
+        future, leader = self._join(ref)
+        if future is None:
+            return False
+        if not leader:
+            return future.result()
+
+        verified = settled = False
+        try:
+            verified, settled = self._record(
+                ref, *Paystack.client().verify_payment(ref)
+            )
+        finally:
+            self._land(ref, future, verified, settled)
+        return verified
+
+    def verify_many(self, refs, concurrency):
+        """
+        `verify` for a batch of refs, with at most `concurrency` gateway
+        calls at a time. Results are recorded from the calling thread, so
+        the pool never holds a database connection. Returns the set of refs
+        that were verified.
+        """
+        flights = {ref: self._join(ref) for ref in set(refs)}
+        leading = [ref for ref, (_future, leader) in flights.items() if leader]
+        verified = set()
+
+        pending = set(leading)
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = map_in_context(
+                    pool, Paystack.client().verify_payment, leading
+                )
+                for ref, (ok, data) in zip(leading, results):
+                    pending.discard(ref)
+                    ref_verified = settled = False
+                    try:
+                        ref_verified, settled = self._record(ref, ok, data)
+                    finally:
+                        self._land(ref, flights[ref][0], ref_verified, settled)
+                    if ref_verified:
+                        verified.add(ref)
+        finally:
+            # Don't leave other callers waiting on flights we never finished.
+            for ref in pending:
+                self._land(ref, flights[ref][0], False, False)
+
+        for ref, (future, leader) in flights.items():
+            if future is not None and not leader and future.result():
+                verified.add(ref)
+        return verified
+
+    async def averify(self, ref):
+        future, leader = self._join(ref)
+        if future is None:
+            return False
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        verified = settled = False
+        try:
+            ok, data = await AsyncPaystack.client().verify_payment(ref)
+            if ok:
+                await Payment.objects.arecord_gateway_status(
+                    ref, data.get("status"), data.get("paid_at")
+                )
+                verified = True
+                settled = data.get("status") in GATEWAY_STATUSES
+        finally:
+            self._land(ref, future, verified, settled)
+        return verified
+
+    def clear(self):
+        with self._lock:
+            self._unsettled.clear()
+
+
+verifier = VerifyCoalescer()
@@ -1,13 +1,66 @@
 from django.utils.translation import gettext_lazy as _
 from django.db import transaction
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from concurrent.futures import ThreadPoolExecutor
+from rest_framework.decorators import action
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.exceptions import ValidationError
-from .models import Payment
-from .serializers import PaymentSerializer
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.reverse import reverse
+from core.routers import read_database, replica_reads
+from .models import (
+    Payment,
+    PaymentJob,
+    PaymentRollup,
+    PaymentStatus,
+    TERMINAL_STATUSES,
+    WebhookEvent,
+    due_for_check,
+)
+from .serializers import PaymentLookupSerializer, PaymentSerializer, payment_rows
+from .pagination import PaymentCursorPagination
+from .idempotency import idempotent
+from .jobs import enqueue_initialization, initialize
+from .exports import EXPORT_FORMATS, export_rows
+from .partitions import find_archived, find_archived_many, id_ranges
+from .refs import new_ref
+from .verification import verifier
+from .money import Currency, format_minor_units
+from .conditional import (
+    conditional_response,
+    payment_etag,
+    requested_fields,
+    rows_etag,
+    select_fields,
+)
 from .paystack import Paystack
-import secrets
+from .cache import payment_cache
+from . import metrics
+import functools
+import hmac
+import operator
+
+
+def sync_bulk_limit():
+    """
+    The largest batch `bulk` initializes inline: one that finishes within
+    three quarters of IDEMPOTENCY_LOCK_TIMEOUT even if every Paystack call
+    runs into its timeouts. Otherwise a retry could find the key abandoned
+    while the batch is still running and create it again.
+    """
+    # initialize is only retried when the connection couldn't be made.
+    call = (
+        settings.PAYSTACK_CONNECT_TIMEOUT * (settings.PAYSTACK_MAX_RETRIES + 1)
+        + settings.PAYSTACK_READ_TIMEOUT
+    )
+    rounds = int(settings.IDEMPOTENCY_LOCK_TIMEOUT * 0.75 // call)
+    return rounds * settings.PAYMENTS_BULK_CONCURRENCY
 
 
 class PaymentViewset(ModelViewSet):
@@ -18,7 +71,252 @@ class PaymentViewset(ModelViewSet):
     ]
     serializer_class = PaymentSerializer
 
-    @transaction.atomic
+    @property
+    def paginator(self):
+        # Cursor pagination by default; the admin UI still pages by number
+        # with ?pagination=page.
+        if not hasattr(self, "_paginator"):
+            if self.request.query_params.get("pagination") == "page":
+                self._paginator = PageNumberPagination()
+            else:
+                self._paginator = PaymentCursorPagination()
+        return self._paginator
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ["list", "export"]:
+            return queryset
+
+        params = self.request.query_params
+        if params.get("status"):
+            if params["status"] not in PaymentStatus.values:
+                raise ValidationError({"status": _("Unknown payment status")})
+            queryset = queryset.filter(status=params["status"])
+        if params.get("email"):
+            queryset = queryset.filter(email=params["email"])
+        if params.get("paid_after"):
+            queryset = queryset.filter(paid_at__gte=self._parse_datetime("paid_after"))
+        if params.get("paid_before"):
+            queryset = queryset.filter(paid_at__lt=self._parse_datetime("paid_before"))
+        if params.get("created_after"):
+            queryset = queryset.filter(
+                created_at__gte=self._parse_datetime("created_after")
+            )
+        if params.get("created_before"):
+            queryset = queryset.filter(
+                created_at__lt=self._parse_datetime("created_before")
+            )
+        return queryset
+
+    def get_object(self):
+        # Bounded by created_at, so only the partitions that can hold the id
+        # are searched.
+        try:
+            pk = int(self.kwargs["pk"])
+        except ValueError:
+            raise Http404
+        instance = self.get_queryset().with_id(pk).first()
+        if instance is None:
+            raise Http404
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+    def _parse_datetime(self, param):
+        try:
+            value = parse_datetime(self.request.query_params[param])
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValidationError({param: _("Expected an ISO 8601 datetime")})
+        return value
+
+    def list(self, request, *args, **kwargs):
+        # Read straight into `.values()` rows; id, created_at and updated_at
+        # are always fetched for the pagination cursor and the ETag.
+        names = requested_fields(request.query_params)
+        with replica_reads():
+            queryset = self.filter_queryset(self.get_queryset()).values(
+                *dict.fromkeys(
+                    [*payment_rows.sources(names), "id", "created_at", "updated_at"]
+                )
+            )
+            page = self.paginate_queryset(queryset)
+            if page is None:
+                return Response(payment_rows.rows(queryset, names))
+
+        paginator = self.paginator
+        validators = [paginator.get_next_link(), paginator.get_previous_link()]
+        if isinstance(paginator, PageNumberPagination):
+            validators.append(paginator.page.paginator.count)
+        return conditional_response(
+            request,
+            rows_etag(page, names, *validators),
+            lambda: self.get_paginated_response(payment_rows.rows(page, names)),
+        )
+
+    @action(detail=False, methods=["get"])
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get("output", "csv")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({"output": _("Expected one of: csv, ndjson")})
+
+        # The rows are read while streaming, after the request's routing
+        # state is gone, so pick the database now.
+        with replica_reads():
+            queryset = self.get_queryset().using(read_database())
+
+        response = StreamingHttpResponse(
+            export_rows(queryset, export_format),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="payments.{export_format}"'
+        )
+        return response
+
+    @action(detail=False, methods=["get"])
+    def summary(self, request, *args, **kwargs):
+        """
+        Payment counts and amounts per status, overall and per day, for the
+        days between `since` and `until` (inclusive) in one `currency`. Read
+        from the rollups only, so the cost depends on the number of days, not
+        of payments.
+        """
+        currency = request.query_params.get("currency", Currency.NGN)
+        if currency not in Currency.values:
+            raise ValidationError({"currency": _("Unknown currency")})
+
+        rollups = PaymentRollup.objects.filter(currency=currency).exclude(count=0)
+        if request.query_params.get("since"):
+            rollups = rollups.filter(day__gte=self._parse_date("since"))
+        if request.query_params.get("until"):
+            rollups = rollups.filter(day__lte=self._parse_date("until"))
+
+        totals, days = {}, {}
+        with replica_reads():
+            for day, status, count, amount in rollups.values_list(
+                "day", "status", "count", "amount_minor"
+            ):
+                days.setdefault(day, {})[status] = [count, amount]
+                total = totals.setdefault(status, [0, 0])
+                total[0] += count
+                total[1] += amount
+
+        def render(statuses):
+            return {
+                status: {"count": count, "amount": format_minor_units(amount)}
+                for status, (count, amount) in statuses.items()
+            }
+
+        return Response(
+            {
+                "currency": currency,
+                "totals": render(totals),
+                "days": [
+                    {"day": day, "statuses": render(statuses)}
+                    for day, statuses in days.items()
+                ],
+            }
+        )
+
+    @action(detail=False, methods=["post"])
+    def lookup(self, request, *args, **kwargs):
+        """
+        Current details of up to PAYMENTS_LOOKUP_MAX_ITEMS payments, given as
+        `{"ids": [...], "refs": [...]}`, read with one query. Stale pending
+        payments in the batch are verified with Paystack first, at most
+        PAYMENTS_LOOKUP_CONCURRENCY at a time, like retrieve does for one.
+        Like retrieve, settled payments are served from the payment cache,
+        archived ones are read back from their archives, and `?fields=`
+        limits the fields returned.
+        """
+        names = requested_fields(request.query_params)
+        serializer = PaymentLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        refs = serializer.validated_data["refs"]
+
+        cached = payment_cache.get_many(ids)
+        fields = list(
+            dict.fromkeys([*payment_rows.sources(), "ref", "checked_at", "created_at"])
+        )
+
+        # One query, each id and ref bounded to the partitions it can be in.
+        ranges = id_ranges()
+        rows = list(
+            functools.reduce(
+                operator.or_,
+                [Payment.objects.with_id(pk, ranges) for pk in ids if pk not in cached]
+                + [Payment.objects.with_ref(ref) for ref in refs],
+                Payment.objects.none(),
+            ).values(*fields)
+        )
+
+        stale = [
+            row["ref"]
+            for row in rows
+            if row["status"] == PaymentStatus.PENDING
+            and row["ref"]
+            and due_for_check(row["checked_at"])
+        ]
+        if stale:
+            verified = verifier.verify_many(stale, settings.PAYMENTS_LOOKUP_CONCURRENCY)
+            if verified:
+                refreshed = {
+                    row["id"]: row
+                    for row in functools.reduce(
+                        operator.or_,
+                        [
+                            Payment.objects.filter(
+                                pk=row["id"], created_at=row["created_at"]
+                            )
+                            for row in rows
+                            if row["ref"] in verified
+                        ],
+                    ).values(*fields)
+                }
+                rows = [refreshed.get(row["id"], row) for row in rows]
+
+        found_ids = set(cached) | {row["id"] for row in rows}
+        found_refs = {row["ref"] for row in rows}
+        rows += [
+            {field: getattr(payment, field) for field in fields}
+            for payment in find_archived_many(
+                [pk for pk in ids if pk not in found_ids],
+                [ref for ref in refs if ref not in found_refs],
+            )
+        ]
+        found_ids.update(row["id"] for row in rows)
+        found_refs.update(row["ref"] for row in rows)
+
+        results = dict(cached)
+        for row, data in zip(rows, payment_rows.rows(rows)):
+            results[row["id"]] = data
+        payment_cache.set_many(
+            (row["id"], results[row["id"]])
+            for row in rows
+            if row["status"] in TERMINAL_STATUSES
+        )
+        return Response(
+            {
+                "results": [select_fields(data, names) for data in results.values()],
+                "missing": {
+                    "ids": [pk for pk in ids if pk not in found_ids],
+                    "refs": [ref for ref in refs if ref not in found_refs],
+                },
+            }
+        )
+
+    def _parse_date(self, param):
+        try:
+            value = parse_date(self.request.query_params[param])
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValidationError({param: _("Expected an ISO 8601 date")})
+        return value
+
+    @idempotent
     def create(self, request, *args, **kwargs):
 
         if request.version == "v1":
@@ -26,37 +324,50 @@ class PaymentViewset(ModelViewSet):
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
 
-            ref = secrets.token_urlsafe(50)
-            name = serializer.validated_data.get("name")
-            email = serializer.validated_data.get("email")
-            amount = serializer.validated_data.get("amount")
+            ref = new_ref()
 
-            amount_in_sub_unit = int(float(amount) * 100)
+            if self._respond_async(request):
+                return self._create_async(serializer, ref)
 
-            paystack = Paystack()
-            response_data = paystack.initialize_payment(ref, email, amount_in_sub_unit)
+            # Reserve the row first so the gateway call below runs outside any
+            # transaction and doesn't hold a database connection open.
+            payment_instance = serializer.save(ref=ref, status=PaymentStatus.RESERVED)
 
-            status = response_data["status"]
-            message = response_data["message"]
-            data = response_data["data"]
+            try:
+                is_initialized, data = Paystack.client().initialize_payment(
+                    ref,
+                    payment_instance.email,
+                    payment_instance.amount_minor,
+                    currency=payment_instance.currency,
+                )
+            except Exception:
+                self._mark_init_failed(payment_instance)
+                raise
 
-            if not response_data["status"]:
+            if not is_initialized:
+                self._mark_init_failed(payment_instance)
                 return Response(
                     {
                         "error": _(
-                            f"Failed to initialize payment with Paystack, {message}"
+                            f"Failed to initialize payment with Paystack, {data}"
                         ),
-                        "details": _(data),
                     },
                     status=500,
                 )
 
             payment_url = data["authorization_url"]
 
-            payment_instance = serializer.save()
-            payment_instance.ref = ref
-            payment_instance.save()
-            payment_instance.refresh_from_db()
+            Payment.objects.transition(
+                payment_instance,
+                PaymentStatus.RESERVED,
+                PaymentStatus.PENDING,
+                authorization_url=payment_url,
+                checked_at=timezone.now(),
+            )
+            payment_instance.status = PaymentStatus.PENDING
+            payment_instance.authorization_url = payment_url
+            # The transition bumped updated_at past the inserted value.
+            payment_instance.refresh_from_partition(fields=["updated_at"])
 
             return Response(
                 {
@@ -70,31 +381,281 @@ class PaymentViewset(ModelViewSet):
         else:
             return Response({"error": _("Unknown version")})
 
-    @transaction.atomic
-    def retrieve(self, request, *args, **kwargs):
-        if request.version == "v1":
-            instance = self.get_object()
+    @action(detail=False, methods=["post"])
+    @idempotent
+    def bulk(self, request, *args, **kwargs):
+        """
+        Create a batch of payments from a JSON array. The batch is validated
+        as a whole and inserted with one bulk INSERT; each payment is then
+        initialized with Paystack separately, so gateway failures only fail
+        their own item. Batches larger than `sync_bulk_limit()` are queued
+        for `run_payment_workers` as in asynchronous mode.
+        """
+        if not isinstance(request.data, list) or not request.data:
+            raise ValidationError({"error": _("Expected a non-empty list of payments")})
+        if len(request.data) > settings.PAYMENTS_BULK_MAX_ITEMS:
+            raise ValidationError(
+                {
+                    "error": _("At most %(count)d payments per request")
+                    % {"count": settings.PAYMENTS_BULK_MAX_ITEMS}
+                }
+            )
 
-            if instance.status == "pending":
-                is_verified, message, status, paid_at = Paystack.verify_payment(
-                    instance.ref
-                )
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
 
-                if is_verified:
-                    instance.status = status
-                    instance.paid_at = paid_at
-                    instance.save()
-                    instance.refresh_from_db()
-                else:
-                    raise Exception(message)
+        payments = [
+            Payment(**item, ref=new_ref(), status=PaymentStatus.RESERVED)
+            for item in serializer.validated_data
+        ]
 
-            serializer = self.get_serializer(instance)
+        if self._respond_async(request) or len(payments) > sync_bulk_limit():
+            # Payments and their jobs commit together, so no RESERVED payment
+            # is left without a job to move it forward.
+            with transaction.atomic():
+                payments = Payment.objects.bulk_create(payments)
+                PaymentJob.objects.bulk_create(
+                    [PaymentJob(payment=payment) for payment in payments]
+                )
             return Response(
                 {
-                    "details": serializer.data,
-                    "message": "Payment details retrieved successfully",
+                    "results": [
+                        {"status": "queued", "details": data}
+                        for data in PaymentSerializer(payments, many=True).data
+                    ],
+                    "message": "Payments accepted",
                 },
-                status=200,
+                status=202,
             )
+
+        payments = Payment.objects.bulk_create(payments)
+        with ThreadPoolExecutor(max_workers=settings.PAYMENTS_BULK_CONCURRENCY) as pool:
+            outcomes = list(metrics.map_in_context(pool, initialize, payments))
+
+        now = timezone.now()
+        initialized, failed, results = [], [], []
+        for payment, (is_initialized, data) in zip(payments, outcomes):
+            if is_initialized:
+                payment.status = PaymentStatus.PENDING
+                payment.authorization_url = data["authorization_url"]
+                payment.checked_at = now
+                initialized.append(payment)
+                results.append(
+                    {"status": "created", "payment_url": data["authorization_url"]}
+                )
+            else:
+                payment.status = PaymentStatus.INIT_FAILED
+                failed.append(payment)
+                results.append(
+                    {
+                        "status": "failed",
+                        "error": _(
+                            f"Failed to initialize payment with Paystack, {data}"
+                        ),
+                    }
+                )
+
+        created_at = [payment.created_at for payment in payments]
+        batch = Payment.objects.filter(
+            pk__in=[payment.pk for payment in payments],
+            created_at__range=(min(created_at), max(created_at)),
+        )
+        with transaction.atomic():
+            # Leave alone anything a webhook moved on while we were
+            # initializing, like record_gateway_status would.
+            reserved = set(
+                batch.select_for_update()
+                .filter(status=PaymentStatus.RESERVED)
+                .values_list("pk", flat=True)
+            )
+            batch.bulk_update(
+                [payment for payment in initialized if payment.pk in reserved],
+                ["status", "authorization_url", "checked_at"],
+                batch_size=500,
+            )
+            batch.filter(
+                pk__in=[payment.pk for payment in failed if payment.pk in reserved]
+            ).update(status=PaymentStatus.INIT_FAILED)
+            PaymentRollup.objects.record(
+                [
+                    (payment, PaymentStatus.RESERVED, payment.status)
+                    for payment in payments
+                    if payment.pk in reserved
+                ]
+            )
+        payment_cache.invalidate(*[payment.pk for payment in failed])
+        # The updates bumped updated_at past the inserted values, and rows
+        # that weren't reserved any more were changed by someone else.
+        current = {
+            row["pk"]: row
+            for row in batch.values(
+                "pk",
+                "status",
+                "authorization_url",
+                "paid_at",
+                "checked_at",
+                "updated_at",
+            )
+        }
+        for payment in payments:
+            for field, value in current[payment.pk].items():
+                setattr(payment, field, value)
+
+        for result, data in zip(results, PaymentSerializer(payments, many=True).data):
+            result["details"] = data
+
+        return Response(
+            {
+                "results": results,
+                "created": len(initialized),
+                "failed": len(failed),
+            },
+            # 207 tells the client to check each item when some failed.
+            status=207 if failed else 201,
+        )
+
+    def _respond_async(self, request):
+        prefer = request.headers.get("Prefer", "")
+        return settings.PAYMENTS_ASYNC_CREATE or "respond-async" in prefer
+
+    def _create_async(self, serializer, ref):
+        # The gateway call is left to `run_payment_workers`; clients poll
+        # retrieve for the authorization URL.
+        with transaction.atomic():
+            payment_instance = serializer.save(ref=ref, status=PaymentStatus.RESERVED)
+            enqueue_initialization(payment_instance)
+
+        location = reverse(
+            "payment-detail", kwargs={"pk": payment_instance.pk}, request=self.request
+        )
+        return Response(
+            {
+                "message": "Payment accepted",
+                "details": PaymentSerializer(payment_instance).data,
+            },
+            status=202,
+            headers={"Location": location},
+        )
+
+    def _mark_init_failed(self, payment_instance):
+        Payment.objects.transition(
+            payment_instance, PaymentStatus.RESERVED, PaymentStatus.INIT_FAILED
+        )
+        payment_instance.status = PaymentStatus.INIT_FAILED
+        payment_cache.invalidate(payment_instance.pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.version == "v1":
+            # Settled payments never change, so they are served from cache
+            # without touching the database.
+            names = requested_fields(request.query_params)
+            data = payment_cache.get(kwargs["pk"])
+            if data is not None:
+                return self._retrieved_data(data, names)
+
+            try:
+                instance = self.get_object()
+            except Http404:
+                instance = find_archived(kwargs["pk"])
+                if instance is None:
+                    raise
+                return self._retrieved(instance, names)
+
+            # The webhook keeps pending payments up to date; only ask Paystack
+            # directly when we haven't heard anything for a while.
+            if instance.status == PaymentStatus.PENDING and instance.is_stale():
+                if verifier.verify(instance.ref):
+                    instance.refresh_from_partition()
+
+            return self._retrieved(instance, names)
         else:
             return Response({"error": _("Unknown version")})
+
+    def _retrieved(self, instance, names=None):
+        def build():
+            if instance.status in TERMINAL_STATUSES:
+                data = payment_rows.instance(instance)
+                payment_cache.set(instance.pk, data)
+                data = select_fields(data, names)
+            else:
+                data = payment_rows.instance(instance, names)
+            return self._details_response(data)
+
+        # Payments archived before updated_at existed have no validators.
+        if instance.updated_at is None:
+            return build()
+        return conditional_response(
+            self.request,
+            payment_etag(instance.pk, instance.updated_at, names),
+            build,
+            last_modified=instance.updated_at,
+        )
+
+    def _retrieved_data(self, data, names=None):
+        """Respond with a cached representation."""
+        updated_at = data.get("updated_at") and parse_datetime(data["updated_at"])
+        if not updated_at:
+            return self._details_response(select_fields(data, names))
+        return conditional_response(
+            self.request,
+            payment_etag(data["id"], updated_at, names),
+            lambda: self._details_response(select_fields(data, names)),
+            last_modified=updated_at,
+        )
+
+    def _details_response(self, data):
+        return Response(
+            {
+                "details": data,
+                "message": "Payment details retrieved successfully",
+            },
+            status=200,
+        )
+
+
+class PaystackWebhookView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    EVENTS = ["charge.success", "charge.failed"]
+
+    def post(self, request, *args, **kwargs):
+        signature = request.headers.get("x-paystack-signature")
+        if not Paystack.client().verify_signature(request.body, signature):
+            return Response({"error": _("Invalid signature")}, status=400)
+
+        event = request.data.get("event")
+        data = request.data.get("data") or {}
+
+        if event not in self.EVENTS or not data.get("reference"):
+            return Response(status=200)
+
+        event_id = f"{event}:{data.get('id', data['reference'])}"
+
+        with transaction.atomic():
+            _event, created = WebhookEvent.objects.get_or_create(
+                event_id=event_id, defaults={"event": event}
+            )
+            if created:
+                Payment.objects.record_gateway_status(
+                    data["reference"], data.get("status"), data.get("paid_at")
+                )
+
+        return Response(status=200)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint for this worker's metrics; not served at all
+    until METRICS_TOKEN is set.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+        return HttpResponse(status=401)
+
+    metrics.CACHE_LOCAL_SIZE.set(len(payment_cache.local))
+    return HttpResponse(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+def forget_cached_user(sender, instance, **kwargs):
+    from .cache import forget_user
+
+    forget_user(instance.pk)
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.users'
+
+    def ready(self):
+        user_model = self.get_model("User")
+        post_save.connect(forget_cached_user, sender=user_model)
+        post_delete.connect(forget_cached_user, sender=user_model)
@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.core import signing
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from .models import APIKey, User
+from . import cache
+
+ACCESS_TOKEN_SALT = "apps.users.access-token"
+
+
+def token_version(user):
+    """Part of the password hash's HMAC, so it changes with the password."""
+    return user.get_session_auth_hash()[:16]
+
+
+def issue_access_token(user):
+    """
+    Return a signed access token for `user`, valid for ACCESS_TOKEN_LIFETIME
+    seconds. It embeds the token version, so changing the password
+    invalidates every token issued before.
+    """
+    return signing.dumps(
+        {"sub": str(user.pk), "ver": token_version(user)}, salt=ACCESS_TOKEN_SALT
+    )
+
+
+def load_user(pk):
+    """
+    Fetch an active user through the auth cache, as `(user, token_version)`.
+    Only the fields authentication needs are cached; the user's other
+    fields are deferred, and loaded from the database if a view reads them.
+    """
+    fields = cache.get_user(pk)
+    if fields is None:
+        user = User.objects.filter(pk=pk).first()
+        if user is None:
+            return None
+        fields = {
+            "is_active": user.is_active,
+            "is_staff": user.is_staff,
+            "version": token_version(user),
+        }
+        cache.set_user(user.pk, **fields)
+    if not fields["is_active"]:
+        return None
+
+    user = User.from_db(
+        router.db_for_read(User),
+        ["id", "is_staff"],
+        [User._meta.pk.to_python(pk), fields["is_staff"]],
+    )
+    return user, fields["version"]
+
+
+def get_credentials(request, keyword):
+    parts = get_authorization_header(request).split()
+    if not parts or parts[0].lower() != keyword.lower().encode():
+        return None
+    if len(parts) != 2:
+        raise AuthenticationFailed(_("Invalid Authorization header"))
+    try:
+        return parts[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed(_("Invalid Authorization header"))
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """
+    `Authorization: Bearer <token>` with a token from `issue_access_token`.
+    Verifying it needs no database write, and the user's auth fields usually
+    come from cache.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        token = get_credentials(request, self.keyword)
+        if token is None:
+            return None
+
+        try:
+            claims = signing.loads(
+                token, salt=ACCESS_TOKEN_SALT, max_age=settings.ACCESS_TOKEN_LIFETIME
+            )
+        except signing.SignatureExpired:
+            raise AuthenticationFailed(_("Access token has expired"))
+        except signing.BadSignature:
+            raise AuthenticationFailed(_("Invalid access token"))
+
+        loaded = load_user(claims.get("sub"))
+        if loaded is None or loaded[1] != claims.get("ver"):
+            raise AuthenticationFailed(_("Invalid access token"))
+        return loaded[0], token
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class APIKeyAuthentication(BaseAuthentication):
+    """
+    `Authorization: Api-Key <key>` with a key from `APIKey.objects.create_key`.
+    Key lookups, including misses, are cached; revoking a key clears it.
+    """
+
+    keyword = "Api-Key"
+
+    def authenticate(self, request):
+        raw_key = get_credentials(request, self.keyword)
+        if raw_key is None:
+            return None
+
+        key_hash = APIKey.hash_key(raw_key)
+        user_id = cache.get_api_key(key_hash)
+        if user_id is None:
+            user_id = (
+                APIKey.objects.filter(key_hash=key_hash, revoked_at__isnull=True)
+                .values_list("user_id", flat=True)
+                .first()
+            )
+            cache.set_api_key(key_hash, user_id)
+
+        loaded = load_user(user_id) if user_id else None
+        if loaded is None:
+            raise AuthenticationFailed(_("Invalid API key"))
+        return loaded[0], raw_key
+
+    def authenticate_header(self, request):
+        return self.keyword
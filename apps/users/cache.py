@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.cache import caches
+
+USER_KEY_PREFIX = "users:user:v2:"
+API_KEY_PREFIX = "users:apikey:v1:"
+# Cached for key hashes that match no usable key, so guessed keys don't
+# reach the database on every attempt.
+UNKNOWN = ""
+
+
+def auth_cache():
+    return caches[settings.AUTH_CACHE_ALIAS]
+
+
+def get_user(pk):
+    """The cached auth fields of user `pk` (see `set_user`), or None."""
+    return auth_cache().get(f"{USER_KEY_PREFIX}{pk}")
+
+
+def set_user(pk, is_active, is_staff, version):
+    """
+    Cache what authenticating user `pk` needs and nothing else, so the cache
+    never holds password hashes or profile data. `version` is the token
+    version, which changes with the password.
+    """
+    auth_cache().set(
+        f"{USER_KEY_PREFIX}{pk}",
+        {"is_active": is_active, "is_staff": is_staff, "version": version},
+        settings.AUTH_CACHE_TIMEOUT,
+    )
+
+
+def forget_user(pk):
+    auth_cache().delete(f"{USER_KEY_PREFIX}{pk}")
+
+
+def get_api_key(key_hash):
+    """The id of the user owning `key_hash`, UNKNOWN, or None if not cached."""
+    return auth_cache().get(f"{API_KEY_PREFIX}{key_hash}")
+
+
+def set_api_key(key_hash, user_id):
+    auth_cache().set(
+        f"{API_KEY_PREFIX}{key_hash}",
+        UNKNOWN if user_id is None else str(user_id),
+        settings.AUTH_CACHE_TIMEOUT,
+    )
+
+
+def forget_api_key(key_hash):
+    auth_cache().delete(f"{API_KEY_PREFIX}{key_hash}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.users.models import APIKey, User
+
+
+class Command(BaseCommand):
+    help = "Create an API key for a user and print it. The key is not stored."
+
+    def add_arguments(self, parser):
+        parser.add_argument("email")
+        parser.add_argument("--name", default="", help="What the key is used for.")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options["email"]).first()
+        if user is None:
+            raise CommandError(f"No user with email {options['email']}")
+
+        api_key, raw_key = APIKey.objects.create_key(user, options["name"])
+        self.stdout.write(raw_key)
+        self.stderr.write(f"Created key {api_key.prefix} for {user.email}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.users.models import APIKey
+
+
+class Command(BaseCommand):
+    help = "Revoke an API key by its prefix (the part before the dot)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("prefix")
+
+    def handle(self, *args, **options):
+        api_key = APIKey.objects.filter(
+            prefix=options["prefix"], revoked_at__isnull=True
+        ).first()
+        if api_key is None:
+            raise CommandError(f"No active API key with prefix {options['prefix']}")
+
+        api_key.revoke()
+        self.stdout.write(self.style.SUCCESS(f"Revoked key {api_key.prefix}"))
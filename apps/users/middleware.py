@@ -0,0 +1,17 @@
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.urls import reverse
+
+
+class AdminSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware that only saves sessions for the admin. API clients
+    authenticate with tokens or API keys, so their requests never write a
+    session row, even with SESSION_SAVE_EVERY_REQUEST on. Anything else kept
+    in sessions outside the admin is lost, which is why CSRF_USE_SESSIONS is
+    off.
+    """
+
+    def process_response(self, request, response):
+        if not request.path.startswith(reverse("admin:index")):
+            return response
+        return super().process_response(request, response)
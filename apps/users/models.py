@@ -6,6 +6,10 @@ from django.contrib.auth.models import (
 )
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from .cache import forget_api_key
+import hashlib
+import secrets
 import uuid
 
 
@@ -62,3 +66,45 @@ class User(AbstractBaseUser):
         
     def __str__(self) -> str:
         return f"{self.name}"
+
+
+class APIKeyManager(models.Manager):
+
+    def create_key(self, user, name=""):
+        """
+        Create a key for `user`. Returns `(api_key, raw_key)`; only a hash of
+        the key is stored, so `raw_key` can't be recovered later.
+        """
+        prefix = secrets.token_hex(4)
+        raw_key = f"{prefix}.{secrets.token_urlsafe(32)}"
+        api_key = self.create(
+            user=user, name=name, prefix=prefix, key_hash=APIKey.hash_key(raw_key)
+        )
+        return api_key, raw_key
+
+
+class APIKey(models.Model):
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="api_keys")
+    name = models.CharField(max_length=100, blank=True)
+    # Shown in listings so a key can be identified without storing it.
+    prefix = models.CharField(max_length=8, unique=True)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    objects = APIKeyManager()
+
+    @staticmethod
+    def hash_key(raw_key):
+        # Keys are random 256-bit secrets, so a fast hash is enough.
+        return hashlib.sha256(raw_key.encode()).hexdigest()
+
+    def revoke(self):
+        self.revoked_at = timezone.now()
+        self.save(update_fields=["revoked_at"])
+        forget_api_key(self.key_hash)
+
+    def __str__(self):
+        return f"{self.prefix} ({self.user})"
+
@@ -1,5 +1,13 @@
-from django.test import TestCase
-from .models import User
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .authentication import issue_access_token
+from .cache import USER_KEY_PREFIX
+from .models import APIKey, User
 import uuid
 
 
@@ -48,3 +56,110 @@ class CustomerTestClass(TestCase):
     def test_id_is_uuid(self):
         user = self.user
         self.assertIsInstance(user.id, uuid.UUID)
+
+
+class TokenAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.password = "Corr3ct-Horse-Battery"
+        self.user = User.objects.create_user(
+            name="Peter Griffin", email="peter@quahog.com", password=self.password
+        )
+        self.me_url = "/api/v1/auth/me/"
+
+    def test_password_exchange_issues_access_token(self):
+        response = self.client.post(
+            "/api/v1/auth/token/",
+            {"email": "peter@quahog.com", "password": self.password},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access_token']}")
+        self.assertEqual(self.client.get(self.me_url).data["email"], "peter@quahog.com")
+
+    def test_wrong_password_is_rejected(self):
+        response = self.client.post(
+            "/api/v1/auth/token/",
+            {"email": "peter@quahog.com", "password": "wrong"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_expired_token_is_rejected(self):
+        token = issue_access_token(self.user)
+
+        with override_settings(ACCESS_TOKEN_LIFETIME=-1):
+            response = self.client.get(self.me_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_invalidates_tokens(self):
+        token = issue_access_token(self.user)
+        self.user.set_password("An0ther-Passw0rd!")
+        self.user.save()
+
+        response = self.client.get(self.me_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_authenticated_requests_skip_the_database(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_access_token(self.user)}")
+        self.client.get(self.me_url)
+
+        # Only /me/ reading the email and name; authenticating is cached.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.me_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["name"], "Peter Griffin")
+
+    def test_cache_holds_only_auth_fields(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_access_token(self.user)}")
+        self.client.get(self.me_url)
+
+        cached = cache.get(f"{USER_KEY_PREFIX}{self.user.pk}")
+        self.assertEqual(set(cached), {"is_active", "is_staff", "version"})
+        self.assertNotIn(self.user.password, cached.values())
+
+        self.user.set_password("An0ther-Passw0rd!")
+        self.user.save()
+        self.assertIsNone(cache.get(f"{USER_KEY_PREFIX}{self.user.pk}"))
+
+    def test_api_key_authentication_and_revocation(self):
+        api_key, raw_key = APIKey.objects.create_key(self.user, "payroll")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Api-Key {raw_key}")
+        self.assertEqual(self.client.get(self.me_url).status_code, 200)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.me_url).status_code, 200)
+
+        api_key.revoke()
+        self.assertEqual(self.client.get(self.me_url).status_code, 401)
+
+    def test_unknown_api_key_is_rejected(self):
+        response = self.client.get(self.me_url, HTTP_AUTHORIZATION="Api-Key nope.nope")
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], "Bearer")
+
+    def test_api_requests_do_not_write_sessions(self):
+        session = SessionStore()
+        session.create()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_access_token(self.user)}")
+        self.client.get(self.me_url)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.me_url)
+
+        # Nothing is written back to the session.
+        writes = [
+            query["sql"]
+            for query in queries
+            if "django_session" in query["sql"] and not query["sql"].startswith("SELECT")
+        ]
+        self.assertEqual(writes, [])
+
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import AccessTokenView, CurrentUserView
+
+urlpatterns = [
+    path("token/", AccessTokenView.as_view(), name="access-token"),
+    path("me/", CurrentUserView.as_view(), name="current-user"),
+]
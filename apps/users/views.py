@@ -1,3 +1,46 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.utils.translation import gettext_lazy as _
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from .authentication import APIKeyAuthentication, issue_access_token
 
-# Create your views here.
+
+class AccessTokenView(APIView):
+    """
+    Exchange an email and password, or an API key, for a short-lived access
+    token to send as `Authorization: Bearer <token>`.
+    """
+
+    authentication_classes = [APIKeyAuthentication]
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        user = request.user if request.user.is_authenticated else None
+        if user is None:
+            user = authenticate(
+                request,
+                email=request.data.get("email"),
+                password=request.data.get("password"),
+            )
+        if user is None:
+            return Response({"error": _("Invalid credentials")}, status=401)
+
+        return Response(
+            {
+                "access_token": issue_access_token(user),
+                "token_type": "Bearer",
+                "expires_in": settings.ACCESS_TOKEN_LIFETIME,
+            }
+        )
+
+
+class CurrentUserView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        # Authentication only loads the user's auth fields.
+        user.refresh_from_db(fields=["email", "name"])
+        return Response({"id": user.pk, "email": user.email, "name": user.name})
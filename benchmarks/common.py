@@ -0,0 +1,50 @@
+import os
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+
+@contextmanager
+def benchmark_database():
+    """Run against a throwaway, fully migrated test database."""
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_payments(rows):
+    """
+    Insert `rows` synthetic payments with generate_series. One in fifty is
+    still pending, the rest are settled, and rows arrive in created_at order
+    like they do in production.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO payments_payment
+                (name, email, amount_minor, currency, ref, status, paid_at, created_at)
+            SELECT
+                'Customer ' || i,
+                'customer' || (i %% 50000) || '@example.com',
+                (random() * 1000000)::bigint,
+                'NGN',
+                md5(i::text),
+                CASE WHEN i %% 50 = 0 THEN 'pending'
+                     WHEN i %% 7 = 0 THEN 'failed'
+                     ELSE 'success' END,
+                CASE WHEN i %% 50 = 0 OR i %% 7 = 0 THEN NULL
+                     ELSE now() - ((%s - i) || ' seconds')::interval + interval '90 seconds' END,
+                now() - ((%s - i) || ' seconds')::interval
+            FROM generate_series(1, %s) AS i
+            """,
+            [rows, rows, rows],
+        )
+        cursor.execute("ANALYZE payments_payment")
@@ -0,0 +1,51 @@
+"""
+Compare two result files written by `benchmarks.load`:
+
+    python -m benchmarks.compare benchmarks/results/2a954ae.json benchmarks/results/HEAD.json
+"""
+
+import argparse
+import json
+
+METRICS = [
+    ("requests_per_s", lambda result: result["requests_per_s"]),
+    ("p50 ms", lambda result: result["latency_ms"]["p50"]),
+    ("p95 ms", lambda result: result["latency_ms"]["p95"]),
+    ("p99 ms", lambda result: result["latency_ms"]["p99"]),
+    ("queries/req", lambda result: result["db_queries_per_request"]),
+    ("calls/req", lambda result: result["outbound_calls_per_request"]),
+    ("errors", lambda result: result["errors"]),
+]
+
+
+def change(before, after):
+    if before == 0:
+        return "" if after == 0 else "new"
+    return f"{(after - before) / before:+.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+
+    with open(args.base) as base_file, open(args.head) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+
+    print(f"{base['commit']} -> {head['commit']}")
+    if base["config"] != head["config"]:
+        print("warning: the runs used different configurations")
+
+    for name, head_result in head["scenarios"].items():
+        base_result = base["scenarios"].get(name)
+        if base_result is None:
+            continue
+        print(f"\n{name}")
+        for label, metric in METRICS:
+            before, after = metric(base_result), metric(head_result)
+            print(f"  {label:<15} {before:>10} {after:>10} {change(before, after):>8}")
+
+
+if __name__ == "__main__":
+    main()
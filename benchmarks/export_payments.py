@@ -0,0 +1,48 @@
+"""
+Stream a large payments table through the export path and report throughput
+and peak memory, which should stay flat as --rows grows:
+
+    python -m benchmarks.export_payments --rows 1000000 --format ndjson
+"""
+
+import argparse
+import resource
+import time
+
+from benchmarks.common import benchmark_database, seed_payments
+
+from apps.payments.exports import EXPORT_FORMATS, export_rows
+from apps.payments.models import Payment
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        seed_payments(args.rows)
+        rss_before = peak_rss_mb()
+
+        started = time.perf_counter()
+        exported_bytes = 0
+        for chunk in export_rows(Payment.objects.all(), args.format, args.chunk_size):
+            exported_bytes += len(chunk)
+        elapsed = time.perf_counter() - started
+
+    print(f"rows:        {args.rows}")
+    print(f"format:      {args.format}")
+    print(f"elapsed:     {elapsed:.2f}s")
+    print(f"throughput:  {args.rows / elapsed:,.0f} rows/s")
+    print(f"output:      {exported_bytes / 1024 / 1024:.1f} MiB")
+    print(f"peak RSS:    {rss_before:.1f} MiB before, {peak_rss_mb():.1f} MiB after")
+
+
+if __name__ == "__main__":
+    main()
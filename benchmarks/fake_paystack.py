@@ -0,0 +1,134 @@
+"""
+A local stand-in for the Paystack API with configurable latency, jitter and
+error rate, so load tests exercise the gateway path without touching the
+real service. Run it on its own with:
+
+    python -m benchmarks.fake_paystack --port 8765 --latency 0.3 --error-rate 0.01
+
+or start it from a scenario with `FakePaystack(...).start()`.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.path.rstrip("/").endswith("transaction/initialize"):
+            self.respond(
+                {
+                    "status": True,
+                    "message": "Authorization URL created",
+                    "data": {
+                        "authorization_url": f"https://checkout.paystack.com/{body['reference'][:16]}",
+                        "access_code": body["reference"][:16],
+                        "reference": body["reference"],
+                    },
+                }
+            )
+        else:
+            self.respond({"status": False, "message": "Not found"}, status=404)
+
+    def do_GET(self):
+        if "transaction/verify/" in self.path:
+            ref = self.path.rsplit("/", 1)[-1]
+            self.respond(
+                {
+                    "status": True,
+                    "message": "Verification successful",
+                    "data": {
+                        "reference": ref,
+                        "status": self.server.verify_status,
+                        "paid_at": "2025-03-20T18:00:00.000Z",
+                    },
+                }
+            )
+        else:
+            self.respond({"status": False, "message": "Not found"}, status=404)
+
+    def respond(self, payload, status=200):
+        server = self.server
+        with server.lock:
+            server.calls += 1
+
+        time.sleep(max(0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if random.random() < server.error_rate:
+            payload, status = {"status": False, "message": "Gateway error"}, 502
+
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePaystack(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.3,
+        jitter=0.1,
+        error_rate=0.0,
+        verify_status="success",
+    ):
+        super().__init__((host, port), FakePaystackHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.verify_status = verify_status
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per call.")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of 502s.")
+    parser.add_argument("--verify-status", default="success")
+    args = parser.parse_args()
+
+    server = FakePaystack(
+        args.host,
+        args.port,
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.verify_status,
+    )
+    print(f"Fake Paystack listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Drive the payments API at a fixed concurrency against a local fake Paystack
+and record latency percentiles, throughput, DB queries per request and
+outbound gateway calls per request:
+
+    python -m benchmarks.load --concurrency 16 --requests 2000 --latency 0.2
+
+Each scenario runs in-process through Django's test client against a
+throwaway database, one client and one DB connection per worker thread.
+Results are written as JSON keyed by the current commit, so two runs can be
+diffed with `python -m benchmarks.compare`.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import itertools
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+
+from benchmarks.common import benchmark_database, seed_payments
+from benchmarks.fake_paystack import FakePaystack
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from apps.payments.cache import payment_cache
+from apps.payments.models import Payment
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def create_request(client, n, context):
+    return client.post(
+        "/api/v1/payments/",
+        {"name": f"Load {n}", "email": f"load{n}@example.com", "amount": "150.00"},
+        content_type="application/json",
+    )
+
+
+def poll_request(client, n, context):
+    return client.get(f"/api/v1/payments/{random.choice(context['ids'])}/")
+
+
+def list_request(client, n, context):
+    return client.get(f"/api/v1/payments/?page_size={context['page_size']}")
+
+
+SCENARIOS = {
+    "create": create_request,
+    "poll": poll_request,
+    "list": list_request,
+}
+
+
+class QueryCounter:
+    """`execute_wrapper` hook counting the queries run on one connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(quantiles, p):
+    return round(quantiles[p - 1] * 1000, 2)
+
+
+def run_scenario(name, gateway, concurrency, total, context):
+    make_request = SCENARIOS[name]
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, status_codes, queries = [], {}, []
+
+    def worker():
+        client = Client()
+        query_counter = QueryCounter()
+        try:
+            with connection.execute_wrapper(query_counter):
+                while (n := next(counter)) < total:
+                    started = time.perf_counter()
+                    response = make_request(client, n, context)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        status_codes[response.status_code] = (
+                            status_codes.get(response.status_code, 0) + 1
+                        )
+            queries.append(query_counter.count)
+        finally:
+            # Leave nothing connected to the test database before it is dropped.
+            connection.close()
+
+    payment_cache.clear()
+    calls_before = gateway.calls
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall_time = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    errors = sum(count for code, count in status_codes.items() if code >= 400)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "wall_time_s": round(wall_time, 3),
+        "requests_per_s": round(total / wall_time, 2),
+        "latency_ms": {
+            "p50": percentile(quantiles, 50),
+            "p95": percentile(quantiles, 95),
+            "p99": percentile(quantiles, 99),
+            "mean": round(statistics.fmean(latencies) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "db_queries_per_request": round(sum(queries) / total, 2),
+        "outbound_calls_per_request": round((gateway.calls - calls_before) / total, 3),
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+    }
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=False
+        ).stdout.strip()
+
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(
+        git("status", "--porcelain", "--untracked-files=no")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="Scenario to run; repeat for several. Runs all by default.",
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="Per scenario.")
+    parser.add_argument("--rows", type=int, default=50_000, help="Rows seeded first.")
+    parser.add_argument("--poll-set", type=int, default=500, help="Ids polled.")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Gateway seconds.")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Defaults to benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    scenarios = args.scenario or list(SCENARIOS)
+    commit, dirty = git_revision()
+
+    gateway = FakePaystack(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate
+    ).start()
+    results = {}
+    try:
+        with benchmark_database(), override_settings(
+            ALLOWED_HOSTS=["testserver"],
+            SECURE_SSL_REDIRECT=False,
+            PAYSTACK_BASE_URL=gateway.base_url,
+        ):
+            seed_payments(args.rows)
+            pks = list(Payment.objects.order_by("pk").values_list("pk", flat=True))
+            context = {
+                "ids": random.sample(pks, min(args.poll_set, len(pks))),
+                "page_size": args.page_size,
+            }
+            connection.close()
+
+            for name in scenarios:
+                results[name] = run_scenario(
+                    name, gateway, args.concurrency, args.requests, context
+                )
+                print(f"{name:>8}: {json.dumps(results[name])}")
+    finally:
+        gateway.stop()
+
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "recorded_at": timezone.now().isoformat(),
+        "config": {
+            **{key: value for key, value in vars(args).items() if key != "output"},
+            "scenario": scenarios,
+            "debug": settings.DEBUG,
+        },
+        "scenarios": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare Postgres query plans for the payments list filters with and without
+the indexes added in payments.0007, and check that lookups by id only search
+the partitions whose id ranges can hold it.
+
+Runs against a throwaway test database seeded with synthetic rows:
+
+    python -m benchmarks.query_plans --rows 1000000
+"""
+
+import argparse
+from datetime import timedelta
+
+from benchmarks.common import benchmark_database, seed_payments
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.payments import partitions
+from apps.payments.models import Payment, PaymentStatus
+
+NEW_INDEXES = [
+    "payment_pending_created_idx",
+    "payment_email_paid_at_idx",
+    "payment_created_brin",
+]
+
+
+def queries():
+    now = timezone.now()
+    return {
+        "oldest pending": Payment.objects.filter(status=PaymentStatus.PENDING).order_by(
+            "created_at"
+        )[:500],
+        "by email": Payment.objects.filter(email="customer42@example.com").order_by(
+            "-paid_at"
+        )[:20],
+        "by email and paid_at range": Payment.objects.filter(
+            email="customer42@example.com",
+            paid_at__gte=now - timedelta(days=7),
+            paid_at__lt=now,
+        ),
+        "created_at range": Payment.objects.filter(
+            created_at__gte=now - timedelta(hours=1), created_at__lt=now
+        ),
+    }
+
+
+def partitions_searched(queryset):
+    plan = queryset.explain()
+    return [p.name for p in partitions.partitions() if p.name in plan]
+
+
+def check_pruning():
+    # Date one payment into the newest partition, so there is more than one
+    # partition with rows to tell apart.
+    newest = partitions.partitions()[-1]
+    payment = Payment.objects.create(
+        name="Customer", email="customer@example.com", amount_minor=100
+    )
+    Payment.objects.filter(pk=payment.pk).update(created_at=newest.start)
+    partitions.clear_id_ranges()
+    oldest = Payment.objects.order_by("id").values_list("id", flat=True).first()
+    total = len(partitions.partitions())
+
+    print("\n===== partitions searched =====")
+    for label, pk in [("oldest payment", oldest), ("newest payment", payment.pk)]:
+        for name, queryset in {
+            "filter(pk=)": Payment.objects.filter(pk=pk),
+            "with_id()": Payment.objects.with_id(pk),
+        }.items():
+            searched = partitions_searched(queryset)
+            print(f"{label:<16}{name:<14}{len(searched):>3} of {total}")
+
+
+def explain_all(title):
+    print(f"\n===== {title} =====")
+    for name, queryset in queries().items():
+        print(f"\n--- {name}")
+        print(queryset.explain(analyze=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        seed_payments(args.rows)
+
+        # DDL is transactional in Postgres: drop the new indexes, look at the
+        # plans, then roll back to get them back.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for index in NEW_INDEXES:
+                    cursor.execute(f"DROP INDEX {index}")
+            explain_all("before (no payments.0007 indexes)")
+            transaction.set_rollback(True)
+
+        explain_all("after")
+        check_pruning()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Insert payments with the old random refs (`secrets.token_urlsafe(50)`) and
+with ULID refs from apps.payments.refs, each into a fresh test database, and
+report insert throughput and the size of the ref index:
+
+    python -m benchmarks.refs --rows 1000000
+"""
+
+import argparse
+import secrets
+import time
+
+from benchmarks.common import benchmark_database
+
+from django.db import connection
+
+from apps.payments.models import Payment, PaymentStatus
+from apps.payments.refs import new_ref
+
+REF_GENERATORS = {
+    "token_urlsafe(50)": lambda: secrets.token_urlsafe(50),
+    "ulid": new_ref,
+}
+
+
+def insert_payments(rows, batch_size, generate_ref):
+    for start in range(0, rows, batch_size):
+        Payment.objects.bulk_create(
+            [
+                Payment(
+                    name=f"Customer {i}",
+                    email=f"customer{i % 50000}@example.com",
+                    amount_minor=10000 + i,
+                    ref=generate_ref(),
+                    status=PaymentStatus.PENDING,
+                )
+                for i in range(start, min(start + batch_size, rows))
+            ]
+        )
+
+
+def ref_index_size():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT sum(pg_relation_size(relid))
+            FROM pg_partition_tree('payment_ref_created_uniq')
+            """
+        )
+        return int(cursor.fetchone()[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"rows: {args.rows}")
+    print(f"{'refs':<20}{'rows/s':>12}{'ref index MB':>16}")
+    for name, generate_ref in REF_GENERATORS.items():
+        with benchmark_database():
+            started = time.perf_counter()
+            insert_payments(args.rows, args.batch_size, generate_ref)
+            elapsed = time.perf_counter() - started
+            size_mb = ref_index_size() / 1024 / 1024
+        print(f"{name:<20}{args.rows / elapsed:>12.0f}{size_mb:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Serialize and render payments through PaymentSerializer + JSONRenderer and
+through the `.values()` fast path + FastJSONRenderer, check both give the
+same bytes, and report the time each takes:
+
+    python -m benchmarks.serialization --rows 10000
+"""
+
+import argparse
+import random
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+
+import benchmarks.common  # noqa: F401  (configures Django)
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from apps.payments.models import Payment, PaymentStatus
+from apps.payments.renderers import FastJSONRenderer
+from apps.payments.serializers import PaymentSerializer, payment_rows
+
+
+def make_payments(rows):
+    now = timezone.now()
+    payments = []
+    for i in range(1, rows + 1):
+        settled = i % 3 != 0
+        payments.append(
+            Payment(
+                id=i,
+                name=f"Customer {i}",
+                email=f"customer{i}@example.com",
+                amount=Decimal(random.randint(100, 1_000_000)) / 100,
+                ref=f"ref{i}",
+                status=PaymentStatus.SUCCESS if settled else PaymentStatus.PENDING,
+                authorization_url=f"https://checkout.paystack.com/{i}",
+                paid_at=now - timedelta(seconds=i) if settled else None,
+                created_at=now - timedelta(seconds=i),
+                updated_at=now - timedelta(seconds=i),
+            )
+        )
+    return payments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    payments = make_payments(args.rows)
+    # What `.values(*payment_rows.fields)` returns for the same payments.
+    rows = [
+        {field: getattr(payment, field) for field in payment_rows.fields}
+        for payment in payments
+    ]
+
+    def drf_path():
+        return JSONRenderer().render(PaymentSerializer(payments, many=True).data)
+
+    def fast_path():
+        return FastJSONRenderer().render(payment_rows.rows(rows))
+
+    if drf_path() != fast_path():
+        raise SystemExit("The two paths rendered different bytes")
+
+    drf = min(timeit.repeat(drf_path, number=1, repeat=args.repeat))
+    fast = min(timeit.repeat(fast_path, number=1, repeat=args.repeat))
+
+    print(f"rows:                 {args.rows}")
+    print(f"serializer + json:    {drf * 1000:.1f} ms")
+    print(f"values rows + orjson: {fast * 1000:.1f} ms")
+    print(f"speedup:              {drf / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from django.urls import path, include
 
 urlpatterns = [
+    path("auth/", include("apps.users.urls")),
     path("", include("apps.payments.urls"))
-]
\ No newline at end of file
+]
@@ -0,0 +1,52 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import routers
+
+PRIMARY_COOKIE = "db_primary"
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Track writes made while handling each request for ReplicaRouter. After
+    a write, a short-lived cookie keeps the client's next requests on the
+    primary so they read what they just wrote.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state, token = routers.start_request(PRIMARY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return self.pin_primary(state, response)
+
+    async def __acall__(self, request):
+        state, token = routers.start_request(PRIMARY_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return self.pin_primary(state, response)
+
+    def pin_primary(self, state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Strict",
+            )
+        return response
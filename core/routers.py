@@ -0,0 +1,157 @@
+"""
+Routing of read-heavy traffic to the replicas in DATABASE_REPLICAS.
+
+Reads only go to a replica inside `replica_reads()`, and only while no
+write has happened in the same request (or, through
+ReplicaRoutingMiddleware, recently by the same client). Replicas that fail
+their health check or lag more than REPLICA_MAX_LAG seconds are skipped, so
+the primary is always the fallback.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError, connections
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "default"
+
+# Zero when the replica has replayed everything it received, otherwise the
+# age of the last transaction it replayed.
+LAG_SQL = """
+    SELECT CASE
+        WHEN pg_is_in_recovery()
+            AND pg_last_wal_receive_lsn() IS DISTINCT FROM pg_last_wal_replay_lsn()
+        THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        ELSE 0
+    END
+"""
+
+
+class RoutingState:
+    __slots__ = ("use_replica", "pinned", "wrote")
+
+    def __init__(self, pinned=False):
+        self.use_replica = False
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar("db_routing_state", default=None)
+
+
+def start_request(pinned=False):
+    state = RoutingState(pinned)
+    return state, _state.set(state)
+
+
+def finish_request(token):
+    _state.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """Let reads in the block go to a replica when one is usable."""
+    state = _state.get()
+    token = None
+    if state is None:
+        state, token = start_request()
+
+    previous, state.use_replica = state.use_replica, True
+    try:
+        yield
+    finally:
+        state.use_replica = previous
+        if token is not None:
+            finish_request(token)
+
+
+class ReplicaMonitor:
+    """Caches each replica's health and lag for REPLICA_CHECK_INTERVAL seconds."""
+
+    def __init__(self):
+        self.status = {}
+        self._lock = threading.Lock()
+
+    def measure_lag(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning(
+                "Read replica %s failed its health check", alias, exc_info=True
+            )
+            connections[alias].close()
+            return None
+
+    def lag(self, alias):
+        """Seconds `alias` is behind the primary, or None if it is down."""
+        now = time.monotonic()
+        checked_at, lag = self.status.get(alias, (None, None))
+        fresh = checked_at is not None and (
+            now - checked_at < settings.REPLICA_CHECK_INTERVAL
+        )
+        if fresh:
+            return lag
+
+        # One thread re-checks while the others keep the previous result.
+        if not self._lock.acquire(blocking=checked_at is None):
+            return lag
+        try:
+            lag = self.measure_lag(alias)
+            self.status[alias] = (time.monotonic(), lag)
+        finally:
+            self._lock.release()
+        return lag
+
+    def usable(self):
+        usable = []
+        for alias in settings.DATABASE_REPLICAS:
+            lag = self.lag(alias)
+            if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+                usable.append(alias)
+        return usable
+
+
+monitor = ReplicaMonitor()
+
+
+def read_database():
+    """The alias reads should use right now."""
+    state = _state.get()
+    if (
+        state is None
+        or not state.use_replica
+        or state.pinned
+        or state.wrote
+        or not settings.DATABASE_REPLICAS
+    ):
+        return PRIMARY
+
+    replicas = monitor.usable()
+    return random.choice(replicas) if replicas else PRIMARY
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        return db not in settings.DATABASE_REPLICAS
@@ -57,8 +57,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "apps.payments.middleware.MetricsMiddleware",
+    "core.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "apps.users.middleware.AdminSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -103,6 +105,43 @@ else:
         }
     }
 
+# Keep connections open between requests and check them before reuse
+DATABASES["default"]["CONN_MAX_AGE"] = env.int("DB_CONN_MAX_AGE", default=60)  # seconds
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Read replicas, e.g. REPLICA_DATABASE_URLS=postgres://replica1/payments,postgres://replica2/payments
+# List, export and reporting reads go to them through core.routers.ReplicaRouter
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list("REPLICA_DATABASE_URLS", default=[]), start=1):
+    DATABASES[f"replica{number}"] = {
+        **dj_database_url.parse(
+            url,
+            conn_max_age=DATABASES["default"]["CONN_MAX_AGE"],
+            conn_health_checks=True,
+        ),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+# Replicas further behind than this are skipped in favour of the primary
+REPLICA_MAX_LAG = env.float("REPLICA_MAX_LAG", default=5)  # seconds
+REPLICA_CHECK_INTERVAL = env.float("REPLICA_CHECK_INTERVAL", default=10)  # seconds
+# Clients that wrote keep reading from the primary for this long
+REPLICA_STICKY_SECONDS = env.int("REPLICA_STICKY_SECONDS", default=10)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# e.g. CACHE_URL=rediscache://127.0.0.1:6379/1 to share entries between workers
+
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+# Settled payment representations: an in-process LRU in front of this cache
+PAYMENTS_CACHE_ALIAS = env("PAYMENTS_CACHE_ALIAS", default="default")
+PAYMENTS_CACHE_LOCAL_SIZE = env.int("PAYMENTS_CACHE_LOCAL_SIZE", default=10000)
+PAYMENTS_CACHE_TIMEOUT = env.int("PAYMENTS_CACHE_TIMEOUT", default=86400)  # seconds
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -147,11 +186,24 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
 
+# Lifetime of tokens issued by /api/v1/auth/token/
+ACCESS_TOKEN_LIFETIME = env.int("ACCESS_TOKEN_LIFETIME", default=900)  # seconds
+# Users and API key lookups are cached here to skip the database per request
+AUTH_CACHE_ALIAS = env("AUTH_CACHE_ALIAS", default="default")
+AUTH_CACHE_TIMEOUT = env.int("AUTH_CACHE_TIMEOUT", default=300)  # seconds
+
 
 REST_FRAMEWORK = {
-    # "DEFAULT_AUTHENTICATION_CLASSES": (
-    #     "rest_framework_simplejwt.authentication.JWTAuthentication",
-    # ),
+    # Sessions are only used by the admin; API clients send a token or key.
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "apps.users.authentication.AccessTokenAuthentication",
+        "apps.users.authentication.APIKeyAuthentication",
+    ],
+    # Same output as rest_framework.renderers.JSONRenderer, encoded with orjson
+    "DEFAULT_RENDERER_CLASSES": [
+        "apps.payments.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_VERSIONING_CLASS": "rest_framework.versioning.URLPathVersioning",
     "DEFAULT_VERSION": "v1",
     "ALLOWED_VERSIONS": ["v1"],
@@ -168,6 +220,55 @@ REST_FRAMEWORK = {
     # ],
 }
 
+# Largest ?page_size= the payments list will serve
+PAYMENTS_MAX_PAGE_SIZE = env.int("PAYMENTS_MAX_PAGE_SIZE", default=100)
+
+# Idempotency-Key handling on payment creation
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=86400)  # seconds
+# How long a duplicate waits for the original request before getting a 409
+IDEMPOTENCY_WAIT = env.float("IDEMPOTENCY_WAIT", default=5)  # seconds
+# In-flight keys older than this are treated as abandoned
+IDEMPOTENCY_LOCK_TIMEOUT = env.int("IDEMPOTENCY_LOCK_TIMEOUT", default=60)  # seconds
+# Reverse proxies in front of the app that append to X-Forwarded-For; anonymous
+# idempotency keys are scoped to the client address the outermost one saw
+TRUSTED_PROXIES = env.int("TRUSTED_PROXIES", default=0)
+
+# Asynchronous payment creation
+# Queue every create for run_payment_workers instead of only those sent
+# with "Prefer: respond-async"
+PAYMENTS_ASYNC_CREATE = env.bool("PAYMENTS_ASYNC_CREATE", default=False)
+PAYMENTS_JOB_MAX_ATTEMPTS = env.int("PAYMENTS_JOB_MAX_ATTEMPTS", default=5)
+PAYMENTS_JOB_BACKOFF = env.float("PAYMENTS_JOB_BACKOFF", default=2)  # seconds, doubled per attempt
+# Claimed jobs are retried by another worker if not finished within this
+PAYMENTS_JOB_LEASE = env.int("PAYMENTS_JOB_LEASE", default=60)  # seconds
+
+# Bulk payment creation
+PAYMENTS_BULK_MAX_ITEMS = env.int("PAYMENTS_BULK_MAX_ITEMS", default=1000)
+# Concurrent Paystack calls per bulk request; keep within PAYSTACK_POOL_SIZE.
+# Batches too big to finish within IDEMPOTENCY_LOCK_TIMEOUT are queued.
+PAYMENTS_BULK_CONCURRENCY = env.int("PAYMENTS_BULK_CONCURRENCY", default=10)
+
+# Bulk status lookup
+PAYMENTS_LOOKUP_MAX_ITEMS = env.int("PAYMENTS_LOOKUP_MAX_ITEMS", default=100)
+# Concurrent Paystack verify calls per lookup; keep within PAYSTACK_POOL_SIZE
+PAYMENTS_LOOKUP_CONCURRENCY = env.int("PAYMENTS_LOOKUP_CONCURRENCY", default=10)
+
+# Payment partitions
+# Monthly partitions created ahead of time by create_payment_partitions
+PAYMENTS_PARTITIONS_AHEAD = env.int("PAYMENTS_PARTITIONS_AHEAD", default=3)  # months
+# How long each worker reuses the id range of every partition, which bounds
+# lookups by id to the partitions that can hold them
+PAYMENTS_ID_RANGES_TTL = env.int("PAYMENTS_ID_RANGES_TTL", default=60)  # seconds
+# archive_payment_partitions moves partitions older than this to files
+PAYMENTS_RETENTION_MONTHS = env.int("PAYMENTS_RETENTION_MONTHS", default=12)
+PAYMENTS_ARCHIVE_DIR = env("PAYMENTS_ARCHIVE_DIR", default=str(BASE_DIR / "archive"))
+
+# Payment status streams (server-sent events, ASGI only)
+# A stream with no status change closes after this; clients reconnect
+PAYMENTS_STREAM_TIMEOUT = env.int("PAYMENTS_STREAM_TIMEOUT", default=300)  # seconds
+# Comment lines sent while waiting, so proxies keep the connection open
+PAYMENTS_STREAM_HEARTBEAT = env.int("PAYMENTS_STREAM_HEARTBEAT", default=15)  # seconds
+
 # Debug Toolbar
 # https://django-debug-toolbar.readthedocs.io/en/latest/configuration.html
 if DEBUG:
@@ -194,6 +295,29 @@ if DEBUG:
 # https://paystack.com/docs/
 PAYSTACK_SECRET_KEY = env("PAYSTACK_SECRET_KEY")
 PAYSTACK_PUBLIC_KEY = env("PAYSTACK_PUBLIC_KEY")
+# Pending payments are settled by the webhook; retrieve only falls back to
+# verifying with Paystack once a payment hasn't been checked for this long.
+PAYSTACK_VERIFY_STALE_AFTER = env.int("PAYSTACK_VERIFY_STALE_AFTER", default=60)  # seconds
+# A payment Paystack reports as still pending (or fails to verify) isn't
+# verified again by this process for this long.
+PAYSTACK_VERIFY_NEGATIVE_TTL = env.int("PAYSTACK_VERIFY_NEGATIVE_TTL", default=5)  # seconds
+# Gateway client, shared by every request in the process
+PAYSTACK_BASE_URL = env("PAYSTACK_BASE_URL", default="https://api.paystack.co/")
+PAYSTACK_POOL_SIZE = env.int("PAYSTACK_POOL_SIZE", default=10)
+# Connections shared by every coroutine on an ASGI worker's event loop
+PAYSTACK_ASYNC_POOL_SIZE = env.int("PAYSTACK_ASYNC_POOL_SIZE", default=100)
+PAYSTACK_CONNECT_TIMEOUT = env.float("PAYSTACK_CONNECT_TIMEOUT", default=3.05)  # seconds
+PAYSTACK_READ_TIMEOUT = env.float("PAYSTACK_READ_TIMEOUT", default=10)  # seconds
+PAYSTACK_MAX_RETRIES = env.int("PAYSTACK_MAX_RETRIES", default=2)
+PAYSTACK_BACKOFF_FACTOR = env.float("PAYSTACK_BACKOFF_FACTOR", default=0.3)
+PAYSTACK_BREAKER_THRESHOLD = env.int("PAYSTACK_BREAKER_THRESHOLD", default=5)
+PAYSTACK_BREAKER_RESET = env.int("PAYSTACK_BREAKER_RESET", default=30)  # seconds
+
+
+# Metrics
+# Scrapers must send "Authorization: Bearer <token>" to /metrics/, which
+# isn't served while this is empty
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
 
 
 # SECURITY
@@ -203,7 +327,9 @@ SECURE_SSL_REDIRECT = config("DJANGO_SECURE_SSL_REDIRECT", default=True, cast=bo
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 CSRF_COOKIE_HTTPONLY = config("DJANGO_CSRF_COOKIE_HTTPONLY", default=True, cast=bool)
-CSRF_USE_SESSIONS = config("DJANGO_CSRF_USE_SESSION", default=True, cast=bool)
+# Sessions are only saved for the admin (see AdminSessionMiddleware), so CSRF
+# tokens kept in them would be lost everywhere else; keep them in a cookie.
+CSRF_USE_SESSIONS = config("DJANGO_CSRF_USE_SESSION", default=False, cast=bool)
 CSRF_COOKIE_SAMESITE = "Strict"
 SESSION_COOKIE_HTTPONLY = config(
     "DJANGO_SESSION_COOKIE_HTTPONLY", default=True, cast=bool
@@ -258,12 +384,15 @@ CORS_ALLOWED_HEADERS = [
     "authorization",
     "content-type",
     "dnt",
+    "idempotency-key",
     "origin",
+    "prefer",
     "user-agent",
     "x-csrftoken",
     "x-requested-with",
 ]
 CORS_EXPOSE_HEADERS = [
     "Content-Range",
+    "Location",
 ]
 CORS_MAX_AGE = 86400  # 1 day
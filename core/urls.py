@@ -71,6 +71,7 @@ from rest_framework import permissions
 import debug_toolbar
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from apps.payments.views import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -89,6 +90,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("__debug__/", include(debug_toolbar.urls)),
     path("api/<str:version>/", include("core.api_urls")),
+    path("metrics/", metrics_view, name="metrics"),
     path(
         "swagger<format>/", schema_view.without_ui(cache_timeout=0), name="schema-json"
     ),